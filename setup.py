@@ -10,7 +10,6 @@ requirements = [
     'PyNaCl==1.5.0',
     'cryptography==41.0.2',
     'requests==2.31.0',
-    'pickleDB==0.9.2',
     'grpcio==1.59.0',
     'grpcio-tools==1.59.0',
     'tcabci-read-client'
@@ -27,5 +26,6 @@ setup(
     url="https://github.com/TransferChain/transferchain-python-sdk",
     packages=find_packages(),
     install_requires=requirements,
+    extras_require={'orjson': ['orjson>=3.6']},
     python_requires='>=3.8',
 )
@@ -1,4 +1,9 @@
+import io
+import os
+import tempfile
+import threading
 import unittest
+from unittest import mock
 from transferchain.crypt import bip39
 from transferchain.crypt import keys
 from transferchain.crypt import crypt
@@ -26,6 +31,8 @@ class TestAddressMethods(unittest.TestCase):
         pks = 'a0c4e141c6273b9cfd0ffd4ac64110b31189b7051066e92e45ba4534a8a12008baa5f1b8e00a76e8342bb31b105c396d423d9e897df7a290e55fca4ba8249c79' # noqa
         result = crypt.sign(pks, b'alles gut')
         self.assertEqual(expected, result.hex())
+        result = crypt.create_signer(pks)(b'alles gut')
+        self.assertEqual(expected, result.hex())
 
     def test_verify_sign_valid(self):
         mnemonics = bip39.create_mnomonics()
@@ -53,3 +60,158 @@ class TestAddressMethods(unittest.TestCase):
         enc_result = crypt.encrypt_byte(message, key)
         dec_result = crypt.decrypt_byte(enc_result, key)
         self.assertEqual(message, dec_result)
+
+    def test_encrypt_reader(self):
+        message = b'alles gut' * 1000
+        aes_key = crypt.generate_encrypt_key(32).encode('utf-8')
+        hmac_key = crypt.generate_encrypt_key(32).encode('utf-8')
+        reader = crypt.EncryptReader(io.BytesIO(message), aes_key, hmac_key)
+        chunks = []
+        while True:
+            chunk = reader.read(1000)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        encrypted_data = b''.join(chunks)
+        self.assertEqual(
+            crypt.encrypted_size(len(message)), len(encrypted_data))
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            in_path = os.path.join(tempdir, 'encrypted')
+            with open(in_path, 'wb') as f:
+                f.write(encrypted_data)
+            out_file = io.BytesIO()
+            with open(in_path, 'rb') as in_file:
+                crypt.decrypt_aesctr_with_hmac(
+                    in_file, out_file, aes_key, hmac_key)
+        self.assertEqual(message, out_file.getvalue())
+
+    def test_decrypt_writer(self):
+        message = b'alles gut' * 1000
+        aes_key = crypt.generate_encrypt_key(32).encode('utf-8')
+        hmac_key = crypt.generate_encrypt_key(32).encode('utf-8')
+        encrypted_data = crypt.EncryptReader(
+            io.BytesIO(message), aes_key, hmac_key).read()
+
+        for chunk_size in (1, 70, 4096):
+            out_file = io.BytesIO()
+            writer = crypt.DecryptWriter(out_file, aes_key, hmac_key)
+            for i in range(0, len(encrypted_data), chunk_size):
+                writer.write(encrypted_data[i:i + chunk_size])
+            writer.finalize()
+            self.assertEqual(message, out_file.getvalue())
+
+        writer = crypt.DecryptWriter(io.BytesIO(), aes_key, hmac_key)
+        writer.write(encrypted_data[:-1] + b'\x00')
+        with self.assertRaises(Exception):
+            writer.finalize()
+
+    def test_encrypt_range_reader(self):
+        message = os.urandom(10 * 1000 + 7)
+        aes_key = crypt.generate_encrypt_key(32).encode('utf-8')
+        hmac_key = crypt.generate_encrypt_key(32).encode('utf-8')
+
+        for iv in (os.urandom(crypt.IV_SIZE), b'\xff' * crypt.IV_SIZE):
+            out_file = io.BytesIO()
+            with mock.patch.object(crypt.os, 'urandom', return_value=iv):
+                crypt.encrypt_aesctr_with_hmac(
+                    io.BytesIO(message), out_file, aes_key, hmac_key)
+            expected = out_file.getvalue()
+
+            for workers in (1, 2):
+                digest = crypt.hmac_aesctr(
+                    io.BytesIO(message), aes_key, hmac_key, iv,
+                    buffer_size=1000, workers=workers)
+                self.assertEqual(expected[-crypt.HMAC_SIZE:], digest)
+
+            with tempfile.NamedTemporaryFile() as plain_file:
+                plain_file.write(message)
+                plain_file.flush()
+                for offset in (0, 5, 17, 18, 33, 5000, len(expected) - 64,
+                               len(expected) - 3, len(expected)):
+                    with crypt.EncryptRangeReader(
+                            open(plain_file.name, 'rb'), aes_key, iv,
+                            digest, offset) as reader:
+                        data = b''
+                        for size in (1, 15, 700, 4096, -1):
+                            data += reader.read(size)
+                        self.assertEqual(b'', reader.read(10))
+                    self.assertEqual(expected[offset:], data)
+
+                # the digest function is only called at the digest
+                get_digest = mock.Mock(return_value=digest)
+                with crypt.EncryptRangeReader(
+                        open(plain_file.name, 'rb'), aes_key, iv,
+                        get_digest, 100) as reader:
+                    data = reader.read(1000)
+                    get_digest.assert_not_called()
+                    data += reader.read()
+                self.assertEqual(expected[100:], data)
+                get_digest.assert_called_once_with()
+
+            stop = threading.Event()
+            stop.set()
+            with self.assertRaises(Exception):
+                crypt.hmac_aesctr(io.BytesIO(message), aes_key, hmac_key, iv,
+                                  stop=stop)
+
+    def test_aesctr_buffer_size(self):
+        message = os.urandom(100 * 1000 + 7)
+        aes_key = crypt.generate_encrypt_key(32).encode('utf-8')
+        hmac_key = crypt.generate_encrypt_key(32).encode('utf-8')
+        iv = os.urandom(crypt.IV_SIZE)
+
+        outputs = []
+        for buffer_size in (1, 1000, crypt.BUFFER_SIZE):
+            out_file = io.BytesIO()
+            with mock.patch.object(crypt.os, 'urandom', return_value=iv):
+                crypt.encrypt_aesctr_with_hmac(
+                    io.BytesIO(message), out_file, aes_key, hmac_key,
+                    buffer_size=buffer_size)
+            outputs.append(out_file.getvalue())
+        with mock.patch.object(crypt.os, 'urandom', return_value=iv):
+            outputs.append(crypt.EncryptReader(
+                io.BytesIO(message), aes_key, hmac_key).read())
+        self.assertEqual(1, len(set(outputs)))
+
+        for buffer_size in (1, 63, 64, 1000, crypt.BUFFER_SIZE):
+            out_file = io.BytesIO()
+            crypt.decrypt_aesctr_with_hmac(
+                io.BytesIO(outputs[0]), out_file, aes_key, hmac_key,
+                buffer_size=buffer_size)
+            self.assertEqual(message, out_file.getvalue())
+
+        with self.assertRaises(Exception):
+            crypt.decrypt_aesctr_with_hmac(
+                io.BytesIO(outputs[0][:-1]), io.BytesIO(), aes_key,
+                hmac_key)
+
+    def test_aesctr_workers(self):
+        message = os.urandom(100 * 1000 + 7)
+        aes_key = crypt.generate_encrypt_key(32).encode('utf-8')
+        hmac_key = crypt.generate_encrypt_key(32).encode('utf-8')
+
+        # the last iv makes the counter wrap around
+        for iv in (os.urandom(crypt.IV_SIZE), b'\xff' * crypt.IV_SIZE):
+            outputs = []
+            for workers in (1, 2, 4):
+                out_file = io.BytesIO()
+                with mock.patch.object(crypt.os, 'urandom',
+                                       return_value=iv):
+                    crypt.encrypt_aesctr_with_hmac(
+                        io.BytesIO(message), out_file, aes_key, hmac_key,
+                        buffer_size=1000, workers=workers)
+                outputs.append(out_file.getvalue())
+            self.assertEqual(1, len(set(outputs)))
+
+            for workers in (2, 4):
+                out_file = io.BytesIO()
+                crypt.decrypt_aesctr_with_hmac(
+                    io.BytesIO(outputs[0]), out_file, aes_key, hmac_key,
+                    buffer_size=1000, workers=workers)
+                self.assertEqual(message, out_file.getvalue())
+
+        with self.assertRaises(Exception):
+            crypt.decrypt_aesctr_with_hmac(
+                io.BytesIO(outputs[0][:-1] + b'\x00'), io.BytesIO(),
+                aes_key, hmac_key, workers=2)
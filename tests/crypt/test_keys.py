@@ -31,3 +31,37 @@ class TestKeysMethods(unittest.TestCase):
         result = keys.generate_keys(seed)
         self.assertEqual(result['Seed'], seed)
         self.assertEqual(result['Seed58'], seed58)
+
+    def tearDown(self):
+        keys.set_key_cache_size(0)
+
+    def test_key_cache_disabled(self):
+        keys.clear_key_cache()
+        self.assertEqual(0, keys.KEY_CACHE_SIZE)
+        keys.create_keys_with_mnemonic('test mnemonics', 'p1')
+        self.assertEqual(0, len(keys.KEY_CACHE))
+
+    def test_key_cache(self):
+        keys.clear_key_cache()
+        keys.set_key_cache_size(128)
+        first = keys.create_keys_with_mnemonic('test mnemonics', 'p1')
+        first['Seed'] = 'changed'
+        second = keys.create_keys_with_mnemonic('test mnemonics', 'p1')
+        self.assertNotEqual('changed', second['Seed'])
+        self.assertEqual(1, len(keys.KEY_CACHE))
+        self.assertNotIn('test mnemonics', str(list(keys.KEY_CACHE)))
+
+        keys.set_key_cache_size(2)
+        keys.create_keys_with_mnemonic('test mnemonics', 'p2')
+        keys.create_keys_with_mnemonic('test mnemonics', 'p3')
+        self.assertEqual(2, len(keys.KEY_CACHE))
+        self.assertNotIn(
+            keys.key_cache_id('test mnemonics', 'p1'), keys.KEY_CACHE)
+
+        keys.set_key_cache_size(0)
+        self.assertEqual(0, len(keys.KEY_CACHE))
+        keys.create_keys_with_mnemonic('test mnemonics', 'p1')
+        self.assertEqual(0, len(keys.KEY_CACHE))
+        keys.set_key_cache_size(128)
+        self.assertEqual(
+            second, keys.create_keys_with_mnemonic('test mnemonics', 'p1'))
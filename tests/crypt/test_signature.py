@@ -0,0 +1,40 @@
+import os
+import unittest
+from transferchain.crypt import signature
+
+
+class TestSignatureMethods(unittest.TestCase):
+
+    def test_backends(self):
+        backends = signature.available_backends()
+        self.assertEqual(
+            ['pynacl', 'cryptography', 'ed25519'],
+            [backend.name for backend in backends])
+
+        for _ in range(10):
+            seed = os.urandom(32)
+            data = os.urandom(100)
+            public_keys = set()
+            signatures = set()
+            for backend in backends:
+                public_key = backend.public_key(seed)
+                sign = backend.sign(seed + public_key, data)
+                self.assertEqual(
+                    sign, backend.signer(seed + public_key)(data))
+                public_keys.add(public_key)
+                signatures.add(sign)
+                for other in backends:
+                    self.assertTrue(other.verify(public_key, data, sign))
+                    self.assertFalse(
+                        other.verify(public_key, data + b'x', sign))
+            self.assertEqual(1, len(public_keys))
+            self.assertEqual(1, len(signatures))
+
+    def test_set_backend(self):
+        backend = signature.get_backend()
+        self.assertEqual('pynacl', backend.name)
+        signature.set_backend('ed25519')
+        self.assertEqual('ed25519', signature.get_backend().name)
+        signature.set_backend(backend.name)
+        with self.assertRaises(Exception):
+            signature.set_backend('unknown')
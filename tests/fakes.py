@@ -0,0 +1,194 @@
+'''
+In-memory stand-ins for the grpc FileOperation service, used by the
+offline upload and download tests.
+'''
+import operator
+import threading
+from collections import Counter, namedtuple
+from transferchain.crypt import keys
+from transferchain.datastructures import Address, Result, User
+from transferchain.datastructures import Config
+from transferchain.protobuf import service_pb2 as pb
+
+
+class FakeFileOperationStub(object):
+    '''
+    Keeps the uploaded chunks of every slot, UploadInitV2 splits a file
+    into at most `slot_count` slots of `slot_size` bytes.
+    '''
+
+    def __init__(self, slot_size=1000, slot_count=3, fail_slot=None):
+        self.slot_size = slot_size
+        self.slot_count = slot_count
+        # index of the slot whose upload returns an error status
+        self.fail_slot = fail_slot
+        self.slots = {}
+        self.deleted = []
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def TransferInitV2(self, request, metadata=None):
+        self.calls['TransferInitV2'] += 1
+        return pb.TransferInitResponse(
+            SessionID='session',
+            BaseUUIDs={path: 'base-' + path for path in request.paths})
+
+    def StorageInitV2(self, request, metadata=None):
+        self.calls['StorageInitV2'] += 1
+        return pb.StorageInitResponse(
+            SessionID='session',
+            BaseUUIDs={path: 'base-' + path for path in request.Paths})
+
+    def UploadInitV2(self, request, metadata=None):
+        with self.lock:
+            self.calls['UploadInitV2'] += 1
+            init_count = self.calls['UploadInitV2']
+        count = max(1, min(
+            self.slot_count, -(-request.fileSize // self.slot_size)))
+        size = -(-request.fileSize // count)
+        slots = [pb.UploadSlot(
+            UUID='slot-{}-{}'.format(init_count, index), Size=size,
+            StorageCode='code', Address='address', BaseUUID='base')
+            for index in range(count)]
+        return pb.UploadInitResponse(
+            Slots=slots, BaseUUID='base', Address='address')
+
+    def UploadBasicV4(self, payloads, metadata=None):
+        with self.lock:
+            self.calls['UploadBasicV4'] += 1
+        slot_uuid = None
+        for payload in payloads:
+            slot_uuid = payload.Slot.UUID
+            with self.lock:
+                self.slots.setdefault(slot_uuid, bytearray()).extend(
+                    payload.Chunk)
+        if self.fail_slot is not None and \
+                slot_uuid is not None and \
+                slot_uuid.endswith('-{}'.format(self.fail_slot)):
+            return pb.UploadResponse(statusCode=0)
+        return pb.UploadResponse(statusCode=1)
+
+    def TransferFinishV2(self, request, metadata=None):
+        self.calls['TransferFinishV2'] += 1
+        return pb.Empty()
+
+    def StorageFinishV2(self, request, metadata=None):
+        self.calls['StorageFinishV2'] += 1
+        return pb.Empty()
+
+    def DownloadV4(self, request, metadata=None):
+        with self.lock:
+            self.calls['DownloadV4'] += 1
+        data = bytes(self.slots[request.Slot.UUID])
+        return pb.DownloadV4Response(
+            chunk=data[request.Seek:request.Seek + request.ChunkSize],
+            ContentLength=len(data))
+
+    def DeleteV2(self, request, metadata=None):
+        with self.lock:
+            self.deleted.append(request.uuid)
+        return pb.Empty()
+
+    def uploaded(self, slots):
+        '''Return the bytes uploaded to the slots, in order'''
+        return [bytes(self.slots.get(slot['UUID'], b'')) for slot in slots]
+
+
+class FakeAioStub(object):
+    '''
+    grpc.aio version of a FakeFileOperationStub, every rpc is a
+    coroutine calling the same method of `stub`.
+    '''
+
+    def __init__(self, stub):
+        self.stub = stub
+
+    def __getattr__(self, name):
+        method = getattr(self.stub, name)
+
+        async def call(request, metadata=None):
+            return method(request, metadata)
+        return call
+
+    async def UploadBasicV4(self, payloads, metadata=None):
+        payloads = [payload async for payload in payloads]
+        return self.stub.UploadBasicV4(payloads, metadata)
+
+
+# tcabci_read_client.client.HttpResultTuple
+ReadNodeResult = namedtuple('ReadNodeResult', 'success error_message result')
+
+
+class FakeReadNode(object):
+    '''
+    In-memory tcabci_read_client.HttpClient. Broadcast transactions are
+    kept in blocks of `block_size`, tx_search filters them by recipient,
+    type and height in ascending order.
+    '''
+
+    HEIGHT_OPERATORS = {
+        '>=': operator.ge, '>': operator.gt, '=': operator.eq,
+        '<=': operator.le, '<': operator.lt}
+
+    def __init__(self, block_size=1, with_recipient=True):
+        self.block_size = block_size
+        # False leaves recipient_addr out of the tx_search results
+        self.with_recipient = with_recipient
+        self.txs = []
+        self.searches = []
+        self.lock = threading.Lock()
+
+    def broadcast(self, **transaction):
+        with self.lock:
+            self.txs.append({
+                'height': len(self.txs) // self.block_size + 1,
+                'type': transaction['tx_type'],
+                'sender_addr': transaction['sender_address'],
+                'recipient_addr': transaction['recipient_address'],
+                'data': {'Bytes': transaction['data']}})
+        return ReadNodeResult(success=True, error_message=None, result={})
+
+    def tx_search(self, recipient_addrs, height, height_operator, hashes,
+                  typ, limit, offset, order_by):
+        with self.lock:
+            self.searches.append({
+                'typ': typ, 'recipient_addrs': list(recipient_addrs),
+                'height': height, 'offset': offset, 'limit': limit})
+            compare = self.HEIGHT_OPERATORS[height_operator]
+            txs = [tx for tx in self.txs
+                   if tx['type'] == typ and
+                   tx['recipient_addr'] in recipient_addrs and
+                   compare(tx['height'], height)]
+        page = txs[offset:offset + limit]
+        if not self.with_recipient:
+            page = [{key: value for key, value in tx.items()
+                     if key != 'recipient_addr'} for tx in page]
+        return ReadNodeResult(
+            success=True, error_message=None,
+            result={'txs': page, 'total_count': len(txs)})
+
+
+def create_config(db_path=None):
+    '''Return a Config that is never sent to a server'''
+    return Config(
+        api_token='token', api_secret='secret', user_id=1,
+        wallet_uuid='wallet', wallet_id=1, mnemonics='mnemonics',
+        db_path=db_path)
+
+
+def create_user():
+    '''Return a master user with two sub addresses, keys are fixed'''
+    addresses = []
+    for index in range(3):
+        key = keys.generate_keys('{:02x}'.format(index + 1) * 32)
+        addresses.append(Address(
+            Key=key, Mnemonics='mnemonics', Master=index == 0, UserID=1,
+            MasterAddress=addresses[0].Key['Address'] if addresses
+            else None))
+    return User(id='user', parent_user_id=1, master_address=addresses[0],
+                addresses=addresses, master=True)
+
+
+def broadcast_ok(transaction):
+    '''blockchain.broadcast replacement that publishes everything'''
+    return Result(success=True)
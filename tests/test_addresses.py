@@ -1,8 +1,10 @@
 import unittest
+from unittest import mock
 from transferchain.crypt import bip39
+from transferchain.crypt import keys
 from transferchain.addresses import (
-    get_user_password, generate_user_addresses,
-    generate_sub_user_addresses)
+    create_key_executor, derive_keys, get_user_password,
+    generate_user_addresses, generate_sub_user_addresses)
 
 
 class TestAddressesMethods(unittest.TestCase):
@@ -19,6 +21,28 @@ class TestAddressesMethods(unittest.TestCase):
         result = get_user_password(1, 1)
         self.assertNotEqual('user-1-2', result)
 
+    def test_derive_keys_workers(self):
+        mnemonics = bip39.create_mnomonics()
+        passwords = [get_user_password(1, i) for i in range(7)]
+        expected = [keys.create_keys_with_mnemonic(mnemonics, password)
+                    for password in passwords]
+        keys.clear_key_cache()
+        for workers in (1, 2):
+            self.assertEqual(expected, derive_keys(
+                mnemonics, passwords, workers=workers, min_parallel=2))
+        self.assertEqual([], derive_keys(mnemonics, [], workers=2))
+
+        # a kept pool is reused, small batches stay in this process
+        with create_key_executor(2) as executor:
+            for _ in range(2):
+                self.assertEqual(expected, derive_keys(
+                    mnemonics, passwords, workers=2, executor=executor,
+                    min_parallel=2))
+        executor = mock.Mock()
+        self.assertEqual(expected, derive_keys(
+            mnemonics, passwords, workers=2, executor=executor))
+        executor.map.assert_not_called()
+
     def test_generate_sub_user_addresses_valid(self):
         mnemonics = bip39.create_mnomonics()
         result = generate_user_addresses(1, mnemonics)
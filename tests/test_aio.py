@@ -0,0 +1,184 @@
+import io
+import os
+import shutil
+import asyncio
+import tempfile
+import threading
+import unittest
+import grpc
+from unittest import mock
+from transferchain import aio
+from transferchain import blockchain
+from transferchain import storage as storage_module
+from transferchain import transfer as transfer_module
+from transferchain.client import TransferChain
+from transferchain.crypt import crypt
+from transferchain.crypt import keys
+from transferchain.datastructures import Result
+from tests import fakes
+
+
+class TestAioMethods(unittest.TestCase):
+
+    def test_iterate_in_executor(self):
+        threads = set()
+
+        def items():
+            for i in range(5):
+                threads.add(threading.current_thread())
+                yield i
+
+        async def collect():
+            return [i async for i in aio.iterate_in_executor(items())]
+
+        self.assertEqual([0, 1, 2, 3, 4], asyncio.run(collect()))
+        self.assertNotIn(threading.current_thread(), threads)
+
+
+class TestAsyncTransferChainMethods(unittest.TestCase):
+    '''Uploads against fakes.FakeAioStub, no server needed'''
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.dir_path, 'aio_test_data.dat')
+        self.message = os.urandom(5000)
+        with open(self.file_path, 'wb') as f:
+            f.write(self.message)
+        self.config = fakes.create_config(
+            db_path=os.path.join(self.dir_path, 'tc.db'))
+        self.user = fakes.create_user()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def run_client(self, stub, func, broadcast=fakes.broadcast_ok):
+        '''
+        Run func(tc) with an AsyncTransferChain on stub, return its
+        result and the slots given to every cancel_upload call.
+        '''
+        cancelled = []
+
+        async def main():
+            tc = aio.AsyncTransferChain(
+                client=TransferChain(self.config))
+            tc.stubs = [fakes.FakeAioStub(stub)]
+            cancel_upload = tc.cancel_upload
+
+            async def tracking_cancel_upload(service, slots, op_code):
+                cancelled.append(slots)
+                return await cancel_upload(service, slots, op_code)
+
+            tc.cancel_upload = tracking_cancel_upload
+            tc.get_user = mock.Mock(return_value=self.user)
+            try:
+                return await func(tc)
+            finally:
+                await tc.close()
+
+        with mock.patch.object(
+                transfer_module, 'get_client', return_value=stub), \
+                mock.patch.object(
+                    storage_module, 'get_client', return_value=stub), \
+                mock.patch.object(blockchain, 'broadcast', broadcast):
+            return asyncio.run(main()), cancelled
+
+    def transfer_files(self, tc):
+        return tc.transfer_files(
+            files=[self.file_path], sender_user_id=self.user.id,
+            recipient_addresses=[self.user.addresses[2].Key['Address']],
+            note='test transfer')
+
+    def test_create(self):
+        threads = []
+
+        def create_client(*args, **kwargs):
+            threads.append(threading.current_thread())
+            return TransferChain(*args, **kwargs)
+
+        async def main():
+            tc = await aio.AsyncTransferChain.create(
+                self.config, max_concurrency=2)
+            await tc.close()
+            return tc
+
+        with mock.patch.object(aio, 'TransferChain', create_client):
+            tc = asyncio.run(main())
+        self.assertIs(self.config, tc.config)
+        self.assertEqual(2, tc.max_concurrency)
+        self.assertEqual(1, len(threads))
+        self.assertNotEqual(threading.current_thread(), threads[0])
+
+    def test_transfer_files(self):
+        stub = fakes.FakeFileOperationStub(slot_size=2000, slot_count=3)
+        result, cancelled = self.run_client(stub, self.transfer_files)
+        self.assertEqual(True, result.success, result.error_message)
+        self.assertEqual(True, result.data[0].success,
+                         result.data[0].error_message)
+        self.assertEqual([], cancelled)
+        self.assertEqual(1, stub.calls['TransferFinishV2'])
+
+        transfer_sent = result.data[0].data
+        self.assertEqual(3, len(transfer_sent.slots))
+        out_file = io.BytesIO()
+        writer = crypt.DecryptWriter(
+            out_file, transfer_sent.keyAES.encode(),
+            transfer_sent.KeyHMAC.encode())
+        writer.write(b''.join(stub.uploaded(transfer_sent.slots)))
+        writer.finalize()
+        self.assertEqual(self.message, out_file.getvalue())
+
+    def test_transfer_files_upload_error(self):
+        stub = fakes.FakeFileOperationStub(slot_size=2000, fail_slot=1)
+        result, cancelled = self.run_client(stub, self.transfer_files)
+        self.assertEqual(True, result.success, result.error_message)
+        self.assertEqual(False, result.data[0].success)
+        self.assertEqual(1, len(cancelled))
+        for slot in cancelled[0]:
+            self.assertIsInstance(slot, dict)
+        self.assertEqual(
+            [slot['UUID'] for slot in cancelled[0]], stub.deleted)
+
+    def test_storage_upload_broadcast_error(self):
+        def broadcast_failed(transaction):
+            return Result(success=False)
+
+        stub = fakes.FakeFileOperationStub(slot_size=2000)
+        result, cancelled = self.run_client(
+            stub, lambda tc: tc.storage_upload(
+                user_id=self.user.id, files=[self.file_path]),
+            broadcast=broadcast_failed)
+        self.assertEqual(True, result.success, result.error_message)
+        self.assertEqual(False, result.data[0].success)
+        self.assertEqual(
+            'The storage is not published on the blockchain.',
+            result.data[0].error_message)
+        self.assertEqual(1, len(cancelled))
+        for slot in cancelled[0]:
+            self.assertIsInstance(slot, dict)
+        self.assertEqual(3, len(stub.deleted))
+        self.assertEqual(1, stub.calls['StorageFinishV2'])
+
+    def test_transfer_files_finish_error(self):
+        recipients = [keys.generate_keys('{:02x}'.format(i) * 32)['Address']
+                      for i in range(10, 12)]
+
+        def broadcast(transaction):
+            return Result(
+                success=transaction['recipient_address'] != recipients[1])
+
+        class FinishError(grpc.RpcError):
+            def details(self):
+                return 'finish failed'
+
+        stub = fakes.FakeFileOperationStub(slot_size=2000)
+        stub.TransferFinishV2 = mock.Mock(side_effect=FinishError())
+        result, cancelled = self.run_client(
+            stub, lambda tc: tc.transfer_files(
+                files=[self.file_path], sender_user_id=self.user.id,
+                recipient_addresses=recipients, note='test transfer'),
+            broadcast=broadcast)
+        self.assertEqual(False, result.success)
+        self.assertIn('finish failed', result.error_message)
+        # the partly published upload is cancelled
+        self.assertEqual(1, len(cancelled))
+        self.assertEqual(sorted(stub.slots), sorted(stub.deleted))
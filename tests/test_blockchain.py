@@ -1,9 +1,17 @@
+import sys
+import time
+import types
+import threading
 import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import requests
+from transferchain import blockchain
 from transferchain.crypt import bip39
 from transferchain.addresses import get_user_password
 from transferchain.blockchain import broadcast
 from transferchain.crypt import keys
-from transferchain.datastructures import Address
+from transferchain.datastructures import Address, Result
 from transferchain.transaction import create_transaction
 from transferchain import constants
 
@@ -25,3 +33,161 @@ class TestBlockchainMethods(unittest.TestCase):
             tx_master_address)
         result = broadcast(tx)
         self.assertEqual(True, result.success)
+
+
+class TestBroadcastManyMethods(unittest.TestCase):
+
+    def test_broadcast_many(self):
+        transactions = [{'tx_id': str(i)} for i in range(8)]
+
+        def broadcast(transaction):
+            index = int(transaction['tx_id'])
+            # later transactions finish first
+            time.sleep((8 - index) * 0.01)
+            if index == 3:
+                raise Exception('read node error')
+            return Result(success=index != 5, data=transaction['tx_id'])
+
+        with mock.patch.object(blockchain, 'broadcast', broadcast):
+            for workers in (1, 4, 16):
+                results = blockchain.broadcast_many(
+                    transactions, workers=workers)
+                self.assertEqual(8, len(results))
+                self.assertEqual(
+                    [str(i) for i in range(8) if i != 3],
+                    [r.data for i, r in enumerate(results) if i != 3])
+                self.assertEqual(
+                    [i not in (3, 5) for i in range(8)],
+                    [r.success for r in results])
+                self.assertEqual('read node error',
+                                 results[3].error_message)
+
+    def test_broadcast_many_workers(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def safe_broadcast(transaction):
+            with lock:
+                running.append(transaction)
+                peak.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.remove(transaction)
+            return Result(success=True)
+
+        with mock.patch.object(blockchain, 'safe_broadcast', safe_broadcast):
+            results = blockchain.broadcast_many(
+                [{'tx_id': i} for i in range(12)], workers=3)
+        self.assertEqual(12, len(results))
+        self.assertEqual(3, max(peak))
+        self.assertEqual([], blockchain.broadcast_many([]))
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    '''Answers after `delay` seconds over kept-alive connections'''
+    protocol_version = 'HTTP/1.1'
+    delay = 0
+    clients = set()
+
+    def do_GET(self):
+        SlowHandler.clients.add(self.client_address)
+        time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+class SessionClient(object):
+    '''Read node client keeping its own session'''
+
+    def __init__(self, address):
+        self.address = address
+        self.session = requests.Session()
+
+
+class SessionArgumentClient(object):
+    '''Read node client taking the session as an argument'''
+
+    def __init__(self, address, session=None):
+        self.address = address
+        self.http = session
+
+
+class PlainClient(object):
+    '''Read node client calling the requests module functions'''
+
+    def __init__(self, address):
+        self.address = address
+
+
+class TestReadNodeClientMethods(unittest.TestCase):
+
+    def setUp(self):
+        SlowHandler.clients = set()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def assert_configured(self, session, pool_size, timeout):
+        for url in (self.url, 'https://read-node/'):
+            adapter = session.get_adapter(url)
+            self.assertEqual(timeout, adapter.timeout)
+            pool = adapter.poolmanager.connection_from_url(url)
+            self.assertEqual(pool_size, pool.pool.maxsize)
+
+    def test_read_node_session(self):
+        session = blockchain.create_read_node_session(
+            pool_size=3, timeout=0.2)
+        self.assert_configured(session, 3, 0.2)
+
+        for _ in range(3):
+            self.assertEqual(b'ok', session.get(self.url).content)
+        # the connection is kept alive
+        self.assertEqual(1, len(SlowHandler.clients))
+
+        SlowHandler.delay = 0.5
+        try:
+            with self.assertRaises(requests.exceptions.Timeout):
+                session.get(self.url)
+            self.assertEqual(
+                b'ok', session.get(self.url, timeout=5).content)
+        finally:
+            SlowHandler.delay = 0
+
+    def test_configure_client_sessions(self):
+        client = SessionClient('address')
+        sessions = blockchain.configure_client_sessions(
+            client, pool_size=5, timeout=0.2)
+        self.assertEqual([client.session], sessions)
+        self.assert_configured(client.session, 5, 0.2)
+
+        self.assertEqual(
+            [], blockchain.configure_client_sessions(PlainClient('address')))
+
+    def test_create_read_node_client(self):
+        module = types.ModuleType('tcabci_read_client')
+        for client_class in (SessionClient, SessionArgumentClient):
+            module.HttpClient = client_class
+            with mock.patch.dict(sys.modules, tcabci_read_client=module):
+                client = blockchain.create_read_node_client(
+                    pool_size=4, timeout=0.3)
+            self.assertIsInstance(client, client_class)
+            session = getattr(client, 'session', None) or client.http
+            self.assert_configured(session, 4, 0.3)
+
+        # a client without a session is used as it is
+        module.HttpClient = PlainClient
+        with mock.patch.dict(sys.modules, tcabci_read_client=module):
+            with self.assertLogs(blockchain.logger, 'WARNING'):
+                client = blockchain.create_read_node_client()
+        self.assertIsInstance(client, PlainClient)
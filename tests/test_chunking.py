@@ -0,0 +1,36 @@
+import unittest
+from transferchain import constants
+from transferchain.chunking import ChunkSizer, CHUNK_ALIGN
+from transferchain.protobuf import service_pb2 as pb
+
+
+class TestChunkingMethods(unittest.TestCase):
+
+    def test_slot_chunk_size(self):
+        sizer = ChunkSizer.for_slot(pb.UploadSlot(ChunkSize=1000), 2000)
+        sizer.update(1000, 10)
+        self.assertEqual(1000, sizer.size)
+
+        sizer = ChunkSizer.for_slot(pb.UploadSlot(), 2000)
+        sizer.update(2000, 0)
+        self.assertEqual(2000, sizer.size)
+
+    def test_adaptive_chunk_size(self):
+        sizer = ChunkSizer.for_slot(pb.UploadSlot())
+        self.assertEqual(constants.UPLOAD_CHUNK_SIZE, sizer.size)
+
+        sizer.update(sizer.size, 0)
+        self.assertEqual(2 * constants.UPLOAD_CHUNK_SIZE, sizer.size)
+        for _ in range(5):
+            sizer.update(sizer.size, 0)
+        self.assertEqual(constants.UPLOAD_MAX_CHUNK_SIZE, sizer.size)
+
+        # 1 MiB/s link
+        for _ in range(10):
+            sizer.update(sizer.size, sizer.size / (1024 * 1024))
+        expected = int(1024 * 1024 * constants.UPLOAD_CHUNK_TARGET_TIME)
+        self.assertEqual(expected // CHUNK_ALIGN * CHUNK_ALIGN, sizer.size)
+
+        for _ in range(10):
+            sizer.update(sizer.size, 100)
+        self.assertEqual(constants.UPLOAD_MIN_CHUNK_SIZE, sizer.size)
@@ -4,7 +4,59 @@ import shutil
 import tempfile
 import unittest
 from pathlib import Path
+from unittest import mock
+from transferchain import client
+from transferchain import transaction
+from transferchain.crypt import keys
 from transferchain.client import TransferChain
+from tests import fakes
+
+
+class TestClientConfigMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_prebuilt_config(self):
+        config = fakes.create_config(
+            db_path=os.path.join(self.dir_path, 'tc.db'))
+        with mock.patch.object(client, 'create_config') as create_config:
+            for tc in (TransferChain(config), TransferChain(config=config)):
+                self.assertIs(config, tc.config)
+                self.assertEqual(config.db_path, tc.db_path)
+                tc.close()
+        create_config.assert_not_called()
+
+    def test_address_executor(self):
+        config = fakes.create_config(
+            db_path=os.path.join(self.dir_path, 'tc.db'))
+        tc = TransferChain(config)
+        self.assertIsNone(tc.get_address_executor())
+        tc.close()
+
+        tc = TransferChain(config, address_workers=2)
+        executor = tc.get_address_executor()
+        self.assertIs(executor, tc.get_address_executor())
+        tc.close()
+        self.assertIsNone(tc.address_executor)
+        with self.assertRaises(RuntimeError):
+            executor.submit(int)
+
+    def test_close_clears_caches(self):
+        config = fakes.create_config(
+            db_path=os.path.join(self.dir_path, 'tc.db'))
+        tc = TransferChain(config, key_cache_size=8, builder_cache_size=8)
+        try:
+            transaction.get_builder(fakes.create_user().addresses[0].Key)
+            self.assertEqual(1, len(transaction.BUILDER_CACHE))
+            tc.close()
+            self.assertEqual(0, len(transaction.BUILDER_CACHE))
+        finally:
+            keys.set_key_cache_size(0)
+            transaction.set_builder_cache_size(0)
 
 
 class TestClientMethods(unittest.TestCase):
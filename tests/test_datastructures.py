@@ -0,0 +1,48 @@
+import unittest
+from transferchain.crypt import keys
+from transferchain.datastructures import (
+    Address, AddressTable, User, TransferSent)
+
+
+class TestAddressTable(unittest.TestCase):
+
+    def user(self):
+        addresses = []
+        for i in range(5):
+            key = keys.generate_keys(('%02x' % (i + 1)) * 32)
+            addresses.append(Address(
+                Key=key, Mnemonics='test mnemonics', Master=i == 0,
+                UserID=1, SubUserID='sub',
+                MasterAddress=addresses[0].Key['Address'] if i else None))
+        return User(id='sub', parent_user_id=1, master_address=addresses[0],
+                    addresses=addresses, master=False)
+
+    def test_address_table(self):
+        user = self.user()
+        compact_user = user.compact()
+        table = compact_user.addresses
+        self.assertIsInstance(table, AddressTable)
+        self.assertEqual({}, table.extra)
+        self.assertEqual(user, compact_user)
+        self.assertEqual(user.addresses, list(table))
+        self.assertEqual(
+            user.addresses[3].Key['Address'], table[3].Key['Address'])
+        self.assertEqual(user.addresses[-1], table[-1])
+        self.assertEqual(user.addresses[1:3], table[1:3])
+        self.assertEqual(5 * AddressTable.KEY_SIZE, len(table.rows))
+        with self.assertRaises(IndexError):
+            table[5]
+
+    def test_address_table_extra(self):
+        addresses = self.user().addresses
+        odd = addresses[2]._replace(Mnemonics='other mnemonics')
+        addresses[2] = odd
+        table = AddressTable(addresses)
+        self.assertEqual([2], list(table.extra))
+        self.assertEqual(addresses, list(table))
+
+    def test_transfer_sent_defaults(self):
+        # the fields before failedAddresses are enough
+        transfer_sent = TransferSent(*range(15))
+        self.assertEqual((), transfer_sent.failedAddresses)
+        self.assertEqual(14, transfer_sent.ReceivedAddress)
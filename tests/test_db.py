@@ -1,4 +1,6 @@
 import os
+import json
+import base64
 import tempfile
 import unittest
 from transferchain.db import DB
@@ -17,3 +19,25 @@ class TestDBMethods(unittest.TestCase):
 
             items = db.get_all()
             self.assertEqual(items['test'], b'test-value', 'invalid value')
+
+            db.set('test', b'new-value')
+            db.set('other', b'other-value')
+            db.close()
+
+            db = DB(db_path)
+            self.assertEqual(b'new-value', db.get('test'))
+            self.assertEqual(['other', 'test'], sorted(db.keys()))
+            db.delete('other')
+            self.assertIsNone(db.get('other'))
+            db.close()
+
+    def test_pickledb_migration(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            db_path = os.path.join(tempdir, 'test.db')
+            with open(db_path, 'w') as f:
+                json.dump({'test': base64.b64encode(b'value').decode()}, f)
+
+            db = DB(db_path)
+            self.assertEqual({'test': b'value'}, db.get_all())
+            db.close()
+            self.assertTrue(os.path.exists(db_path + '.pickledb.bak'))
@@ -0,0 +1,158 @@
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+from transferchain import download
+from transferchain.crypt import crypt
+from transferchain.protobuf import service_pb2 as pb
+from tests import fakes
+
+
+class FailingStub(fakes.FakeFileOperationStub):
+    '''Returns empty chunks for the ranges starting at fail_seeks'''
+
+    def __init__(self, fail_seeks=()):
+        super(FailingStub, self).__init__()
+        self.fail_seeks = set(fail_seeks)
+
+    def DownloadV4(self, request, metadata=None):
+        if (request.Slot.UUID, request.Seek) in self.fail_seeks:
+            return pb.DownloadV4Response(chunk=b'')
+        return super(FailingStub, self).DownloadV4(request, metadata)
+
+
+class TestDownloadMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.config = fakes.create_config()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def store(self, stub, data, slot_size):
+        '''Put data into the slots of stub, return the slot dicts'''
+        slots = []
+        for index, offset in enumerate(range(0, len(data), slot_size)):
+            uuid = 'slot-{}'.format(index)
+            stub.slots[uuid] = bytearray(data[offset:offset + slot_size])
+            slots.append({'UUID': uuid, 'Size': slot_size})
+        return slots
+
+    def test_slot_ranges(self):
+        slots = [{'Size': 10}, {'Size': 10}]
+        self.assertEqual(
+            [(0, 0, 4, 0), (0, 4, 4, 4), (0, 8, 2, 8),
+             (1, 0, 4, 10), (1, 4, 1, 14)],
+            download.slot_ranges(slots, 15, 4))
+        # the last slot takes the rest of the file
+        self.assertEqual(
+            [(0, 0, 10, 0), (1, 0, 10, 10), (1, 10, 2, 20)],
+            download.slot_ranges(slots, 22, 10))
+        self.assertEqual(
+            [(0, 0, 5, 0)], download.slot_ranges([{'Size': 10}], 5, 100))
+
+    def test_journal(self):
+        path = os.path.join(self.dir_path, 'file.tcpart.json')
+        journal = download.Journal(path, 100, 10)
+        journal.load()
+        self.assertEqual(set(), journal.done)
+        journal.add(20)
+        journal.add(0)
+        self.assertEqual(
+            {'file_size': 100, 'range_size': 10, 'done': [0, 20]},
+            json.load(open(path)))
+
+        journal = download.Journal(path, 100, 10)
+        journal.load()
+        self.assertEqual({0, 20}, journal.done)
+
+        # a journal of another download is ignored
+        for file_size, range_size in ((101, 10), (100, 20)):
+            journal = download.Journal(path, file_size, range_size)
+            journal.load()
+            self.assertEqual(set(), journal.done)
+
+        with open(path, 'w') as f:
+            f.write('{')
+        journal = download.Journal(path, 100, 10)
+        journal.load()
+        self.assertEqual(set(), journal.done)
+
+    def test_download_slots_resume(self):
+        data = os.urandom(2500)
+        stub = FailingStub(fail_seeks=[('slot-1', 300)])
+        slots = self.store(stub, data, 1000)
+        part_path = os.path.join(self.dir_path, 'file' + download.PART_SUFFIX)
+
+        with mock.patch.object(download, 'get_client', return_value=stub):
+            result = download.download_slots(
+                self.config, pb.UploadOpCode.Transfer, slots, len(data),
+                part_path, workers=3, range_size=300)
+            self.assertEqual(False, result.success)
+            self.assertEqual(len(data), os.path.getsize(part_path))
+            journal = download.Journal(part_path + '.json', len(data), 300)
+            journal.load()
+            self.assertNotIn(1300, journal.done)
+            self.assertEqual(9, len(journal.done))
+
+            # only the failed range is fetched again
+            stub.fail_seeks.clear()
+            stub.calls.clear()
+            result = download.download_slots(
+                self.config, pb.UploadOpCode.Transfer, slots, len(data),
+                part_path, workers=3, range_size=300)
+        self.assertEqual(True, result.success, result.error_message)
+        self.assertEqual(1, stub.calls['DownloadV4'])
+        with open(part_path, 'rb') as f:
+            self.assertEqual(data, f.read())
+
+        # a part file of another size starts over
+        with open(part_path, 'wb') as f:
+            f.write(b'x')
+        stub.calls.clear()
+        with mock.patch.object(download, 'get_client', return_value=stub):
+            result = download.download_slots(
+                self.config, pb.UploadOpCode.Transfer, slots, len(data),
+                part_path, workers=3, range_size=300)
+        self.assertEqual(True, result.success, result.error_message)
+        self.assertEqual(10, stub.calls['DownloadV4'])
+        with open(part_path, 'rb') as f:
+            self.assertEqual(data, f.read())
+
+    def test_download_file(self):
+        message = os.urandom(3000)
+        aes_key = crypt.generate_encrypt_key(32)
+        hmac_key = crypt.generate_encrypt_key(32)
+        out_file = io.BytesIO()
+        crypt.encrypt_aesctr_with_hmac(
+            io.BytesIO(message), out_file, aes_key.encode('utf-8'),
+            hmac_key.encode('utf-8'))
+        encrypted = out_file.getvalue()
+        destination_file = Path(self.dir_path).joinpath('file.dat')
+        part_path, journal_path = download.part_paths(destination_file)
+
+        for tampered in (False, True):
+            data = bytearray(encrypted)
+            if tampered:
+                data[100] ^= 1
+            stub = fakes.FakeFileOperationStub()
+            slots = self.store(stub, bytes(data), 1200)
+            with mock.patch.object(
+                    download, 'get_client', return_value=stub):
+                result = download.download_file(
+                    self.config, pb.UploadOpCode.Transfer, slots,
+                    len(data), aes_key, hmac_key, destination_file,
+                    workers=2, range_size=500)
+            self.assertEqual(not tampered, result.success)
+            self.assertFalse(os.path.exists(part_path))
+            self.assertFalse(os.path.exists(journal_path))
+            if tampered:
+                self.assertFalse(destination_file.exists())
+            else:
+                self.assertEqual(message, destination_file.read_bytes())
+                destination_file.unlink()
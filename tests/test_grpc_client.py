@@ -9,3 +9,36 @@ class TestGrpcClientMethods(unittest.TestCase):
         result = grpc.get_client()
         hb_result = result.Heartbeat(pb.Empty())
         self.assertEqual(0, hb_result.ByteSize())
+
+    def test_channel_options(self):
+        options = dict(grpc.channel_options(
+            max_message_size=1024, window_size=2048, max_attempts=3))
+        self.assertEqual(1024, options['grpc.max_receive_message_length'])
+        self.assertEqual(1024, options['grpc.max_send_message_length'])
+        self.assertEqual(2048, options['grpc.http2.lookahead_bytes'])
+        self.assertEqual(0, options['grpc.http2.bdp_probe'])
+        self.assertIn('retryPolicy', options['grpc.service_config'])
+
+        options = dict(grpc.channel_options(keepalive_time=0))
+        self.assertNotIn('grpc.keepalive_time_ms', options)
+        self.assertNotIn('grpc.service_config', options)
+
+    def test_round_robin_channels(self):
+        import grpc as grpc_lib
+        channels = []
+
+        def channel_factory():
+            channel = grpc_lib.insecure_channel('localhost:1')
+            channels.append(channel)
+            return channel
+
+        try:
+            grpc.configure_client(channels=3, channel_factory=channel_factory)
+            clients = [grpc.get_client() for _ in range(6)]
+            self.assertEqual(3, len(channels))
+            self.assertEqual(3, len(set(map(id, clients))))
+            self.assertEqual(clients[:3], clients[3:])
+        finally:
+            for channel in channels:
+                channel.close()
+            grpc.configure_client()
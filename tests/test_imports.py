@@ -0,0 +1,39 @@
+import sys
+import json
+import unittest
+import subprocess
+
+
+# modules loaded on first use, not by `import transferchain.client`
+LAZY_MODULES = [
+    'grpc', 'requests', 'nacl', 'cryptography', 'x25519', 'ed25519',
+    'google.protobuf', 'tcabci_read_client', 'orjson',
+    'transferchain.protobuf.service_pb2',
+    'transferchain.protobuf.service_pb2_grpc']
+
+# seconds, cumulative import time of transferchain.client
+IMPORT_TIME_BUDGET = 1.0
+
+SCRIPT = '''
+import sys, json, time
+start = time.perf_counter()
+import transferchain.client
+elapsed = time.perf_counter() - start
+print(json.dumps({'elapsed': elapsed, 'modules': sorted(sys.modules)}))
+'''
+
+
+class TestImports(unittest.TestCase):
+
+    def import_client(self):
+        output = subprocess.check_output([sys.executable, '-c', SCRIPT])
+        return json.loads(output)
+
+    def test_lazy_modules(self):
+        modules = set(self.import_client()['modules'])
+        loaded = [m for m in LAZY_MODULES if m in modules]
+        self.assertEqual([], loaded)
+
+    def test_import_time(self):
+        elapsed = min(self.import_client()['elapsed'] for _ in range(3))
+        self.assertLess(elapsed, IMPORT_TIME_BUDGET)
@@ -1,10 +1,22 @@
+import os
 import time
+import shutil
+import tempfile
+import threading
+import itertools
 import unittest
+from unittest import mock
 from transferchain import restore
+from transferchain import blockchain
 from transferchain import constants
+from transferchain import transaction
 from transferchain.addresses import get_user_password
 from transferchain.config import create_config
 from transferchain.client import TransferChain
+from transferchain.crypt import bip39
+from transferchain.crypt import keys
+from transferchain.datastructures import Address, Addresses
+from tests import fakes
 
 
 class TestRestoreMethods(unittest.TestCase):
@@ -92,3 +104,284 @@ class TestRestoreMethods(unittest.TestCase):
             tc.config.mnemonics, user_password, tc.config.user_id)
         self.assertEqual(True, result.success)
         self.assertEqual(user_count, len(result.data))
+
+    def test_restore_sub_user_with_mnemonics_batches(self):
+        config = create_config()
+        tc = TransferChain(config)
+        result = tc.add_master_user()
+        time.sleep(10)
+        self.assertEqual(True, result.success)
+        for i in range(3):
+            user_info_result = tc.add_user()
+            self.assertEqual(True, user_info_result.success)
+        time.sleep(10)
+        user_password = get_user_password(tc.config.user_id)
+        result = restore.restore_sub_user_with_mnemonics(
+            tc.config.mnemonics, user_password, tc.config.user_id)
+        batch_result = restore.restore_sub_user_with_mnemonics(
+            tc.config.mnemonics, user_password, tc.config.user_id,
+            workers=2, batch_size=2)
+        self.assertEqual(True, batch_result.success)
+        self.assertEqual(
+            [user.id for user in result.data],
+            [user.id for user in batch_result.data])
+
+    def test_next_cursor(self):
+        txns = [{'height': 5}, {'height': 7}, {'height': 7}]
+        self.assertEqual((7, 2), restore.next_cursor(txns, 0, 0))
+        # a page of a single height continues inside it
+        txns = [{'height': 7}, {'height': 7}]
+        self.assertEqual((7, 4), restore.next_cursor(txns, 7, 2))
+        # without heights pages are continued by offset
+        self.assertEqual((0, 6), restore.next_cursor([{}, {}], 0, 4))
+
+    def test_restore_checkpoint(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, 'tc.db')
+            checkpoint = restore.RestoreCheckpoint.from_db_path(db_path)
+            self.assertEqual(
+                os.path.join(tmp_dir, restore.RESTORE_CHECKPOINT_FILE),
+                checkpoint.path)
+            self.assertEqual((0, 0), checkpoint.get(1))
+
+            checkpoint.set(1, 120, 3)
+            checkpoint = restore.RestoreCheckpoint.from_db_path(db_path)
+            self.assertEqual((120, 3), checkpoint.get(1))
+            self.assertEqual((0, 0), checkpoint.get(2))
+
+
+class TestRestoreEngineMethods(unittest.TestCase):
+    '''Sub user restores against fakes.FakeReadNode, no server needed'''
+
+    def setUp(self):
+        self.mnemonics = bip39.create_mnomonics()
+        self.password = get_user_password(1)
+        self.user_keys = keys.create_keys_with_mnemonic(
+            self.mnemonics, self.password)
+        self.node = fakes.FakeReadNode()
+        self.seeds = itertools.count(1)
+
+    def add_sub_users(self, count):
+        '''
+        Broadcast the master and addresses txns of count sub users like
+        generate_sub_user_addresses, with fixed keys and one address.
+        Return their ids.
+        '''
+        sub_user_ids = []
+        for _ in range(count):
+            index = next(self.seeds)
+            sub_user_id = 'sub-{}'.format(index)
+            sub_keys = keys.generate_keys('{:08x}'.format(index) * 8)
+            master_address = Address(
+                Master=True, Key=sub_keys, UserID=1, Mnemonics='mnemonics',
+                MasterAddress=None, SubUserID=sub_user_id)
+            self.node.broadcast(**transaction.create_transaction(
+                constants.TX_TYPE_SUB_MASTER, sub_keys,
+                self.user_keys['Address'], master_address))
+            address = Address(
+                Master=False,
+                Key=keys.generate_keys('{:08x}'.format(index + 10000) * 8),
+                UserID=1, Mnemonics='mnemonics',
+                MasterAddress=sub_keys['Address'], SubUserID=sub_user_id)
+            self.node.broadcast(**transaction.create_transaction(
+                constants.TX_TYPE_SUB_ADDRESSES, sub_keys, sub_keys['Address'],
+                Addresses(UserID=1, Addresses=[address._asdict()])))
+            sub_user_ids.append(sub_user_id)
+        return sub_user_ids
+
+    def restore(self, **kwargs):
+        '''Return the iter_sub_users_with_mnemonics results'''
+        with mock.patch.object(
+                blockchain, 'get_read_node_client', return_value=self.node):
+            return list(restore.iter_sub_users_with_mnemonics(
+                self.mnemonics, self.password, 1, **kwargs))
+
+    def searches(self, typ):
+        return [search for search in self.node.searches
+                if search['typ'] == typ]
+
+    def test_master_keys_derived_once(self):
+        sub_user_ids = self.add_sub_users(5)
+        with mock.patch.object(
+                keys, 'create_keys_with_mnemonic',
+                wraps=keys.create_keys_with_mnemonic) as derive:
+            results = self.restore(page_size=2)
+        self.assertEqual(sub_user_ids, [result.data.id for result in results])
+        self.assertEqual(1, derive.call_count)
+        self.assertEqual(
+            3, len(self.searches(constants.TX_TYPE_SUB_MASTER)))
+
+    def assert_restored(self, sub_user_ids, results):
+        for result in results:
+            self.assertEqual(True, result.success, result.error_message)
+        self.assertEqual(sub_user_ids, [result.data.id for result in results])
+        for result in results:
+            user = result.data
+            self.assertEqual(2, len(user.addresses))
+            self.assertEqual(
+                user.master_address.Key['Address'],
+                user.addresses[1].MasterAddress)
+
+    def test_batched_addresses(self):
+        sub_user_ids = self.add_sub_users(5)
+        results = self.restore(page_size=10, batch_size=2, workers=2)
+        self.assert_restored(sub_user_ids, results)
+        searches = self.searches(constants.TX_TYPE_SUB_ADDRESSES)
+        # one tx_search per batch of 2, 2 and 1 sub users
+        self.assertEqual(
+            [2, 2, 1],
+            sorted([len(search['recipient_addrs']) for search in searches],
+                   reverse=True))
+
+    def test_addresses_without_recipient(self):
+        self.node = fakes.FakeReadNode(with_recipient=False)
+        sub_user_ids = self.add_sub_users(3)
+        with self.assertLogs(restore.logger, 'WARNING'):
+            results = self.restore(page_size=10, batch_size=3)
+        self.assert_restored(sub_user_ids, results)
+        searches = self.searches(constants.TX_TYPE_SUB_ADDRESSES)
+        # the batch, then one tx_search per sub user
+        self.assertEqual(
+            [3, 1, 1, 1],
+            [len(search['recipient_addrs']) for search in searches])
+
+    def test_next_page_prefetch(self):
+        sub_user_ids = self.add_sub_users(4)
+        fetching = threading.Event()
+        release = threading.Event()
+        tx_search = self.node.tx_search
+
+        def blocking_tx_search(**kwargs):
+            if kwargs['typ'] == constants.TX_TYPE_SUB_MASTER and \
+                    kwargs['offset'] + kwargs['height'] > 0:
+                fetching.set()
+                release.wait(5)
+            return tx_search(**kwargs)
+
+        self.node.tx_search = blocking_tx_search
+        with mock.patch.object(
+                blockchain, 'get_read_node_client', return_value=self.node):
+            results = restore.iter_sub_users_with_mnemonics(
+                self.mnemonics, self.password, 1, page_size=2)
+            first = next(results)
+            # the second page is asked before the first one is consumed
+            self.assertTrue(fetching.wait(5))
+            self.assertEqual(sub_user_ids[0], first.data.id)
+            release.set()
+            results = [first] + list(results)
+        self.assert_restored(sub_user_ids, results)
+
+    def test_get_addresses(self):
+        self.add_sub_users(1)
+        txn = self.node.txs[1]
+        # a second addresses txn of the same sub user
+        self.node.broadcast(
+            tx_type=txn['type'], sender_address=txn['sender_addr'],
+            recipient_address=txn['recipient_addr'],
+            data=txn['data']['Bytes'])
+        with mock.patch.object(
+                blockchain, 'get_read_node_client', return_value=self.node):
+            for limit, offset, heights in ((1, 0, [2]), (5, 0, [2, 3]),
+                                           (5, 1, [3])):
+                result = restore.get_addresses(
+                    constants.TX_TYPE_SUB_ADDRESSES, txn['recipient_addr'],
+                    limit=limit, offset=offset)
+                self.assertEqual(True, result.success)
+                self.assertEqual(
+                    heights, [item['height'] for item in result.data])
+
+    def test_pages_by_height(self):
+        # several sub users in a block, pages continue inside a height
+        self.node = fakes.FakeReadNode(block_size=3)
+        sub_user_ids = self.add_sub_users(7)
+        results = self.restore(page_size=2, batch_size=2)
+        self.assert_restored(sub_user_ids, results)
+        searches = self.searches(constants.TX_TYPE_SUB_MASTER)
+        self.assertEqual(4, len(searches))
+        self.assertEqual({2}, {search['limit'] for search in searches})
+        self.assertEqual((0, 0), (searches[0]['height'], searches[0]['offset']))
+        for previous, search in zip(searches, searches[1:]):
+            self.assertGreaterEqual(search['height'], previous['height'])
+
+    def test_restore_master_with_mnemonics(self):
+        master_address = Address(
+            Master=True, Key=self.user_keys, UserID=1, Mnemonics='mnemonics',
+            MasterAddress=None, SubUserID=None)
+        self.node.broadcast(**transaction.create_transaction(
+            constants.TX_TYPE_MASTER, self.user_keys,
+            self.user_keys['Address'], master_address))
+        address = Address(
+            Master=False, Key=keys.generate_keys('ab' * 32), UserID=1,
+            Mnemonics='mnemonics', MasterAddress=self.user_keys['Address'],
+            SubUserID=None)
+        self.node.broadcast(**transaction.create_transaction(
+            constants.TX_TYPE_ADDRESSES, self.user_keys,
+            self.user_keys['Address'],
+            Addresses(UserID=1, Addresses=[address._asdict()])))
+        with mock.patch.object(
+                blockchain, 'get_read_node_client', return_value=self.node):
+            result = restore.restore_master_with_mnemonics(
+                self.mnemonics, self.password, 1)
+        self.assertEqual(True, result.success, result.error_message)
+        self.assertEqual(1, result.data.id)
+        self.assertEqual(
+            [self.user_keys['Address'], address.Key['Address']],
+            [item.Key['Address'] for item in result.data.addresses])
+
+    def test_checkpoint_after_full_page(self):
+        sub_user_ids = self.add_sub_users(5)
+        dir_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir_path)
+        checkpoint = restore.RestoreCheckpoint.from_db_path(
+            os.path.join(dir_path, 'tc.db'))
+        # the addresses of the 4th sub user are missing
+        addresses_txn = self.node.txs.pop(7)
+
+        results = self.restore(page_size=2, batch_size=1,
+                               checkpoint=checkpoint)
+        self.assertEqual(False, results[-1].success)
+        self.assertEqual(
+            sub_user_ids[:3], [result.data.id for result in results[:-1]])
+        # the 3rd sub user is restored but its page is not, the restore
+        # continues from the start of that page
+        height, offset = checkpoint.get(1)
+        self.node.txs.insert(7, addresses_txn)
+        results = self.restore(page_size=2, height=height, offset=offset,
+                               checkpoint=checkpoint)
+        self.assert_restored(sub_user_ids[2:], results)
+
+        # only the new sub users are fetched
+        new_sub_user_ids = self.add_sub_users(2)
+        height, offset = checkpoint.get(1)
+        results = self.restore(page_size=2, height=height, offset=offset,
+                               checkpoint=checkpoint)
+        self.assert_restored(new_sub_user_ids, results)
+        height, offset = checkpoint.get(1)
+        self.assertEqual(
+            [], self.restore(page_size=2, height=height, offset=offset))
+
+    def test_sync_sub_users(self):
+        dir_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir_path)
+        config = fakes.create_config(
+            db_path=os.path.join(dir_path, 'tc.db'))._replace(
+                mnemonics=self.mnemonics)
+        sub_user_ids = self.add_sub_users(3)
+        tc = TransferChain(config, restore_page_size=2)
+        self.addCleanup(tc.close)
+        with mock.patch.object(
+                blockchain, 'get_read_node_client', return_value=self.node):
+            result = tc.sync_sub_users()
+            self.assertEqual(True, result.success, result.error_message)
+            self.assertEqual(
+                sub_user_ids, [user.id for user in result.data])
+
+            new_sub_user_ids = self.add_sub_users(2)
+            result = tc.sync_sub_users()
+            self.assertEqual(True, result.success, result.error_message)
+            self.assertEqual(
+                new_sub_user_ids, [user.id for user in result.data])
+            self.assertEqual([], tc.sync_sub_users().data)
+        for sub_user_id in sub_user_ids + new_sub_user_ids:
+            self.assertEqual(
+                sub_user_id, tc.get_user(sub_user_id).id)
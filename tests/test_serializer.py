@@ -0,0 +1,100 @@
+import gzip
+import json
+import base64
+import unittest
+from collections import OrderedDict
+from transferchain import serializer
+from transferchain import transaction
+from transferchain.datastructures import (
+    Address, Addresses, DataTransfer, DataStorage, TransferDelete)
+
+
+STRINGS = [
+    '', 'transfer', 'with spaces ', ' ', 'quote " and \\ backslash',
+    'new\nline\ttab\r\x00\x1f', 'ünïcödé', '  ', '😀 emoji',
+    '/+=', base64.b64encode(bytes(range(256))).decode()]
+
+SLOTS = [
+    {'Address': 'slot 1', 'Slot': 1, 'ChunkSize': 3145728, 'Index': 0},
+    {'Address': 'slot ü', 'Slot': 2, 'ChunkSize': 0, 'Index': None}]
+
+PAYLOADS = [
+    TransferDelete(UUID='u', TxID='t', FileName='a b.txt'),
+    TransferDelete(UUID=None),
+    DataTransfer(
+        UUID='uuid', FileName='ünïcödé 😀.pdf', Size=2 ** 40,
+        Slots=SLOTS, KeyAES='k' * 64, KeyHMAC='h' * 64,
+        Message='line\nbreak "quoted"', Typ=1, EndTime=1.5),
+    DataStorage(UUID='uuid', Size=2 ** 70, Slots=[SLOTS, (1, 'x')]),
+    Address(Key={'Address': 'a', 'Seed': 's', 1: True, None: 0},
+            Mnemonics='one two three', Master=True, UserID=10,
+            MasterAddress='excluded', SubUserID=None),
+]
+
+
+def legacy_signing_data(tx):
+    '''sign_transaction input before the single pass serializer'''
+    data = OrderedDict({
+        "id": "",
+        "version": 2,
+        "type": tx['tx_type'],
+        "sender_addr": tx['sender_address'],
+        "recipient_addr": tx['recipient_address'],
+        "data": tx['data'],
+        "sign": None,
+        "fee": 0
+    })
+    return json.dumps(data).replace(' ', '').encode('utf-8')
+
+
+def legacy_dump(payload):
+    '''TupleMixin.dump before the serializer'''
+    data = {k: getattr(payload, k) for k in payload._fields}
+    if isinstance(payload, Address):
+        del data['MasterAddress']
+    return json.dumps(data).encode('utf-8')
+
+
+class TestSerializerMethods(unittest.TestCase):
+
+    def tearDown(self):
+        serializer.set_orjson(True)
+
+    def test_canonical(self):
+        for value in STRINGS + [None, 0, 2, True, 1.5, 2 ** 70]:
+            self.assertEqual(
+                json.dumps(value).replace(' ', ''),
+                serializer.canonical(value))
+
+    def test_signing_data(self):
+        for i, value in enumerate(STRINGS):
+            tx = {
+                'tx_type': value,
+                'sender_address': STRINGS[i - 1],
+                'recipient_address': STRINGS[i - 2],
+                'data': STRINGS[i - 3],
+            }
+            self.assertEqual(
+                legacy_signing_data(tx), transaction.signing_data(tx))
+        tx = {'tx_type': None, 'sender_address': 1,
+              'recipient_address': True, 'data': 'x'}
+        self.assertEqual(legacy_signing_data(tx), transaction.signing_data(tx))
+
+    def test_dump(self):
+        for enabled in (True, False):
+            serializer.set_orjson(enabled)
+            for payload in PAYLOADS:
+                expected = legacy_dump(payload)
+                dumped = payload.dump()
+                if not enabled:
+                    self.assertEqual(expected, dumped)
+                self.assertEqual(json.loads(expected), json.loads(dumped))
+
+    def test_addresses_dump(self):
+        addresses = Addresses(UserID=1, Addresses=[
+            {'Address': 'a', 'UserID': 1}, PAYLOADS[-1]])
+        data = json.loads(gzip.decompress(addresses.dump()))
+        self.assertEqual(1, data['UserID'])
+        self.assertEqual({'Address': 'a', 'UserID': 1}, data['Addresses'][0])
+        self.assertEqual(
+            json.loads(json.dumps(PAYLOADS[-1])), data['Addresses'][1])
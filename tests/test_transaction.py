@@ -0,0 +1,65 @@
+import base64
+import unittest
+from transferchain import transaction
+from transferchain.crypt import bip39
+from transferchain.crypt import keys
+from transferchain.crypt import crypt
+from transferchain.datastructures import TransferDelete
+
+
+class TestTransactionMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.sender = keys.create_keys_with_mnemonic(
+            bip39.create_mnomonics(), 'p1')
+        self.recipients = [
+            keys.create_keys_with_mnemonic(bip39.create_mnomonics(), 'p2'),
+            keys.create_keys_with_mnemonic(bip39.create_mnomonics(), 'p3')]
+        self.payload = TransferDelete(UUID='uuid', TxID='tx', FileName='a')
+
+    def tearDown(self):
+        transaction.set_builder_cache_size(0)
+        transaction.clear_builder_cache()
+
+    def test_create_transaction(self):
+        transaction.set_builder_cache_size(64)
+        for _ in range(2):
+            for recipient in self.recipients:
+                tx = transaction.create_transaction(
+                    'transfer', self.sender, recipient['Address'],
+                    self.payload)
+                self.assertEqual(self.sender['Address'], tx['sender_address'])
+                data = base64.b64decode(tx['data'])
+                self.assertEqual(
+                    self.payload.dump(), crypt.decrypt_asymmetric(
+                        self.sender['Address'], recipient['Seed'], data))
+                sign = base64.b64decode(tx['sign'])
+                self.assertEqual(sign, transaction.sign_transaction(
+                    self.sender['PrivateKeySign'], tx))
+                self.assertTrue(crypt.verify_sign(
+                    self.sender['Address'], transaction.signing_data(tx),
+                    sign))
+        builder = transaction.get_builder(self.sender)
+        self.assertIs(builder, transaction.get_builder(dict(self.sender)))
+        self.assertEqual(2, len(builder.boxes))
+        self.assertNotIn(
+            self.sender['Address'], [str(k) for k in transaction.BUILDER_CACHE])
+
+    def test_builder_cache_disabled(self):
+        self.assertEqual(0, transaction.BUILDER_CACHE_SIZE)
+        builder = transaction.get_builder(self.sender)
+        self.assertIsNot(builder, transaction.get_builder(self.sender))
+        self.assertEqual(0, len(transaction.BUILDER_CACHE))
+
+        transaction.set_builder_cache_size(1)
+        for recipient in self.recipients:
+            transaction.get_builder(recipient)
+        self.assertEqual(1, len(transaction.BUILDER_CACHE))
+
+    def test_box_cache_size(self):
+        builder = transaction.TransactionBuilder(
+            self.sender, box_cache_size=1)
+        for recipient in self.recipients:
+            builder.create('transfer', recipient['Address'], self.payload)
+        self.assertEqual(
+            [self.recipients[-1]['Address']], list(builder.boxes))
@@ -1,12 +1,22 @@
 import os
 import tempfile
+import io
 import unittest
 import shutil
+import grpc
 from pathlib import Path
+from unittest import mock
+from transferchain import blockchain
+from transferchain import transfer as transfer_module
+from transferchain import upload as upload_module
 from transferchain.client import TransferChain
+from transferchain.crypt import crypt
+from transferchain.crypt import keys
+from transferchain.datastructures import Result
 from transferchain.transfer import Transfer
 from transferchain.config import create_config
 from transferchain.protobuf import service_pb2 as pb
+from tests import fakes
 
 
 class TestTransferMethods(unittest.TestCase):
@@ -197,5 +207,177 @@ class TestTransferMethods(unittest.TestCase):
         shutil.rmtree(dir_path)
 
 
+class TestTransferUploadMethods(unittest.TestCase):
+    '''Uploads against fakes.FakeFileOperationStub, no server needed'''
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.dir_path, 'transfer_test_data.dat')
+        with open(self.file_path, 'wb') as f:
+            f.write(os.urandom(5000))
+        self.user = fakes.create_user()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def upload(self, stub, recipients=None, **kwargs):
+        transfer = Transfer(fakes.create_config(), **kwargs)
+        sender = self.user.addresses[1]
+        if recipients is None:
+            recipients = [self.user.addresses[2].Key['Address']]
+        with mock.patch.object(
+                transfer_module, 'get_client', return_value=stub), \
+                mock.patch.object(
+                    upload_module, 'get_client', return_value=stub), \
+                mock.patch.object(
+                    blockchain, 'broadcast', fakes.broadcast_ok):
+            return transfer, transfer.upload(
+                files=[self.file_path], sender=sender,
+                recipient_addresses=recipients, note='test transfer')
+
+    def reference(self, transfer_sent, iv):
+        '''encrypt_aesctr_with_hmac output with the keys of the upload'''
+        out_file = io.BytesIO()
+        with open(self.file_path, 'rb') as in_file:
+            with mock.patch.object(crypt.os, 'urandom', return_value=iv):
+                crypt.encrypt_aesctr_with_hmac(
+                    in_file, out_file, transfer_sent.keyAES.encode(),
+                    transfer_sent.KeyHMAC.encode())
+        return out_file.getvalue()
+
+    def test_stream_upload(self):
+        # sequential stream, slot-parallel stream and temp file uploads
+        for stream_upload, slot_workers in (
+                (True, 1), (True, 3), (False, 1), (False, 3)):
+            stub = fakes.FakeFileOperationStub(slot_size=2000, slot_count=3)
+            transfer, result = self.upload(
+                stub, stream_upload=stream_upload,
+                slot_workers=slot_workers, chunk_size=700)
+            self.assertEqual(True, result.success, result.error_message)
+            self.assertEqual(True, result.data[0].success,
+                             result.data[0].error_message)
+            transfer_sent = result.data[0].data
+            self.assertEqual(3, len(transfer_sent.slots))
+
+            uploaded = stub.uploaded(transfer_sent.slots)
+            data = b''.join(uploaded)
+            self.assertEqual(transfer_sent.size, len(data))
+            expected = self.reference(
+                transfer_sent, data[1:1 + crypt.IV_SIZE])
+            self.assertEqual(expected, data)
+
+            offset = 0
+            for slot, slot_data in zip(transfer_sent.slots, uploaded):
+                self.assertEqual(
+                    expected[offset:offset + slot['Size']], slot_data)
+                offset += slot['Size']
+
+    def test_upload_error_releases_files(self):
+        stub = fakes.FakeFileOperationStub(slot_size=2000, fail_slot=1)
+        opened = []
+        real_open = open
+
+        def tracking_open(*args, **kwargs):
+            f = real_open(*args, **kwargs)
+            opened.append(f)
+            return f
+
+        for stream_upload, slot_workers in (
+                (True, 1), (True, 2), (False, 1), (False, 2)):
+            tmp_dir = tempfile.mkdtemp(dir=self.dir_path)
+            with mock.patch.object(tempfile, 'tempdir', tmp_dir), \
+                    mock.patch('builtins.open', tracking_open):
+                transfer, result = self.upload(
+                    stub, stream_upload=stream_upload,
+                    slot_workers=slot_workers)
+            self.assertEqual(False, result.data[0].success)
+            self.assertEqual([], os.listdir(tmp_dir))
+            self.assertTrue(opened)
+            self.assertTrue(all(f.closed for f in opened))
+        self.assertEqual(12, len(stub.deleted))
+
+        stub = fakes.FakeFileOperationStub(slot_size=2000)
+        with mock.patch.object(
+                crypt.EncryptReader, 'read', side_effect=OSError('read')):
+            transfer, result = self.upload(stub, stream_upload=True)
+        self.assertEqual(False, result.data[0].success)
+        self.assertIn('read', result.data[0].error_message)
+
+    def test_broadcast_to_recipients(self):
+        recipients = [keys.generate_keys('{:02x}'.format(i) * 32)['Address']
+                      for i in range(10, 16)]
+        failing = set(recipients[1::2])
+        broadcasted = []
+
+        def safe_broadcast(transaction):
+            broadcasted.append(transaction['recipient_address'])
+            return Result(success=transaction['recipient_address']
+                          not in failing)
+
+        stub = fakes.FakeFileOperationStub(slot_size=2000)
+        with mock.patch.object(blockchain, 'safe_broadcast', safe_broadcast):
+            transfer, result = self.upload(
+                stub, recipients=recipients, broadcast_workers=4)
+        file_result = result.data[0]
+        self.assertEqual(False, file_result.success)
+        transfer_sent = file_result.data
+        # failed recipients keep their order
+        self.assertEqual(recipients[1::2], transfer_sent.failedAddresses)
+        self.assertEqual(sorted(recipients), sorted(broadcasted))
+        self.assertEqual([], stub.deleted)
+
+        # retrying the failed recipients only broadcasts
+        upload_calls = dict(stub.calls)
+        failing.clear()
+        broadcasted.clear()
+        with mock.patch.object(blockchain, 'safe_broadcast', safe_broadcast):
+            failed_addresses = transfer.broadcast_to_recipients(
+                self.user.addresses[1], transfer_sent,
+                transfer_sent.failedAddresses, 'test transfer')
+        self.assertEqual([], failed_addresses)
+        self.assertEqual(recipients[1::2], sorted(
+            broadcasted, key=recipients.index))
+        self.assertEqual(upload_calls, dict(stub.calls))
+
+    def test_broadcast_to_recipients_failed(self):
+        recipients = [keys.generate_keys('{:02x}'.format(i) * 32)['Address']
+                      for i in range(10, 13)]
+
+        def safe_broadcast(transaction):
+            return Result(success=False, error_message='read node error')
+
+        stub = fakes.FakeFileOperationStub(slot_size=2000)
+        with mock.patch.object(blockchain, 'safe_broadcast', safe_broadcast):
+            transfer, result = self.upload(stub, recipients=recipients)
+        file_result = result.data[0]
+        self.assertEqual(False, file_result.success)
+        self.assertEqual(None, file_result.data)
+        # the upload is cancelled
+        self.assertEqual(sorted(stub.slots), sorted(stub.deleted))
+
+    def test_finish_error_cancels_partly_published(self):
+        recipients = [keys.generate_keys('{:02x}'.format(i) * 32)['Address']
+                      for i in range(10, 12)]
+
+        def safe_broadcast(transaction):
+            return Result(
+                success=transaction['recipient_address'] != recipients[1])
+
+        class FinishError(grpc.RpcError):
+            def details(self):
+                return 'finish failed'
+
+        stub = fakes.FakeFileOperationStub(slot_size=2000)
+        with mock.patch.object(blockchain, 'safe_broadcast', safe_broadcast), \
+                mock.patch.object(stub, 'TransferFinishV2',
+                                  side_effect=FinishError()):
+            transfer, result = self.upload(stub, recipients=recipients)
+        self.assertEqual(False, result.success)
+        self.assertIn('finish failed', result.error_message)
+        # the partly published upload is cancelled
+        self.assertEqual(3, len(stub.deleted))
+        self.assertEqual(sorted(stub.slots), sorted(stub.deleted))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,117 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from transferchain import upload
+from transferchain.crypt import crypt
+from transferchain.protobuf import service_pb2 as pb
+from tests import fakes
+
+
+class Uploader(upload.SlotUploadMixin):
+
+    def __init__(self, stream_upload=True, slot_workers=1, chunk_size=None):
+        self.stream_upload = stream_upload
+        self.slot_workers = slot_workers
+        self.crypt_workers = 1
+        self.chunk_size = chunk_size
+
+
+class TestUploadMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.dir_path, 'upload_test_data.dat')
+        self.message = os.urandom(6000)
+        with open(self.file_path, 'wb') as f:
+            f.write(self.message)
+        self.aes_key = crypt.generate_encrypt_key(32).encode('utf-8')
+        self.hmac_key = crypt.generate_encrypt_key(32).encode('utf-8')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_slot_offsets(self):
+        slots = [pb.UploadSlot(Size=size) for size in (10, 3, 7)]
+        self.assertEqual([0, 10, 13], upload.slot_offsets(slots))
+
+    def test_upload_file_slots(self):
+        file_size = crypt.encrypted_size(len(self.message))
+        # uneven slots, the last one is shorter and one has a ChunkSize
+        slots = [
+            pb.UploadSlot(UUID='slot-0', Size=2500),
+            pb.UploadSlot(UUID='slot-1', Size=1001, ChunkSize=300),
+            pb.UploadSlot(UUID='slot-2', Size=2500)]
+        offsets = upload.slot_offsets(slots)
+
+        for stream_upload in (True, False):
+            for slot_workers in (1, 2, 3):
+                stub = fakes.FakeFileOperationStub()
+                uploader = Uploader(stream_upload, slot_workers, 512)
+                iv = os.urandom(crypt.IV_SIZE)
+                with mock.patch.object(
+                        upload, 'get_client', return_value=stub), \
+                        mock.patch.object(
+                            crypt.os, 'urandom', return_value=iv):
+                    error = uploader.upload_file_slots(
+                        'session', self.file_path, slots, file_size, [],
+                        self.aes_key, self.hmac_key)
+                self.assertEqual('', error)
+
+                out_file = io.BytesIO()
+                with mock.patch.object(crypt.os, 'urandom', return_value=iv):
+                    crypt.encrypt_aesctr_with_hmac(
+                        io.BytesIO(self.message), out_file, self.aes_key,
+                        self.hmac_key)
+                expected = out_file.getvalue()
+
+                for index, slot in enumerate(slots):
+                    end = offsets[index] + slot.Size
+                    if index == len(slots) - 1:
+                        end = file_size
+                    self.assertEqual(
+                        expected[offsets[index]:end],
+                        bytes(stub.slots[slot.UUID]),
+                        (stream_upload, slot_workers, index))
+
+    def test_digest_alongside_slots(self):
+        file_size = crypt.encrypted_size(len(self.message))
+        slots = [pb.UploadSlot(UUID='slot-{}'.format(index), Size=2100)
+                 for index in range(3)]
+        first_slots_done = threading.Event()
+        waited = []
+        hmac_aesctr = crypt.hmac_aesctr
+
+        def slow_hmac_aesctr(*args, **kwargs):
+            # finishes only after the other slots are uploaded
+            waited.append(first_slots_done.wait(5))
+            return hmac_aesctr(*args, **kwargs)
+
+        class Stub(fakes.FakeFileOperationStub):
+            def UploadBasicV4(self, payloads, metadata=None):
+                result = super(Stub, self).UploadBasicV4(payloads, metadata)
+                with self.lock:
+                    if {'slot-0', 'slot-1'} <= set(self.slots) and \
+                            len(self.slots['slot-1']) == 2100:
+                        first_slots_done.set()
+                return result
+
+        stub = Stub()
+        uploader = Uploader(True, 3, 512)
+        with mock.patch.object(upload, 'get_client', return_value=stub), \
+                mock.patch.object(crypt, 'hmac_aesctr', slow_hmac_aesctr):
+            error = uploader.upload_file_slots(
+                'session', self.file_path, slots, file_size, [],
+                self.aes_key, self.hmac_key)
+        self.assertEqual('', error)
+        self.assertEqual([True], waited)
+
+        out_file = io.BytesIO()
+        writer = crypt.DecryptWriter(out_file, self.aes_key, self.hmac_key)
+        writer.write(b''.join(stub.uploaded(
+            [{'UUID': slot.UUID} for slot in slots])))
+        writer.finalize()
+        self.assertEqual(self.message, out_file.getvalue())
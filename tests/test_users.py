@@ -0,0 +1,35 @@
+import unittest
+from transferchain.users import UserRegistry
+
+
+class TestUserRegistry(unittest.TestCase):
+
+    def test_registry(self):
+        loaded = []
+
+        def loader(user_id):
+            loaded.append(user_id)
+            return 'user-{}'.format(user_id)
+
+        users = UserRegistry(loader, max_size=2)
+        users.add_ids(['1', '2', '3'])
+        self.assertEqual(3, len(users))
+        self.assertEqual([], loaded)
+
+        self.assertEqual('user-1', users['1'])
+        self.assertEqual('user-1', users['1'])
+        self.assertEqual(['1'], loaded)
+
+        users['2']
+        users['3']
+        self.assertEqual(['2', '3'], list(users.cache))
+        users['1']
+        self.assertEqual(['1', '2', '3', '1'], loaded)
+
+        users['4'] = 'user-4'
+        self.assertIn('4', users)
+        self.assertEqual(['1', '2', '3', '4'], sorted(users))
+        del users['4']
+        self.assertNotIn('4', users)
+        with self.assertRaises(KeyError):
+            users['4']
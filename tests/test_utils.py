@@ -1,4 +1,7 @@
+import os
 import uuid
+import shutil
+import tempfile
 import unittest
 import datetime
 from transferchain import utils
@@ -22,3 +25,18 @@ class TestUtilsMethods(unittest.TestCase):
     def test_is_valid_uuid_invalid(self):
         result = utils.is_valid_uuid('test')
         self.assertNotEqual(True, result)
+
+    def test_json_file(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            json_file = utils.JsonFile(os.path.join(dir_path, 'state.json'))
+            self.assertEqual({}, json_file.load())
+            json_file.write({'a': [1, 2]})
+            self.assertEqual({'a': [1, 2]}, json_file.load())
+            self.assertEqual(['state.json'], os.listdir(dir_path))
+            for content in ('{', '[]'):
+                with open(json_file.path, 'w') as f:
+                    f.write(content)
+                self.assertEqual({}, json_file.load())
+        finally:
+            shutil.rmtree(dir_path)
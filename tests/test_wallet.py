@@ -1,5 +1,6 @@
 import os
 import uuid
+import tempfile
 import unittest
 from transferchain.datastructures import Config
 from transferchain import wallet
@@ -35,3 +36,29 @@ class TestWalletMethods(unittest.TestCase):
         conf = Config(api_token=None, api_secret=None)
         result = wallet.get_wallet_info(conf, None)
         self.assertEqual(False, result.success, result.error_message)
+
+    def test_wallet_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, 'tc.db')
+            cache = wallet.WalletCache.from_db_path(db_path, ttl=60)
+            self.assertEqual(
+                os.path.join(tmp_dir, wallet.WALLET_CACHE_FILE), cache.path)
+            wallet_uuid = str(uuid.uuid4())
+            self.assertIsNone(cache.created_wallet(1))
+            self.assertIsNone(cache.get(1, wallet_uuid))
+
+            cache.set(1, wallet_uuid, 10, created=True)
+            cache = wallet.WalletCache.from_db_path(db_path, ttl=60)
+            self.assertEqual(wallet_uuid, cache.created_wallet(1))
+            self.assertEqual(10, cache.get(1, wallet_uuid))
+            self.assertIsNone(cache.created_wallet(2))
+            self.assertIsNone(cache.get(2, wallet_uuid))
+
+            cache = wallet.WalletCache.from_db_path(db_path, ttl=-1)
+            cache.set(1, wallet_uuid, 10)
+            self.assertIsNone(cache.get(1, wallet_uuid))
+            self.assertEqual(wallet_uuid, cache.created_wallet(1))
+
+            with open(cache.path, 'w') as f:
+                f.write('{')
+            self.assertIsNone(cache.created_wallet(1))
@@ -3,6 +3,9 @@ This module enables the creation of addresses
 for users and broadcasting them to the blockchain.
 '''
 
+import multiprocessing
+from concurrent import futures
+from functools import partial
 from transferchain.crypt import keys
 from transferchain import constants
 from transferchain import blockchain
@@ -43,8 +46,87 @@ def get_user_password(user_id, sub_user_id=None):
     return f"user-{user_id}"
 
 
+def create_key_executor(workers=constants.ADDRESS_WORKERS):
+    """
+    Return a process pool for derive_keys. The workers are started with
+    the spawn method, since forking a process that already has grpc
+    channels and threads open is unsafe. A spawned worker imports
+    transferchain and the __main__ module of the caller, so a script
+    using workers must keep its code under `if __name__ == '__main__':`.
+    Keep the pool for the session and shut it down at the end, starting
+    the workers costs about half a second each.
+
+    Parameters:
+        workers (int):
+            number of processes
+
+    Returns:
+        concurrent.futures.ProcessPoolExecutor
+    """
+    return futures.ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def derive_keys(mnemonics, passwords, workers=constants.ADDRESS_WORKERS,
+                executor=None,
+                min_parallel=constants.ADDRESS_PARALLEL_MIN_KEYS):
+    """
+    Return keys.create_keys_with_mnemonic results of the passwords,
+    in the order of passwords. With more than one worker or an
+    executor, at least `min_parallel` keys are derived on a process
+    pool. PBKDF2 runs in hashlib and releases the GIL, but the
+    Curve25519 step of keys.generate_keys is pure Python, so threads
+    would not run it in parallel.
+
+    Without an executor a create_key_executor pool is started and shut
+    down for the call.
+
+    Parameters:
+        mnemonics (str):
+            mnemonics of account
+
+        passwords (list):
+            key passwords
+
+        workers (int):
+            number of processes deriving keys at the same time
+
+        executor (concurrent.futures.ProcessPoolExecutor):
+            optional, create_key_executor pool of `workers` processes
+
+        min_parallel (int):
+            fewer keys are derived in the calling process
+
+    Returns:
+        list of key dicts
+
+    Example:
+        -
+    ```
+        from transferchain.crypt import bip39
+        from transferchain.addresses import derive_keys
+
+        mnemonics = bip39.create_mnomonics()
+        passwords = ['user-1-{}'.format(i) for i in range(100)]
+        user_keys = derive_keys(mnemonics, passwords, workers=4)
+    ```
+    """
+    parallel = executor is not None or workers > 1
+    if not parallel or len(passwords) < max(min_parallel, 2):
+        return [keys.create_keys_with_mnemonic(mnemonics, password)
+                for password in passwords]
+    derive = partial(keys.create_keys_with_mnemonic, mnemonics)
+    chunksize = -(-len(passwords) // max(workers, 1))
+    if executor is not None:
+        return list(executor.map(derive, passwords, chunksize=chunksize))
+    with create_key_executor(min(workers, len(passwords))) as executor:
+        return list(executor.map(derive, passwords, chunksize=chunksize))
+
+
 def generate_sub_user_addresses(user_id, master_user_address,
-                                mnemonics, sub_user_id):
+                                mnemonics, sub_user_id,
+                                workers=constants.ADDRESS_WORKERS,
+                                executor=None):
     """
     Return a datastructures.User object.
     The sub user's master address is broadcast to the master user's
@@ -65,6 +147,13 @@ def generate_sub_user_addresses(user_id, master_user_address,
         sub_user_id (str):
             account user id
 
+        workers (int):
+            number of processes deriving the sub addresses
+
+        executor (concurrent.futures.ProcessPoolExecutor):
+            optional, create_key_executor pool deriving the sub
+            addresses, see derive_keys
+
     Returns:
         Result object. Result.data is datastructures.User
 
@@ -105,10 +194,10 @@ def generate_sub_user_addresses(user_id, master_user_address,
             error_message='The master address is not published on the blockchain.') # noqa
 
     addresses_payload = []
-    for i in range(0, 100):
-        user_pass = "{}-{}".format(
-            get_user_password(user_id, sub_user_id), i)
-        user_sub_keys = keys.create_keys_with_mnemonic(mnemonics, user_pass)
+    passwords = ["{}-{}".format(get_user_password(user_id, sub_user_id), i)
+                 for i in range(0, 100)]
+    for user_sub_keys in derive_keys(
+            mnemonics, passwords, workers=workers, executor=executor):
         address = Address(
             Master=False,
             Key=user_sub_keys,
@@ -140,7 +229,9 @@ def generate_sub_user_addresses(user_id, master_user_address,
     return Result(success=True, data=user)
 
 
-def generate_user_addresses(user_id, mnemonics):
+def generate_user_addresses(user_id, mnemonics,
+                            workers=constants.ADDRESS_WORKERS,
+                            executor=None):
     """
     Return a datastructures.User object.
     It broadcasts the master address to itself.
@@ -153,6 +244,13 @@ def generate_user_addresses(user_id, mnemonics):
         mnemonics (str):
             mnemonics of account
 
+        workers (int):
+            number of processes deriving the sub addresses
+
+        executor (concurrent.futures.ProcessPoolExecutor):
+            optional, create_key_executor pool deriving the sub
+            addresses, see derive_keys
+
     Returns:
         Result object. Result.data is datastructures.User
 
@@ -184,10 +282,10 @@ def generate_user_addresses(user_id, mnemonics):
             error_message='The master address is not published on the blockchain.') # noqa
 
     addresses_payload = []
-
-    for i in range(0, 100):
-        user_pass = "{}-{}".format(get_user_password(user_id), i)
-        user_sub_keys = keys.create_keys_with_mnemonic(mnemonics, user_pass)
+    passwords = ["{}-{}".format(get_user_password(user_id), i)
+                 for i in range(0, 100)]
+    for user_sub_keys in derive_keys(
+            mnemonics, passwords, workers=workers, executor=executor):
         address = Address(
             Master=False,
             Key=user_sub_keys,
@@ -0,0 +1,555 @@
+'''
+Asyncio interface of the SDK.
+
+Uploads and downloads run on grpc.aio channels, so many transfers can
+share one event loop. Files are read, encrypted and decrypted on the
+default executor of the loop. Read node calls (broadcasts and restores)
+go through the shared read node client on a bounded thread pool, since
+tcabci_read_client has no asyncio client.
+'''
+
+import os
+import asyncio
+import itertools
+import functools
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from transferchain import constants
+from transferchain import blockchain
+from transferchain import grpc_client
+from transferchain.client import TransferChain
+from transferchain.crypt import crypt
+from transferchain.datastructures import Result, TransferSent
+from transferchain.utils import LazyModule, slot_dicts
+
+grpc = LazyModule('grpc')
+pb = LazyModule('transferchain.protobuf.service_pb2')
+
+
+async def iterate_in_executor(iterator, executor=None):
+    '''Yield the items of a blocking iterator, each one read on executor'''
+    loop = asyncio.get_running_loop()
+    done = object()
+    while True:
+        item = await loop.run_in_executor(executor, next, iterator, done)
+        if item is done:
+            return
+        yield item
+
+
+class AsyncTransferChain(object):
+    '''
+    Asyncio version of client.TransferChain.
+
+    It takes the TransferChain options and keeps a TransferChain as
+    `client` for the users and the db, or give one with `client=`.
+    Creating the TransferChain may read the config from the network, so
+    in a running event loop build the object with `await create(...)`,
+    which creates it on the default executor.
+    At most `max_concurrency` files are uploaded or downloaded at the same
+    time.
+
+    Read node calls are not asyncio: tcabci_read_client has only a
+    blocking HTTP client, so broadcasts and restores run it on
+    `read_node_workers` threads (constants.ASYNC_READ_NODE_WORKERS).
+    That is the ceiling of read node calls in flight, later ones wait
+    for a free thread without blocking the event loop. Connections above
+    the `read_node_pool_size` of the client are not kept alive, give it
+    at least `read_node_workers`.
+
+    The grpc channels follow grpc_client.configure_client; give
+    `aio_channel_factory`, a function returning a grpc.aio.Channel, to
+    create them yourself. Await `close` when it is no longer needed.
+
+    Example:
+        -
+    ```
+    import asyncio
+    from transferchain.aio import AsyncTransferChain
+
+    async def main():
+        tc = await AsyncTransferChain.create()
+        tc.load_users()
+        user = tc.get_user(user_id)
+        result = await tc.transfer_files(
+            files=['/tmp/file'], sender_user_id=user.id,
+            recipient_addresses=[address], note='note')
+        await tc.close()
+
+    asyncio.run(main())
+    ```
+    '''
+
+    def __init__(self, *args, **kwargs):
+        self.client = kwargs.get('client') or TransferChain(*args, **kwargs)
+        self.config = self.client.config
+        self.transfer_service = self.client.transfer_service
+        self.storage_service = self.client.storage_service
+        self.max_concurrency = kwargs.get('max_concurrency') or \
+            constants.ASYNC_MAX_CONCURRENCY
+        self.read_node_executor = ThreadPoolExecutor(
+            max_workers=kwargs.get('read_node_workers') or
+            constants.ASYNC_READ_NODE_WORKERS,
+            thread_name_prefix='transferchain-read-node')
+        self.channel_factory = kwargs.get('aio_channel_factory')
+        # created in the running event loop on first use
+        self.channels = None
+        self.stubs = None
+        self.semaphore = None
+        self.counter = itertools.count()
+
+    @classmethod
+    async def create(cls, *args, **kwargs):
+        """
+        Return a new AsyncTransferChain without blocking the event loop,
+        the TransferChain is created on the default executor unless one
+        is given with `client=`.
+
+        Returns:
+            AsyncTransferChain
+
+        Example:
+            -
+        ```
+        tc = await AsyncTransferChain.create(db_path='/tmp/tc.db')
+        ```
+        """
+        if kwargs.get('client') is None:
+            loop = asyncio.get_running_loop()
+            kwargs['client'] = await loop.run_in_executor(
+                None, functools.partial(TransferChain, *args, **kwargs))
+        return cls(**kwargs)
+
+    def load_users(self):
+        '''See TransferChain.load_users'''
+        return self.client.load_users()
+
+    def get_user(self, user_id):
+        '''See TransferChain.get_user'''
+        return self.client.get_user(user_id)
+
+    def get_stub(self):
+        '''Return the next FileOperation stub of the aio channels'''
+        if self.stubs is None:
+            from transferchain.protobuf import service_pb2_grpc
+            factory = self.channel_factory
+            if factory is None:
+                def factory():
+                    return grpc_client.create_aio_channel(
+                        **grpc_client.GRPC_CHANNEL_OPTIONS)
+            self.channels = [
+                factory() for _ in range(max(grpc_client.GRPC_CHANNELS, 1))]
+            self.stubs = [service_pb2_grpc.FileOperationStub(channel)
+                          for channel in self.channels]
+        return self.stubs[next(self.counter) % len(self.stubs)]
+
+    def get_semaphore(self):
+        '''Return the semaphore bounding files processed at the same time'''
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self.semaphore
+
+    def meta_data(self, file_uuid=None, session_id=None):
+        '''Return grpc metadata of the user and optionally a file'''
+        meta_data = [
+            ("user-id", str(self.config.user_id)),
+            ("user-api-token", self.config.api_token),
+            ("user-api-secret", self.config.api_secret)
+        ]
+        if file_uuid is not None:
+            meta_data.extend([
+                ("uuid", file_uuid),
+                ("baseuuid", file_uuid),
+                ("sessionid", session_id)
+            ])
+        return meta_data
+
+    async def run_read_node(self, func, *args, **kwargs):
+        '''Run a blocking read node call on the read node threads'''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.read_node_executor, functools.partial(func, *args, **kwargs))
+
+    async def broadcast(self, transaction):
+        """
+        Awaitable blockchain.broadcast, an exception becomes a failed
+        result.
+
+        Parameters:
+            transaction (dict):
+                create_transaction result
+
+        Returns:
+            tcabci_read_client.client.HttpResultTuple or
+            datastructures.Result
+        """
+        try:
+            return await self.run_read_node(blockchain.broadcast, transaction)
+        except Exception as e:
+            return Result(success=False, error_message=str(e))
+
+    async def broadcast_many(self, transactions):
+        '''Broadcast the transactions at the same time, results in order'''
+        return await asyncio.gather(
+            *[self.broadcast(tx) for tx in transactions])
+
+    async def restore_master_user(self):
+        '''Awaitable TransferChain.restore_master_user'''
+        return await self.run_read_node(self.client.restore_master_user)
+
+    async def restore_sub_users(self):
+        '''Awaitable TransferChain.restore_sub_users'''
+        return await self.run_read_node(self.client.restore_sub_users)
+
+    async def sync_sub_users(self):
+        '''Awaitable TransferChain.sync_sub_users'''
+        return await self.run_read_node(self.client.sync_sub_users)
+
+    async def cancel_upload(self, service, slots, op_code):
+        '''
+        Run service.cancel_upload off the event loop, slots are slot
+        dicts, see utils.slot_dicts
+        '''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, service.cancel_upload, slots, op_code)
+
+    async def upload_slots(self, stub, service, session_id, out_file, slots,
+                           file_size, meta_data):
+        '''
+        Upload the slots of a file one after another, the payloads are
+        made by service.prepare_slot_upload_request.
+
+        Returns:
+           Error message, empty string if all slots are uploaded
+        '''
+        tweezers = {"total_write": 0}
+        for slot_index, slot in enumerate(slots):
+            payloads = service.prepare_slot_upload_request(
+                session_id=session_id,
+                out_file=out_file,
+                slot=slot,
+                is_last_slot=slot_index == len(slots) - 1,
+                file_size=file_size,
+                tweezers=tweezers)
+            try:
+                upload_basic_result = await stub.UploadBasicV4(
+                    iterate_in_executor(payloads), metadata=meta_data)
+            except grpc.RpcError as e:
+                return e.details()
+            except Exception as e:
+                return str(e)
+            status_code = upload_basic_result.statusCode
+            if status_code != 1:
+                return f"upload result is not ok. result code:{status_code}" # noqa
+        return ""
+
+    async def upload_file(self, stub, service, upload_init_request,
+                          session_id, file_path, out_file_size, meta_data):
+        '''
+        Encrypt and upload single file, its slots are cancelled if the
+        upload fails.
+
+        Returns:
+            (UploadInitResponse, aes key, hmac key, error message)
+        '''
+        aes_key = crypt.generate_encrypt_key(32).encode('utf-8')
+        hmac_key = crypt.generate_encrypt_key(32).encode('utf-8')
+
+        try:
+            upload_init_result = await stub.UploadInitV2(
+                upload_init_request, metadata=meta_data)
+        except grpc.RpcError as e:
+            error = "Grpc Error:  {}".format(e.details())
+            return None, aes_key, hmac_key, error
+
+        with open(file_path, 'rb') as in_file:
+            out_file = crypt.EncryptReader(in_file, aes_key, hmac_key)
+            error = await self.upload_slots(
+                stub, service, session_id, out_file,
+                upload_init_result.Slots, out_file_size, meta_data)
+        if error:
+            await self.cancel_upload(
+                service, slot_dicts(upload_init_result.Slots),
+                upload_init_request.opCode)
+        return upload_init_result, aes_key, hmac_key, error
+
+    async def transfer_single_file(self, stub, init_result, sender,
+                                   recipients, note, file_path):
+        '''Upload and publish single file of transfer_files'''
+        transfer = self.transfer_service
+        file_uuid = init_result.BaseUUIDs[file_path]
+        meta_data = self.meta_data(file_uuid, init_result.SessionID)
+        out_file_size = crypt.encrypted_size(os.stat(file_path).st_size)
+        upload_init_result, aes_key, hmac_key, error = \
+            await self.upload_file(
+                stub, transfer, transfer.upload_init_request(
+                    init_result.SessionID, file_path, out_file_size,
+                    sender, recipients),
+                init_result.SessionID, file_path, out_file_size, meta_data)
+        if error:
+            return Result(success=False, error_message=error, data=file_path)
+
+        transfer_sent = transfer.uploaded_transfer(
+            upload_init_result, sender, recipients, file_path,
+            out_file_size, aes_key, hmac_key)
+        broadcast_results = await self.broadcast_many(
+            transfer.recipient_transactions(
+                sender, transfer_sent, recipients, note))
+        failed_addresses = [
+            recipient for recipient, broadcast_result
+            in zip(recipients, broadcast_results)
+            if broadcast_result.success is False]
+        if len(failed_addresses) == len(recipients):
+            await self.cancel_upload(
+                transfer, transfer_sent.slots, pb.UploadOpCode.Transfer)
+            return Result(success=False, error_message='The transfer is not published on the blockchain.') # noqa
+
+        broadcast_result = await self.broadcast(
+            transfer.sender_transaction(sender, transfer_sent, note))
+        if broadcast_result.success is False:
+            await self.cancel_upload(
+                transfer, transfer_sent.slots, pb.UploadOpCode.Transfer)
+            return Result(success=False, error_message='The transfer is not published on the blockchain.') # noqa
+
+        transfer_sent = transfer_sent._replace(
+            failedAddresses=failed_addresses)
+        if failed_addresses:
+            return Result(
+                success=False,
+                error_message='The transfer is not published on the blockchain for {} recipients.'.format(len(failed_addresses)), # noqa
+                data=transfer_sent)
+        return Result(success=True, data=transfer_sent)
+
+    async def transfer_files(self, files, sender_user_id,
+                             recipient_addresses, note, callback=None):
+        """
+        Awaitable TransferChain.transfer_files. The files are uploaded at
+        the same time.
+
+        Returns:
+            Result object, payload is [Result of datastructures.TransferSent]
+
+        Example:
+            -
+        ```
+        result = await tc.transfer_files(
+            files=[file_path],
+            sender_user_id=user.id,
+            recipient_addresses=[user.random_address().Key['Address']],
+            note='test note')
+        ```
+        """
+        assert list == type(recipient_addresses), 'recipient adddress must be list' # noqa
+        assert len(recipient_addresses) > 0, 'recipient_addresses is required'
+        assert len(files) > 0, 'files required'
+        if callback is not None:
+            assert callable(callback), 'callback is not a function'
+
+        sender = self.get_user(sender_user_id).random_address()
+        transfer = self.transfer_service
+        stub = self.get_stub()
+        meta_data = self.meta_data()
+        try:
+            init_result = await stub.TransferInitV2(
+                transfer.transfer_init_request(
+                    files, recipient_addresses, note),
+                metadata=meta_data)
+        except grpc.RpcError as e:
+            error_message = "transfer init request error: {}".format(
+                e.details())
+            return Result(success=False, error_message=error_message)
+
+        async def upload(file_path):
+            async with self.get_semaphore():
+                try:
+                    result = await self.transfer_single_file(
+                        self.get_stub(), init_result, sender,
+                        recipient_addresses, note, file_path)
+                except Exception as e:
+                    result = Result(
+                        success=False, error_message=str(e), data=file_path)
+            if callback:
+                callback(result)
+            return result
+
+        results = await asyncio.gather(*[upload(f) for f in files])
+
+        try:
+            await stub.TransferFinishV2(
+                pb.TransferFinishRequest(
+                    SessionID=init_result.SessionID,
+                    UserID=self.config.user_id,
+                    WalletID=self.config.wallet_id), metadata=meta_data)
+        except grpc.RpcError as e:
+            # partly published uploads are cancelled too
+            for result in results:
+                if isinstance(result.data, TransferSent):
+                    await self.cancel_upload(
+                        transfer, result.data.slots,
+                        pb.UploadOpCode.Transfer)
+            error_message = "transfer finish request error: {}".format(
+                e.details())
+            return Result(success=False, error_message=error_message)
+        return Result(success=True, data=list(results))
+
+    async def storage_single_file(self, stub, init_result, user,
+                                  file_object):
+        '''Upload and publish single file of storage_upload'''
+        storage = self.storage_service
+        file_path = str(file_object)
+        meta_data = self.meta_data(
+            init_result.BaseUUIDs[file_path], init_result.SessionID)
+        sender = user.random_address().Key
+        sender_recipient = user.random_address().Key
+        out_file_size = crypt.encrypted_size(file_object.stat().st_size)
+        upload_init_result, aes_key, hmac_key, error = \
+            await self.upload_file(
+                stub, storage, storage.upload_init_request(
+                    file_object, sender),
+                init_result.SessionID, file_path, out_file_size, meta_data)
+        if error:
+            return Result(success=False, error_message=error, data=file_path)
+
+        tx, storage_result = storage.uploaded_storage(
+            upload_init_result, sender, sender_recipient, file_path,
+            out_file_size, aes_key, hmac_key)
+        broadcast_result = await self.broadcast(tx)
+        if broadcast_result.success is False:
+            await self.cancel_upload(
+                storage, storage_result.slots, pb.UploadOpCode.Storage)
+            return Result(success=False, error_message='The storage is not published on the blockchain.') # noqa
+        return Result(success=True, data=storage_result)
+
+    async def storage_upload(self, user_id, files, callback=None):
+        """
+        Awaitable TransferChain.storage_upload. The files are uploaded at
+        the same time.
+
+        Returns:
+            Result object, payload is
+            [Result of datastructures.StorageResult]
+        """
+        assert len(files) <= constants.STORAGE_MAX_FILE_COUNT, \
+            'file count exceeded'
+        if callback is not None:
+            assert callable(callback), 'callback is not a function'
+
+        file_objects = []
+        total_file_size = 0
+        for file_path in files:
+            file_object = Path(file_path)
+            if not file_object.exists():
+                return Result(success=False, error_message='file does not exist')  # noqa
+            file_objects.append(file_object)
+            total_file_size += file_object.stat().st_size
+
+        user = self.get_user(user_id)
+        storage = self.storage_service
+        stub = self.get_stub()
+        meta_data = self.meta_data()
+        try:
+            init_result = await stub.StorageInitV2(
+                storage.storage_init_request(files, total_file_size),
+                metadata=meta_data)
+        except grpc.RpcError as e:
+            error_message = "storage init request error: {}".format(
+                e.details())
+            return Result(success=False, error_message=error_message)
+
+        async def upload(file_object):
+            async with self.get_semaphore():
+                try:
+                    result = await self.storage_single_file(
+                        self.get_stub(), init_result, user, file_object)
+                except Exception as e:
+                    result = Result(
+                        success=False, error_message=str(e),
+                        data=str(file_object))
+            if callback:
+                callback(result)
+            return result
+
+        results = await asyncio.gather(*[upload(f) for f in file_objects])
+
+        try:
+            await stub.StorageFinishV2(
+                pb.StorageFinishRequest(
+                    SessionID=init_result.SessionID,
+                    UserID=self.config.user_id,
+                    WalletID=self.config.wallet_id), metadata=meta_data)
+        except grpc.RpcError as e:
+            for result in results:
+                if result.success:
+                    await self.cancel_upload(
+                        storage, result.data.slots, pb.UploadOpCode.Storage)
+            error_message = "storage finish request error: {}".format(
+                e.details())
+            return Result(success=False, error_message=error_message)
+        return Result(success=True, data=list(results))
+
+    async def download(self, op_code, file_uid, slots, file_size, file_name,
+                       key_aes, key_hmac, destination):
+        '''Download and decrypt a file with the Download stream'''
+        assert file_uid != "", "invalid file_uuid"
+        assert len(slots) > 0, "invalid slots"
+        assert file_size > 0, "invalid file_size"
+        assert file_name != "", "invalid file_name"
+        assert key_aes != "", "invalid key_aes"
+        assert key_hmac != "", "invalid key_hmac"
+        assert destination != "", "invalid destination"
+        destination_path = Path(destination)
+
+        assert destination_path.exists(), 'destination does not exist'
+        assert destination_path.is_dir(), 'destination must be a folder'
+        destination_file = destination_path.joinpath(file_name)
+
+        loop = asyncio.get_running_loop()
+        async with self.get_semaphore():
+            try:
+                file_chunks = self.get_stub().Download(pb.DownloadRequest(
+                    uuid=file_uid,
+                    Slots=slots,
+                    WalletID=self.config.wallet_id,
+                    UserID=self.config.user_id,
+                    opCode=op_code,
+                ), metadata=self.meta_data())
+                with destination_file.open(mode='wb') as out_file:
+                    writer = crypt.DecryptWriter(
+                        out_file, key_aes.encode('utf-8'),
+                        key_hmac.encode('utf-8'))
+                    async for fc in file_chunks:
+                        await loop.run_in_executor(
+                            None, writer.write, fc.chunk)
+                    await loop.run_in_executor(None, writer.finalize)
+            except grpc.RpcError as e:
+                destination_file.unlink(missing_ok=True)
+                error_message = 'download error:{}'.format(e.details())
+                return Result(success=False, error_message=error_message)
+            except Exception as e:
+                destination_file.unlink(missing_ok=True)
+                return Result(success=False, error_message=str(e))
+        return Result(success=True)
+
+    async def transfer_download(self, file_uid, slots, file_size, file_name,
+                                key_aes, key_hmac, destination):
+        '''Awaitable TransferChain.transfer_download'''
+        return await self.download(
+            pb.UploadOpCode.Transfer, file_uid, slots, file_size, file_name,
+            key_aes, key_hmac, destination)
+
+    async def storage_download(self, file_uid, slots, file_size, file_name,
+                               key_aes, key_hmac, destination):
+        '''Awaitable TransferChain.storage_download'''
+        return await self.download(
+            pb.UploadOpCode.Storage, file_uid, slots, file_size, file_name,
+            key_aes, key_hmac, destination)
+
+    async def close(self):
+        '''Close the grpc channels, the read node threads and the client'''
+        if self.channels is not None:
+            for channel in self.channels:
+                await channel.close()
+            self.channels = self.stubs = None
+        self.read_node_executor.shutdown(wait=True)
+        self.client.close()
@@ -1,7 +1,166 @@
 '''This module enables objects to be published on the blockchain.'''
 
-from tcabci_read_client import HttpClient
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from transferchain import constants
 from transferchain import settings
+from transferchain.logger import get_logger
+from transferchain.datastructures import Result
+
+
+logger = get_logger(__file__)
+
+READ_NODE_CLIENT = None
+READ_NODE_CLIENT_LOCK = threading.Lock()
+
+
+def create_timeout_adapter(pool_size=constants.READ_NODE_POOL_SIZE,
+                           timeout=constants.READ_NODE_TIMEOUT):
+    '''
+    Return a requests HTTPAdapter that keeps pool_size connections alive
+    and gives every request a default timeout.
+    '''
+    from requests.adapters import HTTPAdapter
+
+    class TimeoutHTTPAdapter(HTTPAdapter):
+        def send(self, request, **kwargs):
+            if kwargs.get('timeout') is None:
+                kwargs['timeout'] = self.timeout
+            return super(TimeoutHTTPAdapter, self).send(request, **kwargs)
+
+    adapter = TimeoutHTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    adapter.timeout = timeout
+    return adapter
+
+
+def create_read_node_session(pool_size=constants.READ_NODE_POOL_SIZE,
+                             timeout=constants.READ_NODE_TIMEOUT):
+    '''
+    Return a requests.Session sending every request through
+    create_timeout_adapter.
+    '''
+    import requests
+    session = requests.Session()
+    mount_adapter(session, create_timeout_adapter(
+        pool_size=pool_size, timeout=timeout))
+    return session
+
+
+def mount_adapter(session, adapter):
+    '''Mount adapter on session for http and https'''
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+
+def configure_client_sessions(client, pool_size=constants.READ_NODE_POOL_SIZE,
+                              timeout=constants.READ_NODE_TIMEOUT):
+    """
+    Mount a create_timeout_adapter on every requests.Session attribute of
+    a read node client.
+
+    Parameters:
+        client:
+            tcabci_read_client.HttpClient
+
+        pool_size (int):
+            maximum number of kept-alive connections
+
+        timeout (float):
+            seconds to wait for the read node
+
+    Returns:
+        list of the configured requests.Session objects, empty if the
+        client has none
+    """
+    import requests
+    sessions = [value for value in vars(client).values()
+                if isinstance(value, requests.Session)]
+    adapter = create_timeout_adapter(pool_size=pool_size, timeout=timeout)
+    for session in sessions:
+        mount_adapter(session, adapter)
+    return sessions
+
+
+def create_read_node_client(pool_size=constants.READ_NODE_POOL_SIZE,
+                            timeout=constants.READ_NODE_TIMEOUT):
+    """
+    Create a read node client. Its requests go through a keep-alive
+    connection pool of pool_size connections with a default timeout, so
+    the client can be shared by the upload threads. A client taking a
+    `session` argument gets a create_read_node_session, otherwise the
+    sessions it holds are configured, see configure_client_sessions.
+    A client with neither is used as it is and a warning is logged.
+
+    Parameters:
+        pool_size (int):
+            maximum number of kept-alive connections
+
+        timeout (float):
+            seconds to wait for the read node
+
+    Returns:
+        tcabci_read_client.HttpClient
+
+    Example:
+        -
+    ```
+        from transferchain import blockchain
+        client = blockchain.create_read_node_client(pool_size=20)
+    ```
+    """
+    from tcabci_read_client import HttpClient
+    if 'session' in inspect.signature(HttpClient).parameters:
+        return HttpClient(
+            settings.READ_NODE_ADDRESS, session=create_read_node_session(
+                pool_size=pool_size, timeout=timeout))
+    client = HttpClient(settings.READ_NODE_ADDRESS)
+    if not configure_client_sessions(
+            client, pool_size=pool_size, timeout=timeout):
+        logger.warning(
+            'read node client has no requests.Session, its connection '
+            'pool and timeout are not configured')
+    return client
+
+
+def get_read_node_client():
+    '''
+    Return the shared read node client.
+    It is created on the first call and reused by every later call.
+    '''
+    global READ_NODE_CLIENT
+    if READ_NODE_CLIENT is not None:
+        return READ_NODE_CLIENT
+    with READ_NODE_CLIENT_LOCK:
+        if READ_NODE_CLIENT is None:
+            READ_NODE_CLIENT = create_read_node_client()
+    return READ_NODE_CLIENT
+
+
+def configure_read_node_client(pool_size=constants.READ_NODE_POOL_SIZE,
+                               timeout=constants.READ_NODE_TIMEOUT):
+    """
+    Replace the shared read node client with one using the given
+    pool size and timeout.
+
+    Parameters:
+        pool_size (int):
+            maximum number of kept-alive connections
+
+        timeout (float):
+            seconds to wait for the read node
+
+    Example:
+        -
+    ```
+        from transferchain import blockchain
+        blockchain.configure_read_node_client(pool_size=20, timeout=10)
+    ```
+    """
+    global READ_NODE_CLIENT
+    client = create_read_node_client(pool_size=pool_size, timeout=timeout)
+    with READ_NODE_CLIENT_LOCK:
+        READ_NODE_CLIENT = client
 
 
 def broadcast(transaction):
@@ -43,6 +202,50 @@ def broadcast(transaction):
         result = broadcast(tx)
     ```
     """
-    client = HttpClient(settings.READ_NODE_ADDRESS)
+    client = get_read_node_client()
     response = client.broadcast(**transaction)
     return response
+
+
+def safe_broadcast(transaction):
+    '''broadcast, an exception becomes a failed datastructures.Result'''
+    try:
+        return broadcast(transaction)
+    except Exception as e:
+        return Result(success=False, error_message=str(e))
+
+
+def broadcast_many(transactions, workers=constants.BROADCAST_WORKERS):
+    """
+    Broadcast the transactions at the same time, at most workers of them.
+    An exception raised by a broadcast becomes a failed result, it does
+    not stop the others.
+
+    Parameters:
+        transactions (list):
+            dictionary objects from the create_transaction method
+
+        workers (int):
+            number of broadcasts running at the same time
+
+    Returns:
+        list of tcabci_read_client.client.HttpResultTuple or
+        datastructures.Result, in the order of transactions.
+        Both have success and error_message attributes.
+
+    Example:
+        -
+    ```
+        from transferchain.blockchain import broadcast_many
+
+        # txs -> list of create_transaction results
+        results = broadcast_many(txs)
+        failed = [tx for tx, result in zip(txs, results)
+                  if not result.success]
+    ```
+    """
+    if len(transactions) < 2 or workers < 2:
+        return [safe_broadcast(tx) for tx in transactions]
+    with ThreadPoolExecutor(
+            max_workers=min(workers, len(transactions))) as executor:
+        return list(executor.map(safe_broadcast, transactions))
@@ -0,0 +1,54 @@
+'''
+Chunk sizes of UploadBasicV4 streams.
+
+A slot is sent with the chunk size given by the server in
+UploadSlot.ChunkSize. Without it the size follows the stream: grpc asks
+for the next message only when the previous one fits into the flow
+control window, so the time between two messages gives the throughput,
+and the next chunk is sized to take about UPLOAD_CHUNK_TARGET_TIME.
+'''
+
+from transferchain import constants
+
+
+# chunk sizes are multiples of this
+CHUNK_ALIGN = 64 * 1024
+
+
+class ChunkSizer(object):
+    '''
+    Chunk size of a single slot stream. `chunk_size` fixes it, otherwise
+    it starts at UPLOAD_CHUNK_SIZE and is updated after each message.
+    '''
+
+    def __init__(self, chunk_size=None,
+                 min_size=constants.UPLOAD_MIN_CHUNK_SIZE,
+                 max_size=constants.UPLOAD_MAX_CHUNK_SIZE,
+                 target_time=constants.UPLOAD_CHUNK_TARGET_TIME):
+        self.fixed = bool(chunk_size)
+        self.size = chunk_size or constants.UPLOAD_CHUNK_SIZE
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_time = target_time
+        # bytes per second, moving average
+        self.rate = None
+
+    @classmethod
+    def for_slot(cls, slot, chunk_size=None):
+        '''Return the sizer of a slot, its ChunkSize is used if it is set'''
+        return cls(chunk_size=slot.ChunkSize or chunk_size)
+
+    def update(self, size, elapsed):
+        '''Record that a message of size bytes was sent in elapsed seconds'''
+        if self.fixed or size <= 0:
+            return
+        if elapsed <= 0:
+            # taken by the flow control window, the link is not the limit
+            size = self.size * 2
+        else:
+            rate = size / elapsed
+            self.rate = rate if self.rate is None else \
+                0.5 * self.rate + 0.5 * rate
+            size = int(self.rate * self.target_time)
+        size = min(max(size, self.min_size), self.max_size)
+        self.size = max(size // CHUNK_ALIGN * CHUNK_ALIGN, CHUNK_ALIGN)
@@ -1,19 +1,27 @@
 import uuid
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from transferchain import restore
+from transferchain import transaction
+from transferchain import blockchain
+from transferchain import grpc_client
+from transferchain import constants
 from transferchain.db import DB
+from transferchain.users import UserRegistry
 from transferchain.logger import get_logger
+from transferchain.utils import LazyModule
 from transferchain.config import create_config
-from transferchain.crypt import crypt, bip39
+from transferchain.crypt import crypt, bip39, keys
 from transferchain.datastructures import (
     Result, Address, User)
 from transferchain.addresses import (
     generate_user_addresses, generate_sub_user_addresses,
-    get_user_password)
+    get_user_password, create_key_executor)
 from transferchain.transfer import Transfer
 from transferchain.storage import Storage
-from transferchain.protobuf import service_pb2 as pb
 
+pb = LazyModule('transferchain.protobuf.service_pb2')
 
 logger = get_logger(__file__)
 
@@ -24,18 +32,233 @@ class TransferChain(object):
     You can give `db_path` from outside when creating the TransferChain
     instance.If you do not, it creates its own db as tc.db in the folder
     where it is run.The user's master addresses and sub user addresses
-    are kept in this db.
+    are kept in this db. Call `close` when the instance is no longer
+    needed.
+
+    Every parameter is an optional keyword argument, the defaults are in
+    the constants module.
+
+    Parameters:
+        config (datastructures.Config):
+            prebuilt config, config.create_config is not called
+
+        db_path (str):
+            path of the user db, tc.db by default
+
+        wallet_cache_ttl (int):
+            seconds the wallet id is cached next to the db, so a warm
+            start makes no wallet api request
+
+        stream_upload (bool):
+            encrypt files while they are uploaded, True by default.
+            False encrypts each file into a temporary file first
+
+        max_workers (int):
+            number of files uploaded at the same time, on one thread
+            pool shared by transfers and storage uploads
+
+        slot_workers (int):
+            number of slots of a single file uploaded at the same time,
+            see upload.SlotUploadMixin
+
+        upload_chunk_size (int):
+            fixed upload chunk size. By default chunks follow the
+            throughput of each slot stream unless the server sets the
+            slot chunk size
+
+        crypt_workers (int):
+            number of threads encrypting or decrypting a file, the output
+            is the same for any number of them
+
+        ranged_download (bool):
+            download files as parallel DownloadV4 byte ranges. An
+            interrupted ranged download is resumed by downloading it
+            again
+
+        download_workers (int):
+            number of byte ranges downloaded at the same time
+
+        read_node_pool_size (int):
+            connection pool size of the read node client shared by
+            broadcasts and restores
+
+        read_node_timeout (float):
+            seconds to wait for the read node
+
+        broadcast_workers (int):
+            number of recipient transactions of a transfer broadcast at
+            the same time
+
+        restore_page_size (int):
+            number of sub users restored per page. The height of the last
+            restored page is kept next to the db, so `sync_sub_users`
+            only fetches the sub users added since
+
+        restore_workers (int):
+            number of batches of sub user addresses fetched at the same
+            time
+
+        restore_batch_size (int):
+            number of sub users whose addresses are fetched in one batch
+
+        grpc_channels (int):
+            number of grpc channels shared by all grpc calls, used
+            round-robin
+
+        grpc_keepalive_time, grpc_keepalive_timeout,
+        grpc_max_message_size, grpc_window_size, grpc_max_attempts,
+        grpc_compression:
+            grpc channel options, see grpc_client.channel_options
+
+        grpc_channel_factory (function):
+            returns a grpc.Channel, replaces the channel options
+
+        address_workers (int):
+            number of processes deriving the 100 sub address keys of a
+            new user. They are spawned when the first user is added and
+            kept until `close`, see addresses.create_key_executor
+
+        key_cache_size (int):
+            number of derived keys kept in memory, see
+            keys.set_key_cache_size. Off by default and cleared by
+            `close`
+
+        builder_cache_size (int):
+            number of senders whose transaction signing key and nacl
+            boxes are kept in memory, see
+            transaction.set_builder_cache_size. Off by default and
+            cleared by `close`
+
+        user_cache_size (int):
+            number of users kept in memory. Users are decrypted from the
+            db when they are first used, their addresses are kept in a
+            compact datastructures.AddressTable
+
+    Example:
+        -
+    ```
+        from transferchain.client import TransferChain
+        tc = TransferChain(db_path='/tmp/tc.db', max_workers=8)
+        tc.load_users()
+        # transfer files...
+        tc.close()
+    ```
     '''
-    def __init__(self, *args, **kwargs):
-        self.config = create_config()
+    def __init__(self, config=None, **kwargs):
+        self.config = config or create_config(
+            db_path=kwargs.get('db_path'),
+            wallet_cache_ttl=kwargs.get(
+                'wallet_cache_ttl', constants.WALLET_CACHE_TTL))
         self.db_path = kwargs.get('db_path') or self.config.db_path
         self.db = DB(self.db_path)
-        self.transfer_service = Transfer(self.config)
-        self.storage_service = Storage(self.config)
-        self.users = {}
+        self.executor = ThreadPoolExecutor(
+            max_workers=kwargs.get('max_workers') or
+            constants.UPLOAD_MAX_WORKERS,
+            thread_name_prefix='transferchain-upload')
+        stream_upload = kwargs.get('stream_upload', True)
+        slot_workers = kwargs.get('slot_workers') or \
+            constants.UPLOAD_SLOT_WORKERS
+        ranged_download = kwargs.get('ranged_download', False)
+        download_workers = kwargs.get('download_workers') or \
+            constants.DOWNLOAD_WORKERS
+        crypt_workers = kwargs.get('crypt_workers') or \
+            constants.CRYPT_WORKERS
+        upload_chunk_size = kwargs.get('upload_chunk_size')
+        grpc_options = {
+            key[len('grpc_'):]: kwargs[key] for key in (
+                'grpc_keepalive_time', 'grpc_keepalive_timeout',
+                'grpc_max_message_size', 'grpc_window_size',
+                'grpc_max_attempts', 'grpc_compression')
+            if kwargs.get(key) is not None}
+        if grpc_options or kwargs.get('grpc_channels') or \
+           kwargs.get('grpc_channel_factory'):
+            grpc_client.configure_client(
+                channels=kwargs.get('grpc_channels') or
+                constants.GRPC_CHANNELS,
+                channel_factory=kwargs.get('grpc_channel_factory'),
+                **grpc_options)
+        if kwargs.get('read_node_pool_size') or \
+           kwargs.get('read_node_timeout'):
+            blockchain.configure_read_node_client(
+                pool_size=kwargs.get('read_node_pool_size') or
+                constants.READ_NODE_POOL_SIZE,
+                timeout=kwargs.get('read_node_timeout') or
+                constants.READ_NODE_TIMEOUT)
+        self.transfer_service = Transfer(
+            self.config, stream_upload=stream_upload,
+            executor=self.executor, slot_workers=slot_workers,
+            ranged_download=ranged_download,
+            download_workers=download_workers,
+            crypt_workers=crypt_workers,
+            chunk_size=upload_chunk_size,
+            broadcast_workers=kwargs.get('broadcast_workers') or
+            constants.BROADCAST_WORKERS)
+        self.storage_service = Storage(
+            self.config, stream_upload=stream_upload,
+            executor=self.executor, slot_workers=slot_workers,
+            ranged_download=ranged_download,
+            download_workers=download_workers,
+            crypt_workers=crypt_workers,
+            chunk_size=upload_chunk_size)
+        self.restore_workers = kwargs.get('restore_workers') or \
+            constants.RESTORE_WORKERS
+        self.restore_batch_size = kwargs.get('restore_batch_size') or \
+            constants.RESTORE_BATCH_SIZE
+        self.restore_page_size = kwargs.get('restore_page_size') or \
+            constants.RESTORE_PAGE_SIZE
+        # number of processes deriving the sub address keys of a user
+        self.address_workers = kwargs.get('address_workers') or \
+            constants.ADDRESS_WORKERS
+        self.address_executor = None
+        self.address_executor_lock = threading.Lock()
+        if kwargs.get('key_cache_size') is not None:
+            keys.set_key_cache_size(kwargs['key_cache_size'])
+        if kwargs.get('builder_cache_size') is not None:
+            transaction.set_builder_cache_size(kwargs['builder_cache_size'])
+        self.users = UserRegistry(
+            self.read_user,
+            max_size=kwargs.get('user_cache_size') or
+            constants.USER_CACHE_SIZE)
 
         self.master_user = None
 
+    def close(self):
+        """
+        Wait for the running uploads, release the upload thread pool and
+        the address processes, close the user database and clear the
+        derived key and transaction builder caches.
+
+        Example:
+            -
+        ```
+        from transferchain.client import TransferChain
+        tc = TransferChain(max_workers=8)
+        tc.load_users()
+        # transfer files...
+        tc.close()
+        ```
+        """
+        self.executor.shutdown(wait=True)
+        if self.address_executor is not None:
+            self.address_executor.shutdown(wait=True)
+            self.address_executor = None
+        self.db.close()
+        keys.clear_key_cache()
+        transaction.clear_builder_cache()
+
+    def get_address_executor(self):
+        '''
+        Return the process pool deriving the sub address keys, None with
+        a single address worker. It is created on first use.
+        '''
+        if self.address_workers < 2:
+            return None
+        with self.address_executor_lock:
+            if self.address_executor is None:
+                self.address_executor = create_key_executor(
+                    self.address_workers)
+            return self.address_executor
+
     def add_master_user(self):
         """
         If there are no mnemonics in the config, be sure to call this
@@ -54,11 +277,13 @@ class TransferChain(object):
         ```
         """
         mnemonics = bip39.create_mnomonics()
-        result = generate_user_addresses(self.config.user_id, mnemonics)
+        result = generate_user_addresses(
+            self.config.user_id, mnemonics, workers=self.address_workers,
+            executor=self.get_address_executor())
         if result.success is False:
             return result
 
-        user = result.data
+        user = result.data.compact()
         logger.info("Mnemonics-> %s" % mnemonics)
         self.config = self.config._replace(mnemonics=mnemonics)
         self.save_user(str(self.config.user_id), user)
@@ -66,6 +291,48 @@ class TransferChain(object):
         self.master_user = user
         return Result(success=True, data=user)
 
+    def iter_restore_sub_users(self, incremental=False):
+        """
+        Fetch the sub users from the blockchain page by page and write
+        each of them to the db as it arrives. Only a page of them is
+        kept in memory. The height of the last restored page is kept in
+        a restore.RestoreCheckpoint next to the db.
+
+        Parameters:
+            incremental (bool):
+                fetch only the sub users added after the checkpoint
+
+        Returns:
+            Generator of Result objects, payload is datastructures.User.
+            It stops after the first failed Result.
+
+        Example:
+            -
+        ```
+        from transferchain.client import TransferChain
+        tc = TransferChain()
+        result = tc.restore_master_user()
+        if result.success
+            for user_result in tc.iter_restore_sub_users():
+                print(user_result.success)
+        ```
+        """
+        user_password = get_user_password(self.config.user_id)
+        checkpoint = restore.RestoreCheckpoint.from_db_path(self.db_path)
+        height, offset = 0, 0
+        if incremental:
+            height, offset = checkpoint.get(self.config.user_id)
+        for result in restore.iter_sub_users_with_mnemonics(
+                self.config.mnemonics, user_password, self.config.user_id,
+                page_size=self.restore_page_size, height=height,
+                offset=offset, workers=self.restore_workers,
+                batch_size=self.restore_batch_size, checkpoint=checkpoint):
+            if result.success:
+                user = result.data
+                self.save_user(str(user.id), user)
+                self.users[str(user.id)] = user.compact()
+            yield result
+
     def restore_sub_users(self):
         """
         If you have mnemonics and have created a master user,
@@ -85,15 +352,38 @@ class TransferChain(object):
             tc.restore_sub_users()  # master user is required for this
         ```
         """
-        user_password = get_user_password(self.config.user_id)
-        result = restore.restore_sub_user_with_mnemonics(
-            self.config.mnemonics, user_password, self.config.user_id)
-        if result.success is False:
-            return result
-        for user in result.data:
-            self.save_user(str(user.id), user)
-            self.users[str(user.id)] = user
-        return result
+        users = []
+        for result in self.iter_restore_sub_users():
+            if result.success is False:
+                return result
+            users.append(result.data)
+        return Result(success=True, data=users)
+
+    def sync_sub_users(self):
+        """
+        Fetch the sub users added since the last restore_sub_users or
+        sync_sub_users call and write them to the db. Without a previous
+        restore all sub users are fetched.
+
+        Returns:
+            Result object, payload is [datastructures.User...] of the
+            new sub users
+
+        Example:
+            -
+        ```
+        from transferchain.client import TransferChain
+        tc = TransferChain()
+        tc.load_users()
+        result = tc.sync_sub_users()
+        ```
+        """
+        users = []
+        for result in self.iter_restore_sub_users(incremental=True):
+            if result.success is False:
+                return result
+            users.append(result.data)
+        return Result(success=True, data=users)
 
     def restore_master_user(self):
         """
@@ -117,7 +407,7 @@ class TransferChain(object):
             self.config.mnemonics, user_password, self.config.user_id)
         if result.success is False:
             return result
-        user = result.data
+        user = result.data.compact()
         self.master_user = user
         self.save_user(str(self.config.user_id), user)
         self.users[str(self.config.user_id)] = user
@@ -150,13 +440,16 @@ class TransferChain(object):
         master_user_address = self.master_user.master_address
         result = generate_sub_user_addresses(
             self.config.user_id, master_user_address,
-            self.config.mnemonics, sub_user_id)
+            self.config.mnemonics, sub_user_id,
+            workers=self.address_workers,
+            executor=self.get_address_executor())
         if result.success is False:
             return result
 
-        self.save_user(sub_user_id, result.data)
-        self.users[sub_user_id] = result.data
-        return Result(success=True, data=result.data)
+        user = result.data.compact()
+        self.save_user(sub_user_id, user)
+        self.users[sub_user_id] = user
+        return Result(success=True, data=user)
 
     def get_user(self, user_id):
         """
@@ -187,9 +480,11 @@ class TransferChain(object):
         When creating the TransferChain instance,
         this function should be used to retrieve
         users from the db and import them into the instance.
+        Only the user ids are read here, a user is decrypted
+        when it is first used.
 
         Returns:
-            [datastructures.User]
+            UserRegistry, a dictionary of datastructures.User by user id
 
         Example:
             -
@@ -200,20 +495,36 @@ class TransferChain(object):
         ```
         """
 
-        users = self.db.get_all()
-        for user_id, data in users.items():
-            user_data = json.loads(crypt.decrypt_byte(
-                data, self.config.mnemonics))
-            addresses = []
-            for address in user_data.pop('addresses'):
-                addresses.append(Address(**address))
-            user_data['addresses'] = addresses
-            user = User(**user_data)
-            self.users[user_id] = user
+        self.users.add_ids(self.db.keys())
+        master_user_id = str(self.config.user_id)
+        if master_user_id in self.users:
+            user = self.users[master_user_id]
             if user.master:
                 self.master_user = user
         return self.users
 
+    def read_user(self, user_id):
+        """
+        Decrypt a user from the db.
+
+        Parameters:
+            user_id (str):
+                sub user id (uuid)
+
+        Returns:
+            A datastructures.User
+        """
+        data = self.db.get(user_id)
+        if data is None:
+            raise KeyError(user_id)
+        user_data = json.loads(crypt.decrypt_byte(
+            data, self.config.mnemonics))
+        addresses = []
+        for address in user_data.pop('addresses'):
+            addresses.append(Address(**address))
+        user_data['addresses'] = addresses
+        return User(**user_data).compact()
+
     def save_user(self, sub_user_id, user):
         """
         Use this function to add sub users under the master
@@ -258,7 +569,10 @@ class TransferChain(object):
         but if you give it, it is called by taking the result of
         each uploaded file as a parameter. There is a TransferSent
         object in the result. Save these objects so that you can
-        delete them later or take another action.
+        delete them later or take another action. If the transfer could
+        not be published for some recipients, the result is unsuccessful
+        and TransferSent.failedAddresses lists them; retry with
+        transfer_service.broadcast_to_recipients without uploading again.
 
         Parameters:
            files:
@@ -3,17 +3,24 @@
 import os
 import uuid
 from transferchain import utils
+from transferchain import constants
 from transferchain import exceptions
 from transferchain.datastructures import Config
-from transferchain.wallet import create_wallet, get_wallet_info
+from transferchain.wallet import (
+    WalletCache, create_wallet, get_wallet_info)
 
 
-def create_config():
+def create_config(db_path=None, wallet_cache_ttl=constants.WALLET_CACHE_TTL):
     """
     This function returns the config object.It takes parameters from env.
 
     If TRANSFERCHAIN_WALLET_UUID is empty, it is automatic generated.
 
+    Wallet ids are cached for `wallet_cache_ttl` seconds in tc.wallet.json
+    next to the db, a warm cache needs no wallet api request. Without
+    TRANSFERCHAIN_WALLET_UUID the wallet created by a previous call is
+    reused. Give `wallet_cache_ttl=0` to disable the cache.
+
     If there are no TRANSFERCHAIN_MNEMONICS, call the client.add_master_user.
 
     If give the TRANSFERCHAIN_MNEMONICS and already have an account you call
@@ -35,6 +42,12 @@ def create_config():
         TRANSFERCHAIN_MNEMONICS (str):
             account mnemonics
 
+        db_path (str):
+            optional, user db path. default is tc.db in the working folder
+
+        wallet_cache_ttl (int):
+            optional, seconds a cached wallet id is used
+
     Returns:
         datastructers.Config
 
@@ -58,22 +71,38 @@ def create_config():
         raise exceptions.ValidationError(
             "config error: invalid api token or api secret")
 
-    db_path = os.path.join(os.getcwd(), "tc.db")
+    db_path = db_path or os.path.join(os.getcwd(), "tc.db")
     conf = Config(api_token=api_token, api_secret=api_secret,
                   db_path=db_path)
+    cache = None
+    if wallet_cache_ttl:
+        cache = WalletCache.from_db_path(db_path, ttl=wallet_cache_ttl)
 
     wallet_uuid = os.environ.get('TRANSFERCHAIN_WALLET_UUID')
+    if not wallet_uuid and cache is not None:
+        wallet_uuid = cache.created_wallet(user_id)
+
     if not wallet_uuid:
         wallet_uuid = str(uuid.uuid4())
         result = create_wallet(conf, wallet_uuid)
         if result.success is False:
             raise exceptions.ValidationError(result.error_message)
         wallet_id = result.wallet_id
+        if cache is not None:
+            cache.set(user_id, wallet_uuid, wallet_id, created=True)
     else:
         if not utils.is_valid_uuid(wallet_uuid):
             raise exceptions.ValidationError('invalid wallet uuid')
-        wallet_info = get_wallet_info(conf, wallet_uuid)
-        wallet_id = wallet_info.id
+        wallet_id = None
+        if cache is not None:
+            wallet_id = cache.get(user_id, wallet_uuid)
+        if wallet_id is None:
+            wallet_info = get_wallet_info(conf, wallet_uuid)
+            if wallet_info.success is False:
+                raise exceptions.ValidationError(wallet_info.error_message)
+            wallet_id = wallet_info.id
+            if cache is not None:
+                cache.set(user_id, wallet_uuid, wallet_id)
 
     mnemonics = os.environ.get('TRANSFERCHAIN_MNEMONICS', '')
     # if not mnemonics or len(mnemonics.split('')) != 24:
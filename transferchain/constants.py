@@ -1,7 +1,84 @@
 '''Constants in the module are written here.'''
 
+# first chunk size of an upload stream, see chunking module
 UPLOAD_CHUNK_SIZE = 1 * 1024 * 1024
 
+# bounds of adaptive upload chunk sizes
+UPLOAD_MIN_CHUNK_SIZE = 256 * 1024
+UPLOAD_MAX_CHUNK_SIZE = 3 * 1024 * 1024
+
+# seconds an adaptive upload chunk should take to send
+UPLOAD_CHUNK_TARGET_TIME = 0.25
+
+# number of files uploaded at the same time
+UPLOAD_MAX_WORKERS = 4
+
+# number of slots of a single file uploaded at the same time
+UPLOAD_SLOT_WORKERS = 1
+
+# number of byte ranges of a file downloaded at the same time
+DOWNLOAD_WORKERS = 4
+
+# size of a single DownloadV4 range
+DOWNLOAD_RANGE_SIZE = 8 * 1024 * 1024
+
+# number of threads encrypting or decrypting a temporary file
+CRYPT_WORKERS = 1
+
+# kept-alive connections of the shared read node client
+READ_NODE_POOL_SIZE = 10
+
+# seconds to wait for the read node
+READ_NODE_TIMEOUT = 30
+
+# number of transfer transactions broadcast at the same time
+BROADCAST_WORKERS = 8
+
+# sub users fetched with one tx_search during a restore
+RESTORE_PAGE_SIZE = 100
+
+# threads fetching the address transactions of sub users during a restore
+RESTORE_WORKERS = 8
+
+# sub users whose address transactions are fetched with one tx_search
+RESTORE_BATCH_SIZE = 50
+
+# number of processes deriving the sub address keys of a user
+ADDRESS_WORKERS = 1
+
+# fewer keys are derived serially even with address workers, a spawned
+# worker takes about as long to start as 50 serial key derivations
+ADDRESS_PARALLEL_MIN_KEYS = 50
+
+# number of decrypted users kept in memory
+USER_CACHE_SIZE = 1024
+
+# seconds a cached wallet id is used, 0 disables the wallet cache
+WALLET_CACHE_TTL = 24 * 60 * 60
+
+# seconds to wait for the wallet api
+WALLET_REQUEST_TIMEOUT = 30
+
+# files uploaded or downloaded at the same time by AsyncTransferChain
+ASYNC_MAX_CONCURRENCY = 100
+
+# threads running read node calls of AsyncTransferChain
+ASYNC_READ_NODE_WORKERS = 16
+
+# number of grpc channels used round-robin
+GRPC_CHANNELS = 1
+
+# milliseconds between grpc keepalive pings, servers reject pings sent
+# more often than every 5 minutes by default
+GRPC_KEEPALIVE_TIME = 5 * 60 * 1000
+
+# milliseconds to wait for a grpc keepalive ping ack
+GRPC_KEEPALIVE_TIMEOUT = 20 * 1000
+
+# maximum size of a sent or received grpc message, DownloadV4 chunks
+# are up to DOWNLOAD_RANGE_SIZE
+GRPC_MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
 SORT_TYPE_ASC = "ASC"
 SORT_TYPE_DESC = "DESC"
 
@@ -1,19 +1,28 @@
 import os
 import hmac
+import collections
 import hashlib
-import ed25519
 import secrets
-import nacl.secret
-import nacl.utils
-from nacl.public import PrivateKey, Box, PublicKey
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
+from concurrent.futures import ThreadPoolExecutor
+from transferchain.utils import LazyModule
 from transferchain.crypt import address
+from transferchain.crypt import signature
+
+nacl_secret = LazyModule('nacl.secret')
+nacl_utils = LazyModule('nacl.utils')
+nacl_public = LazyModule('nacl.public')
+hashes = LazyModule('cryptography.hazmat.primitives.hashes')
+ciphers = LazyModule('cryptography.hazmat.primitives.ciphers')
+backends = LazyModule('cryptography.hazmat.backends')
 
 
 V1 = 0x01
 IV_SIZE = 16
+HMAC_SIZE = 64
+# read size of the file encryption and decryption loops
+BUFFER_SIZE = 1024 * 1024
+# update_into needs room for one more block than the input
+CIPHER_BLOCK_SIZE = 16
 
 
 def encrypt_asymmetric(sender_key_seed, recipient_key, data):
@@ -52,13 +61,24 @@ def encrypt_asymmetric(sender_key_seed, recipient_key, data):
             sender['Seed'], recipient['Address'], message)
     ```
     """
+    return encrypt_with_box(create_box(sender_key_seed, recipient_key), data)
+
+
+def create_box(sender_key_seed, recipient_key):
+    '''
+    Return the nacl Box of encrypt_asymmetric. The shared key is computed
+    once, so a box reused for a recipient skips the key exchange.
+    '''
     recipient_pub_key = address.public_key_encrypt_from_address(recipient_key)
-    sk = PrivateKey(private_key=bytes.fromhex(sender_key_seed))
-    pk = PublicKey(public_key=bytes.fromhex(recipient_pub_key))
-    nonce = nacl.utils.random(nacl.secret.SecretBox.NONCE_SIZE)
-    box = Box(sk, pk)
-    encrypted = box.encrypt(data, nonce)
-    return encrypted
+    sk = nacl_public.PrivateKey(private_key=bytes.fromhex(sender_key_seed))
+    pk = nacl_public.PublicKey(public_key=bytes.fromhex(recipient_pub_key))
+    return nacl_public.Box(sk, pk)
+
+
+def encrypt_with_box(box, data):
+    '''Encrypt data with a create_box box and a random nonce'''
+    nonce = nacl_utils.random(nacl_secret.SecretBox.NONCE_SIZE)
+    return box.encrypt(data, nonce)
 
 
 def decrypt_asymmetric(sender_address, recipient_seed, encrypted_data):
@@ -106,9 +126,9 @@ def decrypt_asymmetric(sender_address, recipient_seed, encrypted_data):
     """
     sender_pub_key = address.public_key_encrypt_from_address(
         sender_address)
-    sk = PrivateKey(private_key=bytes.fromhex(recipient_seed))
-    pk = PublicKey(public_key=bytes.fromhex(sender_pub_key))
-    box = Box(sk, pk)
+    sk = nacl_public.PrivateKey(private_key=bytes.fromhex(recipient_seed))
+    pk = nacl_public.PublicKey(public_key=bytes.fromhex(sender_pub_key))
+    box = nacl_public.Box(sk, pk)
     return box.decrypt(encrypted_data[24:], encrypted_data[:24])
 
 
@@ -138,8 +158,15 @@ def sign(private_key_sign, data):
         result = crypt.sign(pks, b'alles gut')
     ```
     """
-    signing_key = ed25519.SigningKey(bytes.fromhex(private_key_sign))
-    return signing_key.sign(data)
+    return signature.get_backend().sign(bytes.fromhex(private_key_sign), data)
+
+
+def create_signer(private_key_sign):
+    '''
+    Return a function signing data like sign, the signing key is built
+    once.
+    '''
+    return signature.get_backend().signer(bytes.fromhex(private_key_sign))
 
 
 def verify_sign(key_address, data, sign):
@@ -178,9 +205,8 @@ def verify_sign(key_address, data, sign):
     """
     try:
         pub_key = address.public_key_sign_from_address(key_address)
-        verification_key = ed25519.VerifyingKey(bytes.fromhex(pub_key))
-        verification_key.verify(sign, data)
-        return True
+        return signature.get_backend().verify(
+            bytes.fromhex(pub_key), data, sign)
     except Exception:
         return False
 
@@ -231,7 +257,8 @@ def hash_to_32_bytes(input_str):
     ```
     """
     input_bytes = input_str.encode('utf-8')
-    sha256 = hashes.Hash(hashes.SHA256(), backend=default_backend())
+    sha256 = hashes.Hash(
+        hashes.SHA256(), backend=backends.default_backend())
     sha256.update(input_bytes)
     hash_result = sha256.finalize()
     return hash_result
@@ -266,14 +293,16 @@ def encrypt_byte(plaintext, key):
     """
     new_key = hash_to_32_bytes(key)
     iv = os.urandom(IV_SIZE)
-    cipher = Cipher(algorithms.AES(new_key), modes.GCM(iv),
-                    backend=default_backend())
+    cipher = ciphers.Cipher(
+        ciphers.algorithms.AES(new_key), ciphers.modes.GCM(iv),
+        backend=backends.default_backend())
     encryptor = cipher.encryptor()
     ciphertext = encryptor.update(plaintext) + encryptor.finalize()
     return iv + ciphertext + encryptor.tag
 
 
-def decrypt_aesctr_with_hmac(infile, outfile, aes_key, hmac_key):
+def decrypt_aesctr_with_hmac(infile, outfile, aes_key, hmac_key,
+                             buffer_size=BUFFER_SIZE, workers=1):
     """
     Decrypt a file encrypted using AES-CTR mode with HMAC-based
     integrity checks.This function decrypts a file that was
@@ -300,6 +329,12 @@ def decrypt_aesctr_with_hmac(infile, outfile, aes_key, hmac_key):
         hmac_key: HMAC key (str):
             The key used for HMAC-based integrity checks.
 
+        buffer_size: Buffer size (int):
+            The number of bytes decrypted at once.
+
+        workers: Workers (int):
+            The number of threads decrypting buffers at the same time.
+
     Example:
         -
     ```
@@ -319,60 +354,85 @@ def decrypt_aesctr_with_hmac(infile, outfile, aes_key, hmac_key):
         print(f'Error: {e}')
     ```
     """
-    BUFFER_SIZE = 16 * 1024
-    offset = 0
-
     version = infile.read(1)
-    offset += 1
-    if int(version) != V1:
+    if version != "{}".format(V1).encode():
         raise Exception('invalid version')
-
     iv = infile.read(IV_SIZE)
-    offset += IV_SIZE
-
-    cipher = Cipher(algorithms.AES(aes_key), modes.CTR(iv))
-    decryptor = cipher.decryptor()
+    if len(iv) != IV_SIZE:
+        raise Exception('hmac not found')
 
     hmc = hmac.new(hmac_key, None, hashlib.sha512)
     hmc.update(iv)
-    hmac_size = 64
 
-    file_stat = os.stat(infile.name)
-    reader_size = file_stat.st_size
+    if workers > 1:
+        infile_hmac = bytearray()
+        blocks = _ciphertext_blocks(
+            infile, _block_aligned(buffer_size), hmc, infile_hmac)
+        for result in _ctr_transform_parallel(aes_key, iv, blocks, workers):
+            outfile.write(result)
+    else:
+        infile_hmac = _decrypt_aesctr(
+            infile, outfile, aes_key, iv, hmc, buffer_size)
 
-    infile_hmac = None
+    if hmac.compare_digest(hmc.digest(), infile_hmac) is False:
+        raise Exception('invalid hmac')
+
+
+def _decrypt_aesctr(infile, outfile, aes_key, iv, hmc, buffer_size):
+    '''Decrypt the V1 body in a single thread and return its HMAC.'''
+    cipher = ciphers.Cipher(
+        ciphers.algorithms.AES(aes_key), ciphers.modes.CTR(iv))
+    decryptor = cipher.decryptor()
+
+    # the last HMAC_SIZE bytes read may be the digest, they are kept at
+    # the start of the buffer until more data is read
+    data = bytearray(HMAC_SIZE + buffer_size)
+    result = bytearray(buffer_size + CIPHER_BLOCK_SIZE - 1)
+    data_view = memoryview(data)
+    result_view = memoryview(result)
+    pending = 0
     while True:
-        data = infile.read(BUFFER_SIZE)
-        if not data:
+        count = _readinto(infile, data_view[pending:])
+        if not count:
             break
-        limit = len(data)
-
-        if (reader_size < BUFFER_SIZE) \
-           or (offset + BUFFER_SIZE >= reader_size):
-            limit = len(data) - hmac_size
-
-        d = data[0:limit]
-        hmc.update(d)
-        result = decryptor.update(d)
-        outfile.write(result)
-        offset += len(data)
-
-        if offset == reader_size:
-            if len(data) < hmac_size:
-                raise Exception('hmac size error')
-            mac = data[-hmac_size:]
-            if len(data[len(data) - hmac_size:]) == hmac_size:
-                infile_hmac = mac
-                break
-
-    if infile_hmac is None:
+        pending += count
+        limit = pending - HMAC_SIZE
+        if limit <= 0:
+            continue
+        hmc.update(data_view[:limit])
+        count = decryptor.update_into(data_view[:limit], result)
+        outfile.write(result_view[:count])
+        data_view[:HMAC_SIZE] = data_view[limit:pending]
+        pending = HMAC_SIZE
+
+    if pending != HMAC_SIZE:
         raise Exception('hmac not found')
-
-    if hmac.compare_digest(hmc.digest(), infile_hmac) is False:
-        raise Exception('invalid hmac')
+    return bytes(data_view[:HMAC_SIZE])
+
+
+def _ciphertext_blocks(infile, buffer_size, hmc, infile_hmac):
+    '''
+    Yield the ciphertext of a V1 body in buffer_size blocks, in order.
+    Every block is added to hmc, the trailing digest to infile_hmac.
+    '''
+    data = _read_full(infile, buffer_size + HMAC_SIZE)
+    while len(data) == buffer_size + HMAC_SIZE:
+        block = data[:buffer_size]
+        hmc.update(block)
+        yield block
+        data = data[buffer_size:] + _read_full(infile, buffer_size)
+
+    if len(data) < HMAC_SIZE:
+        raise Exception('hmac not found')
+    block = data[:-HMAC_SIZE]
+    if block:
+        hmc.update(block)
+        yield block
+    infile_hmac += data[-HMAC_SIZE:]
 
 
-def encrypt_aesctr_with_hmac(infile, outfile, aes_key, hmac_key):
+def encrypt_aesctr_with_hmac(infile, outfile, aes_key, hmac_key,
+                             buffer_size=BUFFER_SIZE, workers=1):
     """
     Encrypt a file using AES-CTR mode with HMAC-based integrity checks.
     This function encrypts the provided input file using AES-CTR mode
@@ -398,6 +458,12 @@ def encrypt_aesctr_with_hmac(infile, outfile, aes_key, hmac_key):
         hmac_key: HMAC key (str):
             The key used for HMAC-based integrity checks.
 
+        buffer_size: Buffer size (int):
+            The number of bytes encrypted at once.
+
+        workers: Workers (int):
+            The number of threads encrypting buffers at the same time.
+
     Returns:
         Total bytes written (int): The total number of
         bytes written to the output file.
@@ -422,29 +488,446 @@ def encrypt_aesctr_with_hmac(infile, outfile, aes_key, hmac_key):
         print(f'Error: {e}')
     ```
     """
-    BUFFER_SIZE = 16 * 1024
     iv = os.urandom(IV_SIZE)
 
     hmc = hmac.new(hmac_key, None, hashlib.sha512)
-    cipher = Cipher(algorithms.AES(aes_key), modes.CTR(iv))
-    encryptor = cipher.encryptor()
-
     hmc.update(iv)
     outfile.write("{}".format(V1).encode())
     outfile.write(iv)
-    total_count = 0
-    while True:
-        data = infile.read(BUFFER_SIZE)
-        if not data:
-            break
-        ciphertext = encryptor.update(data)
 
+    total_count = 0
+    for ciphertext in _aesctr_blocks(
+            infile, aes_key, iv, buffer_size, workers):
         hmc.update(ciphertext)
         total_count += outfile.write(ciphertext)
     outfile.write(hmc.digest())
     return total_count
 
 
+def hmac_aesctr(infile, aes_key, hmac_key, iv, buffer_size=BUFFER_SIZE,
+                workers=1, stop=None):
+    """
+    Return the HMAC digest that closes the encrypt_aesctr_with_hmac
+    output of a file encrypted with the given IV. The ciphertext is
+    computed and dropped, nothing is written.
+
+    Parameters:
+        infile: Input file (file object):
+            The file to be encrypted.
+
+        aes_key: AES encryption key (bytes):
+            The key used for AES encryption.
+
+        hmac_key: HMAC key (bytes):
+            The key used for HMAC-based integrity checks.
+
+        iv: Initialization vector (bytes):
+            IV_SIZE random bytes.
+
+        buffer_size: Buffer size (int):
+            The number of bytes encrypted at once.
+
+        workers: Workers (int):
+            The number of threads encrypting buffers at the same time.
+
+        stop: Stop event (threading.Event):
+            Optional, once it is set an Exception is raised instead of
+            encrypting the rest of the file.
+
+    Returns:
+        HMAC-SHA512 digest (bytes)
+
+    Example:
+        -
+    ```
+    from transferchain.crypt import crypt
+
+    iv = os.urandom(crypt.IV_SIZE)
+    with open('unencrypted_file.txt', 'rb') as unencrypted_file:
+        digest = crypt.hmac_aesctr(unencrypted_file, aes_key, hmac_key, iv)
+    ```
+    """
+    hmc = hmac.new(hmac_key, None, hashlib.sha512)
+    hmc.update(iv)
+    for ciphertext in _aesctr_blocks(
+            infile, aes_key, iv, buffer_size, workers):
+        if stop is not None and stop.is_set():
+            raise Exception('digest computation is stopped')
+        hmc.update(ciphertext)
+    return hmc.digest()
+
+
+def _aesctr_blocks(infile, aes_key, iv, buffer_size, workers):
+    '''
+    Yield the AES-CTR ciphertext of infile in buffers. With one worker
+    the yielded memoryview is reused, it is valid until the next one.
+    '''
+    if workers > 1:
+        buffer_size = _block_aligned(buffer_size)
+        blocks = iter(lambda: _read_full(infile, buffer_size), b'')
+        yield from _ctr_transform_parallel(aes_key, iv, blocks, workers)
+        return
+
+    cipher = ciphers.Cipher(
+        ciphers.algorithms.AES(aes_key), ciphers.modes.CTR(iv))
+    encryptor = cipher.encryptor()
+
+    data = bytearray(buffer_size)
+    ciphertext = bytearray(buffer_size + CIPHER_BLOCK_SIZE - 1)
+    data_view = memoryview(data)
+    ciphertext_view = memoryview(ciphertext)
+    while True:
+        count = _readinto(infile, data_view)
+        if not count:
+            break
+        count = encryptor.update_into(data_view[:count], ciphertext)
+        yield ciphertext_view[:count]
+
+
+def _ctr_transform(aes_key, iv, offset, data):
+    '''AES-CTR transform data that starts at byte offset of the stream.'''
+    counter = int.from_bytes(iv, 'big') + offset // CIPHER_BLOCK_SIZE
+    counter_iv = (counter % (1 << 128)).to_bytes(IV_SIZE, 'big')
+    cipher = ciphers.Cipher(
+        ciphers.algorithms.AES(aes_key), ciphers.modes.CTR(counter_iv))
+    return cipher.encryptor().update(data)
+
+
+def _ctr_transform_parallel(aes_key, iv, blocks, workers):
+    '''
+    AES-CTR transform the blocks on worker threads and yield the results
+    in order. Every block but the last must be CIPHER_BLOCK_SIZE aligned,
+    at most workers blocks are transformed ahead of the caller.
+    '''
+    offset = 0
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for data in blocks:
+            pending.append(executor.submit(
+                _ctr_transform, aes_key, iv, offset, data))
+            offset += len(data)
+            if len(pending) > workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _block_aligned(size):
+    '''Round size down to a multiple of CIPHER_BLOCK_SIZE.'''
+    return max(CIPHER_BLOCK_SIZE, size - size % CIPHER_BLOCK_SIZE)
+
+
+def _read_full(infile, size):
+    '''Read exactly size bytes from infile, less only at the end.'''
+    data = infile.read(size)
+    while data and len(data) < size:
+        more = infile.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+
+def _readinto(infile, buffer):
+    '''Fill buffer from infile, for file objects without readinto too.'''
+    readinto = getattr(infile, 'readinto', None)
+    if readinto is not None:
+        return readinto(buffer)
+    data = infile.read(len(buffer))
+    buffer[:len(data)] = data
+    return len(data)
+
+
+def encrypted_size(plain_size):
+    """
+    Return the size of the V1 AES-CTR + HMAC output for a plaintext.
+    The output is the version byte, the IV, the ciphertext (same length
+    as the plaintext) and the HMAC-SHA512 digest.
+
+    Parameters:
+        plain_size: Plaintext size (int):
+            The size of the data to be encrypted.
+
+    Returns:
+        Encrypted size (int): The exact size of the encrypted output.
+
+    Example:
+        -
+    ```
+        import os
+        from transferchain.crypt import crypt
+
+        result = crypt.encrypted_size(os.stat('unencrypted_file.txt').st_size)
+    ```
+    """
+    return 1 + IV_SIZE + plain_size + HMAC_SIZE
+
+
+class EncryptReader(object):
+    """
+    File-like object that produces the encrypt_aesctr_with_hmac output
+    of a plaintext file on the fly. The ciphertext is never written to
+    disk, every `read` call encrypts only as much plaintext as needed.
+
+    Parameters:
+        infile: Input file (file object):
+            The file to be encrypted.
+
+        aes_key: AES encryption key (bytes):
+            The key used for AES encryption.
+
+        hmac_key: HMAC key (bytes):
+            The key used for HMAC-based integrity checks.
+
+    Example:
+        -
+    ```
+    from transferchain.crypt import crypt
+
+    aes_key = crypt.generate_encrypt_key(32).encode('utf-8')
+    hmac_key = crypt.generate_encrypt_key(32).encode('utf-8')
+
+    with open('unencrypted_file.txt', 'rb') as unencrypted_file:
+        reader = crypt.EncryptReader(unencrypted_file, aes_key, hmac_key)
+        while True:
+            chunk = reader.read(1024 * 1024)
+            if not chunk:
+                break
+    ```
+    """
+
+    def __init__(self, infile, aes_key, hmac_key):
+        iv = os.urandom(IV_SIZE)
+        cipher = ciphers.Cipher(
+            ciphers.algorithms.AES(aes_key), ciphers.modes.CTR(iv))
+        self.infile = infile
+        self.encryptor = cipher.encryptor()
+        self.hmc = hmac.new(hmac_key, None, hashlib.sha512)
+        self.hmc.update(iv)
+        self.buffer = bytearray("{}".format(V1).encode())
+        self.buffer += iv
+        self.finished = False
+
+    def _fill(self, size):
+        while not self.finished and (size < 0 or len(self.buffer) < size):
+            if size < 0:
+                data = self.infile.read()
+            else:
+                data = self.infile.read(size - len(self.buffer))
+            if not data:
+                self.buffer += self.hmc.digest()
+                self.finished = True
+                break
+            ciphertext = self.encryptor.update(data)
+            self.hmc.update(ciphertext)
+            self.buffer += ciphertext
+
+    def read(self, size=-1):
+        '''Return up to `size` bytes of the encrypted stream.'''
+        self._fill(size)
+        if size < 0 or size > len(self.buffer):
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+class EncryptRangeReader(object):
+    """
+    File-like object that returns the encrypt_aesctr_with_hmac output of
+    a plaintext file from a byte offset of the output on, e.g. the part
+    uploaded to one slot. AES-CTR ciphertext at any position only needs
+    the plaintext at the same position, so readers at different offsets
+    of one file can run at the same time. The digest closing the output
+    is given up front or as a function returning it, which is only
+    called when the digest is read, see hmac_aesctr. Closing the reader
+    closes infile.
+
+    Parameters:
+        infile: Input file (file object):
+            The seekable file to be encrypted.
+
+        aes_key: AES encryption key (bytes):
+            The key used for AES encryption.
+
+        iv: Initialization vector (bytes):
+            The IV the digest is computed with.
+
+        digest: HMAC digest (bytes or function):
+            hmac_aesctr result of the file, or a function returning it,
+            e.g. the result method of a future.
+
+        offset: Offset (int):
+            Position in the encrypted output of the first byte read.
+
+    Example:
+        -
+    ```
+    from transferchain.crypt import crypt
+
+    iv = os.urandom(crypt.IV_SIZE)
+    with open('unencrypted_file.txt', 'rb') as unencrypted_file:
+        digest = crypt.hmac_aesctr(unencrypted_file, aes_key, hmac_key, iv)
+
+    # the second half of the encrypted file
+    size = crypt.encrypted_size(os.stat('unencrypted_file.txt').st_size)
+    reader = crypt.EncryptRangeReader(
+        open('unencrypted_file.txt', 'rb'), aes_key, iv, digest, size // 2)
+    data = reader.read()
+    reader.close()
+    ```
+    """
+
+    def __init__(self, infile, aes_key, iv, digest, offset=0):
+        self.infile = infile
+        self.aes_key = aes_key
+        self.iv = iv
+        self.header = "{}".format(V1).encode() + iv
+        self.digest = digest
+        self.plain_size = os.fstat(infile.fileno()).st_size
+        self.position = offset
+        self.encryptor = None
+
+    def _encryptor(self, plain_offset):
+        '''AES-CTR encryptor positioned at plain_offset of the file'''
+        counter = int.from_bytes(self.iv, 'big') + \
+            plain_offset // CIPHER_BLOCK_SIZE
+        counter_iv = (counter % (1 << 128)).to_bytes(IV_SIZE, 'big')
+        cipher = ciphers.Cipher(
+            ciphers.algorithms.AES(self.aes_key),
+            ciphers.modes.CTR(counter_iv))
+        encryptor = cipher.encryptor()
+        encryptor.update(bytes(plain_offset % CIPHER_BLOCK_SIZE))
+        self.infile.seek(plain_offset)
+        return encryptor
+
+    def read(self, size=-1):
+        '''Return up to `size` bytes of the encrypted output.'''
+        header_size = len(self.header)
+        end = header_size + self.plain_size + HMAC_SIZE
+        if size < 0:
+            size = end
+        size = max(min(size, end - self.position), 0)
+        data = bytearray()
+        if self.position < header_size and size:
+            part = self.header[self.position:self.position + size]
+            data += part
+            self.position += len(part)
+            size -= len(part)
+        plain_offset = self.position - header_size
+        if plain_offset < self.plain_size and size:
+            if self.encryptor is None:
+                self.encryptor = self._encryptor(plain_offset)
+            plaintext = _read_full(
+                self.infile, min(size, self.plain_size - plain_offset))
+            if len(plaintext) != min(size, self.plain_size - plain_offset):
+                raise Exception('file changed while it is encrypted')
+            data += self.encryptor.update(plaintext)
+            self.position += len(plaintext)
+            size -= len(plaintext)
+        if size:
+            if callable(self.digest):
+                self.digest = self.digest()
+            digest_offset = self.position - header_size - self.plain_size
+            part = self.digest[digest_offset:digest_offset + size]
+            data += part
+            self.position += len(part)
+        return bytes(data)
+
+    def close(self):
+        '''Close infile.'''
+        self.infile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class DecryptWriter(object):
+    """
+    File-like object that decrypts the encrypt_aesctr_with_hmac output
+    while it is written, e.g. chunk by chunk as it is downloaded. Only
+    the trailing HMAC-SHA512 digest is held back, the plaintext is
+    written to the output file as soon as it is known. Call `finalize`
+    after the last chunk to verify the digest.
+
+    Exception:
+        If the version is invalid, the digest is missing or the HMAC
+        verification fails, an Exception is raised. The plaintext written
+        until then must be discarded by the caller.
+
+    Parameters:
+        outfile: Decrypted output file (file object):
+            The file to store the decrypted data.
+
+        aes_key: AES encryption key (bytes):
+            The key used for AES decryption.
+
+        hmac_key: HMAC key (bytes):
+            The key used for HMAC-based integrity checks.
+
+    Example:
+        -
+    ```
+    from transferchain.crypt import crypt
+
+    # chunks -> iterable of encrypted bytes
+    with open('decrypted_file.txt', 'wb') as decrypted_file:
+        writer = crypt.DecryptWriter(decrypted_file, aes_key, hmac_key)
+        for chunk in chunks:
+            writer.write(chunk)
+        writer.finalize()
+    ```
+    """
+
+    def __init__(self, outfile, aes_key, hmac_key):
+        self.outfile = outfile
+        self.aes_key = aes_key
+        self.decryptor = None
+        self.hmc = hmac.new(hmac_key, None, hashlib.sha512)
+        self.buffer = bytearray()
+        self.result = bytearray()
+
+    def write(self, data):
+        '''Decrypt `data`, keeping back the bytes that may be the HMAC.'''
+        self.buffer += data
+        if self.decryptor is None:
+            if len(self.buffer) < 1 + IV_SIZE:
+                return len(data)
+            if self.buffer[:1] != "{}".format(V1).encode():
+                raise Exception('invalid version')
+            iv = bytes(self.buffer[1:1 + IV_SIZE])
+            cipher = ciphers.Cipher(
+                ciphers.algorithms.AES(self.aes_key), ciphers.modes.CTR(iv))
+            self.decryptor = cipher.decryptor()
+            self.hmc.update(iv)
+            del self.buffer[:1 + IV_SIZE]
+
+        limit = len(self.buffer) - HMAC_SIZE
+        if limit > 0:
+            if len(self.result) < limit + CIPHER_BLOCK_SIZE - 1:
+                self.result = bytearray(limit + CIPHER_BLOCK_SIZE - 1)
+            with memoryview(self.buffer) as view:
+                ciphertext = view[:limit]
+                self.hmc.update(ciphertext)
+                count = self.decryptor.update_into(ciphertext, self.result)
+                ciphertext.release()
+            with memoryview(self.result) as result_view:
+                self.outfile.write(result_view[:count])
+            del self.buffer[:limit]
+        return len(data)
+
+    def finalize(self):
+        '''Verify the HMAC after the last chunk is written.'''
+        if self.decryptor is None or len(self.buffer) != HMAC_SIZE:
+            raise Exception('hmac not found')
+        if hmac.compare_digest(self.hmc.digest(), bytes(self.buffer)) \
+           is False:
+            raise Exception('invalid hmac')
+
+
 def decrypt_byte(encrypted_data, key):
     """
     Decrypt encrypted data using AES-GCM with a given key.
@@ -474,10 +957,11 @@ def decrypt_byte(encrypted_data, key):
     ```
     """
     new_key = hash_to_32_bytes(key)
-    cipher = Cipher(algorithms.AES(new_key),
-                    modes.GCM(encrypted_data[:IV_SIZE],
-                              encrypted_data[-IV_SIZE:]),
-                    backend=default_backend())
+    cipher = ciphers.Cipher(
+        ciphers.algorithms.AES(new_key),
+        ciphers.modes.GCM(encrypted_data[:IV_SIZE],
+                          encrypted_data[-IV_SIZE:]),
+        backend=backends.default_backend())
     decryptor = cipher.decryptor()
     return decryptor.update(encrypted_data[IV_SIZE:-IV_SIZE]) \
         + decryptor.finalize()
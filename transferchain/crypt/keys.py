@@ -1,8 +1,63 @@
 import hashlib
 import binascii
-import x25519
-import ed25519
+import threading
+from collections import OrderedDict
 import base58
+from transferchain.utils import LazyModule
+from transferchain.crypt import signature
+
+x25519 = LazyModule('x25519')
+
+
+# number of create_keys_with_mnemonic results kept, 0 disables the cache.
+# The cache holds private keys, so it is opt-in, see set_key_cache_size.
+KEY_CACHE_SIZE = 0
+KEY_CACHE = OrderedDict()
+KEY_CACHE_LOCK = threading.Lock()
+
+
+def key_cache_id(keys, password):
+    '''Return the cache key of a mnemonic phrase and a password'''
+    digest = hashlib.sha256()
+    for value in (keys, password):
+        value = value.encode('utf-8')
+        digest.update(len(value).to_bytes(8, 'big'))
+        digest.update(value)
+    return digest.digest()
+
+
+def set_key_cache_size(size):
+    """
+    Set how many derived keys create_keys_with_mnemonic keeps.
+    The least recently used keys above the size are evicted,
+    0 disables the cache. It is disabled by default: the cached keys
+    include the private signing and encryption keys, call
+    clear_key_cache when the session that needed them ends.
+
+    Parameters:
+        size (int):
+            maximum number of cached keys
+
+    Example:
+        -
+    ```
+        from transferchain.crypt import keys
+        keys.set_key_cache_size(1024)
+        # restore users...
+        keys.clear_key_cache()
+    ```
+    """
+    global KEY_CACHE_SIZE
+    with KEY_CACHE_LOCK:
+        KEY_CACHE_SIZE = size
+        while len(KEY_CACHE) > max(size, 0):
+            KEY_CACHE.popitem(last=False)
+
+
+def clear_key_cache():
+    '''Evict every derived key cached by create_keys_with_mnemonic'''
+    with KEY_CACHE_LOCK:
+        KEY_CACHE.clear()
 
 
 def create_keys_with_mnemonic(keys, password):
@@ -25,6 +80,10 @@ def create_keys_with_mnemonic(keys, password):
     5. The generated cryptographic keys, including public and private keys,
     are returned as a dictionary.
 
+    If enabled with set_key_cache_size, the last KEY_CACHE_SIZE results
+    are cached under a SHA-256 hash of the mnemonic phrase and the
+    password until clear_key_cache is called.
+
     Exception:
         If the 'keys' parameter is empty or invalid, an Exception is raised,
         indicating an issue with the provided mnemonic phrase
@@ -50,6 +109,13 @@ def create_keys_with_mnemonic(keys, password):
     if not keys:
         raise Exception('invalid keys')
 
+    cache_id = key_cache_id(keys, password)
+    with KEY_CACHE_LOCK:
+        cached = KEY_CACHE.get(cache_id)
+        if cached is not None:
+            KEY_CACHE.move_to_end(cache_id)
+            return dict(cached)
+
     salt = 'mnemonic{}'.format(password)
     dk = hashlib.pbkdf2_hmac(
         'sha256',
@@ -59,6 +125,13 @@ def create_keys_with_mnemonic(keys, password):
         32)
     seed = binascii.hexlify(dk).decode('utf-8')
     keys = generate_keys(seed)
+
+    with KEY_CACHE_LOCK:
+        if KEY_CACHE_SIZE > 0:
+            KEY_CACHE[cache_id] = dict(keys)
+            KEY_CACHE.move_to_end(cache_id)
+            while len(KEY_CACHE) > KEY_CACHE_SIZE:
+                KEY_CACHE.popitem(last=False)
     return keys
 
 
@@ -95,11 +168,8 @@ def generate_ed25519_keypair_from_seed(seed):
     ```
     """
     seed_bytes = bytes.fromhex(seed)
-    key_pair = ed25519.SigningKey(seed_bytes)
-    private_key_hex = key_pair.to_ascii(encoding='hex').decode('utf-8')
-    public_key_hex = key_pair.get_verifying_key().to_ascii(
-        encoding='hex').decode('utf-8')
-    return private_key_hex, public_key_hex
+    public_key = signature.get_backend().public_key(seed_bytes)
+    return seed_bytes.hex(), public_key.hex()
 
 
 def curve25519_scalar_base_mult(seed):
@@ -0,0 +1,189 @@
+'''
+Ed25519 signature backends.
+
+PyNaCl and cryptography sign in native code, the ed25519 package is
+kept as a fallback. The first backend that can be imported and produces
+the RFC 8032 test vector is used; every backend gives byte-identical
+keys and signatures.
+'''
+
+import threading
+
+
+# RFC 8032, section 7.1, test 1
+TEST_SEED = bytes.fromhex(
+    '9d61b19deffd5a60ba844af492ec2cc44449c5697b326919703bac031cae7f60')
+TEST_PUBLIC_KEY = bytes.fromhex(
+    'd75a980182b10ab7d54bfed3c964073a0ee172f3daa62325af021a68f707511a')
+TEST_SIGNATURE = bytes.fromhex(
+    'e5564300c360ac729086e2cc806e828a84877f1eb8e5d974d873e065224901555fb8821590a33bacc61e39701cf9b46bd25bf5f0595bbe24655141438e7a100b')  # noqa
+
+BACKEND = None
+BACKEND_LOCK = threading.Lock()
+
+
+class NaclBackend(object):
+    '''Ed25519 with PyNaCl (libsodium).'''
+    name = 'pynacl'
+
+    def __init__(self):
+        import nacl.signing
+        import nacl.exceptions
+        self.signing = nacl.signing
+        self.bad_signature = nacl.exceptions.BadSignatureError
+
+    def public_key(self, seed):
+        '''Return the 32 byte public key of a 32 byte seed'''
+        return bytes(self.signing.SigningKey(seed).verify_key)
+
+    def sign(self, private_key, data):
+        '''Sign data with a 64 byte seed + public key private key'''
+        return self.signing.SigningKey(private_key[:32]).sign(data).signature
+
+    def signer(self, private_key):
+        '''Return a function signing data with the private key'''
+        key = self.signing.SigningKey(private_key[:32])
+        return lambda data: key.sign(data).signature
+
+    def verify(self, public_key, data, signature):
+        '''Return True if signature of data is valid'''
+        try:
+            self.signing.VerifyKey(public_key).verify(data, signature)
+            return True
+        except (self.bad_signature, ValueError, TypeError):
+            return False
+
+
+class CryptographyBackend(object):
+    '''Ed25519 with cryptography (OpenSSL).'''
+    name = 'cryptography'
+
+    def __init__(self):
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ed25519
+        self.ed25519 = ed25519
+        self.serialization = serialization
+        self.invalid_signature = InvalidSignature
+
+    def public_key(self, seed):
+        '''Return the 32 byte public key of a 32 byte seed'''
+        key = self.ed25519.Ed25519PrivateKey.from_private_bytes(seed)
+        return key.public_key().public_bytes(
+            self.serialization.Encoding.Raw,
+            self.serialization.PublicFormat.Raw)
+
+    def sign(self, private_key, data):
+        '''Sign data with a 64 byte seed + public key private key'''
+        key = self.ed25519.Ed25519PrivateKey.from_private_bytes(
+            private_key[:32])
+        return key.sign(data)
+
+    def signer(self, private_key):
+        '''Return a function signing data with the private key'''
+        return self.ed25519.Ed25519PrivateKey.from_private_bytes(
+            private_key[:32]).sign
+
+    def verify(self, public_key, data, signature):
+        '''Return True if signature of data is valid'''
+        try:
+            key = self.ed25519.Ed25519PublicKey.from_public_bytes(public_key)
+            key.verify(signature, data)
+            return True
+        except (self.invalid_signature, ValueError, TypeError):
+            return False
+
+
+class Ed25519Backend(object):
+    '''Ed25519 with the ed25519 package.'''
+    name = 'ed25519'
+
+    def __init__(self):
+        import ed25519
+        self.ed25519 = ed25519
+
+    def public_key(self, seed):
+        '''Return the 32 byte public key of a 32 byte seed'''
+        return self.ed25519.SigningKey(seed).get_verifying_key().to_bytes()
+
+    def sign(self, private_key, data):
+        '''Sign data with a 64 byte seed + public key private key'''
+        return self.ed25519.SigningKey(private_key).sign(data)
+
+    def signer(self, private_key):
+        '''Return a function signing data with the private key'''
+        return self.ed25519.SigningKey(private_key).sign
+
+    def verify(self, public_key, data, signature):
+        '''Return True if signature of data is valid'''
+        try:
+            self.ed25519.VerifyingKey(public_key).verify(signature, data)
+            return True
+        except Exception:
+            return False
+
+
+BACKENDS = (NaclBackend, CryptographyBackend, Ed25519Backend)
+
+
+def check_backend(backend):
+    '''Return True if the backend produces the RFC 8032 test vector'''
+    private_key = TEST_SEED + TEST_PUBLIC_KEY
+    return backend.public_key(TEST_SEED) == TEST_PUBLIC_KEY and \
+        backend.sign(private_key, b'') == TEST_SIGNATURE and \
+        backend.verify(TEST_PUBLIC_KEY, b'', TEST_SIGNATURE) and \
+        not backend.verify(TEST_PUBLIC_KEY, b'x', TEST_SIGNATURE)
+
+
+def available_backends():
+    '''Return instances of the backends that can be used, fastest first'''
+    backends = []
+    for backend_class in BACKENDS:
+        try:
+            backend = backend_class()
+        except ImportError:
+            continue
+        if check_backend(backend):
+            backends.append(backend)
+    return backends
+
+
+def get_backend():
+    '''
+    Return the Ed25519 backend.
+    It is chosen on the first call, see set_backend to choose it.
+    '''
+    global BACKEND
+    if BACKEND is not None:
+        return BACKEND
+    with BACKEND_LOCK:
+        if BACKEND is None:
+            backends = available_backends()
+            if not backends:
+                raise Exception('no ed25519 backend')
+            BACKEND = backends[0]
+    return BACKEND
+
+
+def set_backend(name):
+    """
+    Use the backend with the given name.
+
+    Parameters:
+        name (str):
+            pynacl, cryptography or ed25519
+
+    Example:
+        -
+    ```
+        from transferchain.crypt import signature
+        signature.set_backend('ed25519')
+    ```
+    """
+    global BACKEND
+    for backend in available_backends():
+        if backend.name == name:
+            with BACKEND_LOCK:
+                BACKEND = backend
+            return
+    raise Exception('ed25519 backend is not available: {}'.format(name))
@@ -1,7 +1,10 @@
-import json
+import sys
 import gzip
 import random
 from collections import namedtuple
+from collections.abc import Sequence
+import base58
+from transferchain import serializer
 from transferchain.mixins import TupleMixin
 
 
@@ -21,6 +24,12 @@ class User(TupleMixin, namedtuple(
         return self.addresses[
             random.randint(1, len(self.addresses) - 1)]
 
+    def compact(self):
+        '''Return the user with its addresses in an AddressTable'''
+        if isinstance(self.addresses, AddressTable):
+            return self
+        return self._replace(addresses=AddressTable(self.addresses))
+
 
 class DataStorage(TupleMixin, namedtuple(
         'DataStorage',
@@ -57,8 +66,9 @@ class TransferSent(TupleMixin, namedtuple(
         'DataTransferSent',
         'filename uuid txId senderAddress senderMasterAddress '
         'receivedAddresses size uploadDate endTime keyAES KeyHMAC '
-        'address storage_code slots ReceivedAddress')):
-    '''Broadcast data'''
+        'address storage_code slots ReceivedAddress failedAddresses',
+        defaults=((),))):
+    '''Broadcast data, failedAddresses is empty by default'''
     __slots__ = ()
 
 
@@ -81,9 +91,116 @@ class Address(TupleMixin, namedtuple(
 
     def dump(self, *args, **kwargs):
         '''Named tuple to json'''
-        excludes = ['MasterAddress']
-        data = {k: getattr(self, k) for k in self._fields if k not in excludes}
-        return json.dumps(data).encode('utf-8')
+        data = dict(zip(self._fields, self))
+        del data['MasterAddress']
+        return serializer.dumps(data)
+
+
+class AddressTable(Sequence):
+    '''
+    Read-only list of the Address objects of a user, kept compact.
+    Every address is stored as its raw seed and public keys; mnemonics,
+    user ids and the master address are stored once. Address objects and
+    their Key dicts are created when an item is read. Addresses that can
+    not be rebuilt from these values are kept as they are.
+    '''
+    KEY_SIZE = 96
+
+    def __init__(self, addresses):
+        self.mnemonics = None
+        self.user_id = None
+        self.sub_user_id = None
+        self.master_address = None
+        self.extra = {}
+        rows = []
+        masters = bytearray()
+        for index, address in enumerate(addresses):
+            if index == 0:
+                self.mnemonics = self._intern(address.Mnemonics)
+                self.user_id = address.UserID
+                self.sub_user_id = address.SubUserID
+            if not address.Master and self.master_address is None:
+                self.master_address = self._intern(address.MasterAddress)
+            row = self._pack(address)
+            if row is None:
+                self.extra[index] = address
+                row = bytes(self.KEY_SIZE)
+            rows.append(row)
+            masters.append(1 if address.Master else 0)
+        self.rows = b''.join(rows)
+        self.masters = bytes(masters)
+
+    @staticmethod
+    def _intern(value):
+        if isinstance(value, str):
+            return sys.intern(value)
+        return value
+
+    @staticmethod
+    def _key(row):
+        seed, public_key_sign, public_key_encrypt = \
+            row[:32], row[32:64], row[64:96]
+        return {
+            'Seed': seed.hex(),
+            'Seed58': base58.b58encode(seed).decode('utf-8'),
+            'PrivateKeySign': seed.hex() + public_key_sign.hex(),
+            'PublicKeySign': public_key_sign.hex(),
+            'PublicKeySign58': base58.b58encode(
+                public_key_sign).decode('utf-8'),
+            'PublicKeyEncrypt': public_key_encrypt.hex(),
+            'PublicKeyEncrypt58': base58.b58encode(
+                public_key_encrypt).decode('utf-8'),
+            'Address': base58.b58encode(
+                public_key_sign + public_key_encrypt).decode('utf-8')
+        }
+
+    def _pack(self, address):
+        '''Return the raw keys of address, None if it does not fit'''
+        master_address = None if address.Master else self.master_address
+        if address.Mnemonics != self.mnemonics or \
+           address.UserID != self.user_id or \
+           address.SubUserID != self.sub_user_id or \
+           address.MasterAddress != master_address:
+            return None
+        try:
+            row = bytes.fromhex(address.Key['Seed']) + \
+                bytes.fromhex(address.Key['PublicKeySign']) + \
+                bytes.fromhex(address.Key['PublicKeyEncrypt'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if len(row) != self.KEY_SIZE or self._key(row) != address.Key:
+            return None
+        return row
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('address index out of range')
+        if index in self.extra:
+            return self.extra[index]
+        master = bool(self.masters[index])
+        start = index * self.KEY_SIZE
+        return Address(
+            Key=self._key(self.rows[start:start + self.KEY_SIZE]),
+            Mnemonics=self.mnemonics,
+            Master=master,
+            UserID=self.user_id,
+            MasterAddress=None if master else self.master_address,
+            SubUserID=self.sub_user_id)
+
+    def __len__(self):
+        return len(self.masters)
+
+    def __eq__(self, other):
+        if not isinstance(other, (Sequence, list)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return 'AddressTable({})'.format(list(self))
 
 
 class Addresses(TupleMixin, namedtuple(
@@ -93,8 +210,7 @@ class Addresses(TupleMixin, namedtuple(
 
     def dump(self, *args, **kwargs):
         '''Named tuple to json with gzip'''
-        data = {k: getattr(self, k) for k in self._fields}
-        return gzip.compress(json.dumps(data).encode('utf-8'))
+        return gzip.compress(serializer.dumps(dict(zip(self._fields, self))))
 
 
 # config
@@ -1,32 +1,109 @@
+import os
+import json
 import base64
-import pickledb
+import shutil
+import sqlite3
+import threading
+
+
+SQLITE_HEADER = b'SQLite format 3\x00'
 
 
 class DB(object):
     '''
-    Pickledb is used as key value storage. The data stored here is encrypted.
+    Sqlite is used as key value storage. The data stored here is encrypted.
+    The database runs in WAL mode, every set writes only its own record
+    and is committed before it returns. A pickledb file found at path is
+    migrated on open, the original is kept as <path>.pickledb.bak.
     '''
     def __init__(self, path):
-        self.db = pickledb.load(path, auto_dump=True, sig=True)
+        self.path = path
+        self.lock = threading.Lock()
+        if self.is_pickledb(path):
+            self.migrate_pickledb(path)
+        self.db = self.connect(path)
+
+    @staticmethod
+    def connect(path):
+        '''Return a sqlite connection with the items table'''
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=FULL')
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS items '
+            '(key TEXT PRIMARY KEY, value BLOB NOT NULL)')
+        db.commit()
+        return db
+
+    @staticmethod
+    def is_pickledb(path):
+        '''Return True if path is a pickledb json file'''
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return False
+        with open(path, 'rb') as f:
+            return f.read(len(SQLITE_HEADER)) != SQLITE_HEADER
+
+    def migrate_pickledb(self, path):
+        '''Move the items of a pickledb json file into sqlite'''
+        with open(path, 'r') as f:
+            items = json.load(f)
+
+        tmp_path = '{}.migrate'.format(path)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        db = self.connect(tmp_path)
+        with db:
+            db.executemany(
+                'INSERT OR REPLACE INTO items (key, value) VALUES (?, ?)',
+                [(k, base64.b64decode(v)) for k, v in items.items()])
+        db.execute('PRAGMA journal_mode=DELETE')
+        db.close()
+
+        shutil.copy2(path, '{}.pickledb.bak'.format(path))
+        os.replace(tmp_path, path)
 
     def set(self, key, value):
         '''insert value with key'''
         if isinstance(value, str):
             value = value.encode('utf-8')
 
-        self.db.set(key, base64.b64encode(value).decode())
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO items (key, value) VALUES (?, ?)',
+                (key, value))
 
     def get(self, key):
-        '''Return db item'''
-        return base64.b64decode(self.db.get(key))
+        '''Return db item, None if key does not exist'''
+        with self.lock:
+            row = self.db.execute(
+                'SELECT value FROM items WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return bytes(row[0])
+
+    def keys(self):
+        '''Return keys of all items'''
+        with self.lock:
+            rows = self.db.execute('SELECT key FROM items').fetchall()
+        return [row[0] for row in rows]
 
     def get_all(self):
         '''Return all items of db'''
-        items = {}
-        for k in self.db.getall():
-            items[k] = self.get(k)
-        return items
+        with self.lock:
+            rows = self.db.execute('SELECT key, value FROM items').fetchall()
+        return {key: bytes(value) for key, value in rows}
+
+    def delete(self, key):
+        '''Delete db item'''
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM items WHERE key = ?', (key,))
 
     def dump(self):
-        '''Return db dump'''
-        self.db.dump()
+        '''Write the WAL into the database file'''
+        with self.lock:
+            self.db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def close(self):
+        '''Close the database'''
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,280 @@
+'''
+Ranged, parallel and resumable downloads built on the DownloadV4 rpc.
+
+The encrypted file is written into a preallocated part file. Every slot
+is split into byte ranges, the ranges are fetched at the same time and
+written to their own offset. Finished ranges are kept in a small journal
+next to the part file, an interrupted download continues from there.
+'''
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from transferchain import constants
+from transferchain.crypt import crypt
+from transferchain.utils import LazyModule, JsonFile
+from transferchain.datastructures import Result
+from transferchain.grpc_client import get_client
+
+grpc = LazyModule('grpc')
+pb = LazyModule('transferchain.protobuf.service_pb2')
+
+PART_SUFFIX = '.tcpart'
+JOURNAL_SUFFIX = '.tcpart.json'
+
+
+class Journal(JsonFile):
+    '''Finished ranges of a part file, saved after each range.'''
+
+    def __init__(self, path, file_size, range_size):
+        super(Journal, self).__init__(path)
+        self.file_size = file_size
+        self.range_size = range_size
+        self.done = set()
+
+    def load(self):
+        '''Load the finished ranges if the journal matches the download'''
+        data = super(Journal, self).load()
+        if data.get('file_size') == self.file_size and \
+           data.get('range_size') == self.range_size:
+            self.done = set(data.get('done', []))
+
+    def add(self, offset):
+        '''Mark the range starting at offset as finished'''
+        with self.lock:
+            self.done.add(offset)
+            data = {
+                'file_size': self.file_size,
+                'range_size': self.range_size,
+                'done': sorted(self.done)
+            }
+            self.write(data)
+
+
+def slot_ranges(slots, file_size, range_size):
+    """
+    Split the slots of an encrypted file into byte ranges.
+
+    Parameters:
+        slots:
+            list of slot dicts, datastructures.TransferSent.slots
+
+        file_size (int):
+            size of the encrypted file
+
+        range_size (int):
+            maximum size of a range
+
+    Returns:
+        list of (slot_index, seek, length, offset) tuples. seek is the
+        position in the slot, offset is the position in the file.
+
+    Example:
+        -
+    ```
+        from transferchain import download
+        slots = [{'Size': 10}, {'Size': 10}]
+        ranges = download.slot_ranges(slots, 15, 4)
+    ```
+    """
+    ranges = []
+    offset = 0
+    for slot_index, slot in enumerate(slots):
+        if slot_index == len(slots) - 1:
+            slot_size = file_size - offset
+        else:
+            slot_size = min(slot['Size'], file_size - offset)
+        seek = 0
+        while seek < slot_size:
+            length = min(range_size, slot_size - seek)
+            ranges.append((slot_index, seek, length, offset + seek))
+            seek += length
+        offset += slot_size
+    return ranges
+
+
+def part_paths(destination_file):
+    '''Return part file and journal paths of a destination file'''
+    destination_file = str(destination_file)
+    return (destination_file + PART_SUFFIX,
+            destination_file + JOURNAL_SUFFIX)
+
+
+def download_range(config, op_code, slot, is_last_slot, seek, length,
+                   offset, part_path, meta_data):
+    '''
+    Fetch single range with DownloadV4 and write it to its offset.
+
+    Returns:
+        Error message, empty string if the range is written
+    '''
+    grpc_client = get_client()
+    with open(part_path, 'r+b') as part_file:
+        part_file.seek(offset)
+        while length > 0:
+            try:
+                response = grpc_client.DownloadV4(pb.DownloadV4Request(
+                    Slot=slot,
+                    WalletID=config.wallet_id,
+                    UserID=config.user_id,
+                    OpCode=op_code,
+                    Last=is_last_slot,
+                    Seek=seek,
+                    ChunkSize=length
+                ), metadata=meta_data)
+            except grpc.RpcError as e:
+                return 'download error:{}'.format(e.details())
+            chunk = response.chunk[:length]
+            if not chunk:
+                return 'download error: empty chunk'
+            part_file.write(chunk)
+            seek += len(chunk)
+            length -= len(chunk)
+    return ''
+
+
+def download_slots(config, op_code, slots, file_size, part_path,
+                   workers=constants.DOWNLOAD_WORKERS,
+                   range_size=constants.DOWNLOAD_RANGE_SIZE):
+    """
+    Download an encrypted file into part_path. The ranges are fetched
+    in parallel and ranges finished by an earlier call are skipped.
+
+    Parameters:
+        config (datastructures.Config):
+            config
+
+        op_code:
+            pb.UploadOpCode.<Transfer|Storage>
+
+        slots:
+            list of slot dicts, datastructures.TransferSent.slots
+
+        file_size (int):
+            size of the encrypted file
+
+        part_path (str):
+            path of the preallocated encrypted file
+
+        workers (int):
+            number of ranges fetched at the same time
+
+        range_size (int):
+            maximum size of a range
+
+    Returns:
+        Result object
+
+    Example:
+        -
+    ```
+        from transferchain import download
+        from transferchain.config import create_config
+        from transferchain.protobuf import service_pb2 as pb
+
+        config = create_config()
+        # transfer_sent_obj -> datastructures.TransferSent
+        result = download.download_slots(
+            config, pb.UploadOpCode.Transfer, transfer_sent_obj.slots,
+            transfer_sent_obj.size, '/tmp/file.tcpart')
+    ```
+    """
+    meta_data = [
+        ("user-id", str(config.user_id)),
+        ("user-api-token", config.api_token),
+        ("user-api-secret", config.api_secret)
+    ]
+    journal = Journal(part_path + '.json', file_size, range_size)
+    if os.path.exists(part_path) and \
+       os.path.getsize(part_path) == file_size:
+        journal.load()
+    else:
+        with open(part_path, 'wb') as part_file:
+            part_file.truncate(file_size)
+
+    pb_slots = [pb.UploadSlot(**slot) for slot in slots]
+    ranges = [r for r in slot_ranges(slots, file_size, range_size)
+              if r[3] not in journal.done]
+
+    def fetch(item):
+        slot_index, seek, length, offset = item
+        error = download_range(
+            config, op_code, pb_slots[slot_index],
+            slot_index == len(slots) - 1, seek, length, offset,
+            part_path, meta_data)
+        if not error:
+            journal.add(offset)
+        return error
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        errors = [error for error in executor.map(fetch, ranges) if error]
+
+    if errors:
+        return Result(success=False, error_message=errors[0])
+    return Result(success=True)
+
+
+def download_file(config, op_code, slots, file_size, key_aes, key_hmac,
+                  destination_file, workers=constants.DOWNLOAD_WORKERS,
+                  range_size=constants.DOWNLOAD_RANGE_SIZE,
+                  crypt_workers=constants.CRYPT_WORKERS):
+    """
+    Download and decrypt a file with download_slots. The part file and
+    the journal stay next to destination_file until the file is
+    decrypted, calling it again resumes the download.
+
+    Parameters:
+        config (datastructures.Config):
+            config
+
+        op_code:
+            pb.UploadOpCode.<Transfer|Storage>
+
+        slots:
+            list of slot dicts
+
+        file_size (int):
+            size of the encrypted file
+
+        key_aes (str):
+            aes key of the file
+
+        key_hmac (str):
+            hmac key of the file
+
+        destination_file (pathlib.Path):
+            path of the decrypted file
+
+        workers (int):
+            number of ranges fetched at the same time
+
+        range_size (int):
+            maximum size of a range
+
+        crypt_workers (int):
+            number of threads decrypting the part file
+
+    Returns:
+        Result object
+    """
+    part_path, journal_path = part_paths(destination_file)
+    result = download_slots(config, op_code, slots, file_size, part_path,
+                            workers=workers, range_size=range_size)
+    if not result.success:
+        return result
+
+    try:
+        with open(part_path, 'rb') as in_file:
+            with destination_file.open(mode='wb') as out_file:
+                crypt.decrypt_aesctr_with_hmac(
+                    in_file, out_file, key_aes.encode('utf-8'),
+                    key_hmac.encode('utf-8'), workers=crypt_workers)
+    except Exception as e:
+        # the plaintext written before the HMAC check is not trusted
+        destination_file.unlink(missing_ok=True)
+        return Result(success=False, error_message=str(e))
+    finally:
+        # a corrupt part file can not be resumed either
+        os.remove(part_path)
+        if os.path.exists(journal_path):
+            os.remove(journal_path)
+    return Result(success=True)
@@ -1,22 +1,213 @@
-import grpc
+import json
+import itertools
+import threading
+from transferchain import constants
 from transferchain.cert import RPC_CERT
 from transferchain.settings import RPC_ADDRESS
-from transferchain.protobuf import service_pb2_grpc
 
 
 GRPC_CLIENT = None
+GRPC_CLIENTS = None
+GRPC_CLIENT_LOCK = threading.Lock()
+GRPC_CLIENT_COUNTER = itertools.count()
+# keyword arguments of create_channel used by get_client
+GRPC_CHANNEL_OPTIONS = {}
+GRPC_CHANNELS = constants.GRPC_CHANNELS
+GRPC_CHANNEL_FACTORY = None
+
+
+def channel_options(keepalive_time=constants.GRPC_KEEPALIVE_TIME,
+                    keepalive_timeout=constants.GRPC_KEEPALIVE_TIMEOUT,
+                    max_message_size=constants.GRPC_MAX_MESSAGE_SIZE,
+                    window_size=None, max_attempts=1):
+    """
+    Return grpc channel arguments.
+
+    Parameters:
+        keepalive_time (int):
+            milliseconds between keepalive pings, 0 disables them
+
+        keepalive_timeout (int):
+            milliseconds to wait for a keepalive ping ack
+
+        max_message_size (int):
+            maximum size of a sent or received message
+
+        window_size (int):
+            optional, fixed HTTP/2 flow control window. By default the
+            window is tuned by bandwidth delay probing.
+
+        max_attempts (int):
+            attempts of a call failing with UNAVAILABLE, 1 disables retries
+
+    Returns:
+        list of (key, value) tuples
+
+    Example:
+        -
+    ```
+        from transferchain import grpc_client
+        options = grpc_client.channel_options(max_attempts=3)
+    ```
+    """
+    options = [
+        ('grpc.max_send_message_length', max_message_size),
+        ('grpc.max_receive_message_length', max_message_size),
+    ]
+    if keepalive_time:
+        options.extend([
+            ('grpc.keepalive_time_ms', keepalive_time),
+            ('grpc.keepalive_timeout_ms', keepalive_timeout),
+            ('grpc.keepalive_permit_without_calls', 1),
+            ('grpc.http2.max_pings_without_data', 0),
+        ])
+    if window_size:
+        options.extend([
+            ('grpc.http2.bdp_probe', 0),
+            ('grpc.http2.lookahead_bytes', window_size),
+        ])
+    if max_attempts > 1:
+        service_config = {
+            'methodConfig': [{
+                'name': [{'service': 'service.FileOperation'}],
+                'retryPolicy': {
+                    'maxAttempts': max_attempts,
+                    'initialBackoff': '0.5s',
+                    'maxBackoff': '5s',
+                    'backoffMultiplier': 2,
+                    'retryableStatusCodes': ['UNAVAILABLE'],
+                },
+            }]
+        }
+        options.extend([
+            ('grpc.enable_retries', 1),
+            ('grpc.service_config', json.dumps(service_config)),
+        ])
+    return options
+
+
+def create_channel(address=RPC_ADDRESS, compression=None, **kwargs):
+    """
+    Create a secure grpc channel to the file service.
+
+    Parameters:
+        address (str):
+            optional, host:port of the file service
+
+        compression (grpc.Compression):
+            optional, compression of the calls. Uploaded files are
+            encrypted, so they are not compressed by default.
+
+        kwargs:
+            channel_options arguments
+
+    Returns:
+        grpc.Channel
+
+    Example:
+        -
+    ```
+        from transferchain import grpc_client
+        channel = grpc_client.create_channel(max_message_size=32 << 20)
+    ```
+    """
+    import grpc
+    creds = grpc.ssl_channel_credentials(root_certificates=RPC_CERT)
+    return grpc.secure_channel(
+        address, creds, options=channel_options(**kwargs),
+        compression=compression)
+
+
+def create_aio_channel(address=RPC_ADDRESS, compression=None, **kwargs):
+    """
+    Create a secure grpc.aio channel to the file service. It belongs to
+    the running event loop, see create_channel for the parameters.
+
+    Returns:
+        grpc.aio.Channel
+
+    Example:
+        -
+    ```
+        from transferchain import grpc_client
+
+        async def main():
+            channel = grpc_client.create_aio_channel()
+            ...
+            await channel.close()
+    ```
+    """
+    import grpc
+    import grpc.aio
+    creds = grpc.ssl_channel_credentials(root_certificates=RPC_CERT)
+    return grpc.aio.secure_channel(
+        address, creds, options=channel_options(**kwargs),
+        compression=compression)
+
+
+def create_clients():
+    '''Return FileOperation stubs for the configured channels'''
+    from transferchain.protobuf import service_pb2_grpc
+    factory = GRPC_CHANNEL_FACTORY
+    if factory is None:
+        def factory():
+            return create_channel(**GRPC_CHANNEL_OPTIONS)
+    return [service_pb2_grpc.FileOperationStub(factory())
+            for _ in range(max(GRPC_CHANNELS, 1))]
+
+
+def configure_client(channels=constants.GRPC_CHANNELS, channel_factory=None,
+                     **kwargs):
+    """
+    Set the channels used by get_client. The channels are created on the
+    next get_client call; calls running on the old channels are not
+    interrupted.
+
+    Parameters:
+        channels (int):
+            number of channels, get_client returns them round-robin so
+            that parallel uploads are not limited by the concurrent
+            stream limit of a single connection
+
+        channel_factory (callable):
+            optional, function without arguments returning a grpc.Channel.
+            kwargs are not used when it is given.
+
+        kwargs:
+            create_channel arguments
+
+    Example:
+        -
+    ```
+        from transferchain import grpc_client
+        grpc_client.configure_client(channels=4, max_attempts=3)
+    ```
+    """
+    global GRPC_CLIENT, GRPC_CLIENTS, GRPC_CHANNELS
+    global GRPC_CHANNEL_OPTIONS, GRPC_CHANNEL_FACTORY
+    with GRPC_CLIENT_LOCK:
+        GRPC_CHANNELS = channels
+        GRPC_CHANNEL_FACTORY = channel_factory
+        GRPC_CHANNEL_OPTIONS = kwargs
+        GRPC_CLIENTS = None
+        GRPC_CLIENT = None
 
 
 def get_client():
     '''
     Grpc connection function.
     Once called, grpc connects to the server and stores
-    this connection in a global variable.
+    this connection in a global variable. With more than one channel,
+    every call returns the next one.
     '''
-    global GRPC_CLIENT
-    if GRPC_CLIENT is not None:
-        return GRPC_CLIENT
-    creds = grpc.ssl_channel_credentials(root_certificates=RPC_CERT)
-    channel = grpc.secure_channel(RPC_ADDRESS, creds)
-    GRPC_CLIENT = service_pb2_grpc.FileOperationStub(channel)
-    return GRPC_CLIENT
+    global GRPC_CLIENT, GRPC_CLIENTS
+    clients = GRPC_CLIENTS
+    if clients is None:
+        with GRPC_CLIENT_LOCK:
+            if GRPC_CLIENTS is None:
+                GRPC_CLIENTS = create_clients()
+                GRPC_CLIENT = GRPC_CLIENTS[0]
+            clients = GRPC_CLIENTS
+    if len(clients) == 1:
+        return clients[0]
+    return clients[next(GRPC_CLIENT_COUNTER) % len(clients)]
@@ -1,4 +1,4 @@
-import json
+from transferchain import serializer
 
 
 class TupleMixin(object):
@@ -14,5 +14,4 @@ class TupleMixin(object):
 
     def dump(self):
         '''Named tuple to json'''
-        data = {k: getattr(self, k) for k in self._fields}
-        return json.dumps(data).encode('utf-8')
+        return serializer.dumps(dict(zip(self._fields, self)))
@@ -1,15 +1,52 @@
+import os
 import gzip
 import json
 import base64
-from tcabci_read_client import HttpClient
-from transferchain import settings
+from concurrent.futures import ThreadPoolExecutor
+from transferchain import blockchain
 from transferchain import constants
 from transferchain.crypt import keys, crypt
+from transferchain.logger import get_logger
+from transferchain.utils import JsonFile
 from transferchain.datastructures import (
     Result, User, Address)
 
 
-def restore_master(mnemonics, password, tx_type, limit=1, offset=0):
+logger = get_logger(__file__)
+
+RESTORE_CHECKPOINT_FILE = 'tc.restore.json'
+
+
+class RestoreCheckpoint(JsonFile):
+    '''
+    The (height, offset) cursor after the last restored page of sub users
+    of each user, kept in a json file. A restore continued from it only
+    fetches the sub users added since; remove the file to restore all of
+    them again.
+    '''
+
+    @classmethod
+    def from_db_path(cls, db_path):
+        '''Return the restore checkpoint next to the user db'''
+        return cls(os.path.join(
+            os.path.dirname(os.path.abspath(db_path)),
+            RESTORE_CHECKPOINT_FILE))
+
+    def get(self, user_id):
+        '''Return the (height, offset) of the user, (0, 0) if there is none'''
+        item = self.load().get(str(user_id), {})
+        return item.get('height', 0), item.get('offset', 0)
+
+    def set(self, user_id, height, offset):
+        '''Write the (height, offset) of the user'''
+        with self.lock:
+            data = self.load()
+            data[str(user_id)] = {'height': height, 'offset': offset}
+            self.write(data)
+
+
+def restore_master(mnemonics, password, tx_type, limit=1, offset=0,
+                   height=0, height_operator=">=", user_keys=None):
     """
     This function is called to fetch the master address of
     the user of the specified type.
@@ -31,6 +68,16 @@ def restore_master(mnemonics, password, tx_type, limit=1, offset=0):
         offset (int):
             offset
 
+        height (int):
+            block height the transactions are compared with
+
+        height_operator (str):
+            comparison of the transaction heights with height
+
+        user_keys (dict):
+            optional, keys.create_keys_with_mnemonic result of mnemonics
+            and password, they are derived when it is not given
+
     Returns:
         Return dict. user keys and read client response.
 
@@ -53,14 +100,15 @@ def restore_master(mnemonics, password, tx_type, limit=1, offset=0):
 
     ```
     """
-    user_keys = keys.create_keys_with_mnemonic(mnemonics, password)
-    client = HttpClient(settings.READ_NODE_ADDRESS)
+    if user_keys is None:
+        user_keys = keys.create_keys_with_mnemonic(mnemonics, password)
+    client = blockchain.get_read_node_client()
     response = client.tx_search(
         recipient_addrs=[
             user_keys['Address']
         ],
-        height=0,
-        height_operator=">=",
+        height=height,
+        height_operator=height_operator,
         hashes=None,
         typ=tx_type,
         limit=limit,
@@ -106,7 +154,8 @@ def restore_master_user(mnemonics, password):
     return restore_master(mnemonics, password, constants.TX_TYPE_MASTER)
 
 
-def restore_sub_user(mnemonics, password, page=1, limit=100):
+def restore_sub_user(mnemonics, password, page=1,
+                     limit=constants.RESTORE_PAGE_SIZE):
     """
     This function is called to fetch the master address of
     the sub user.
@@ -216,7 +265,7 @@ def get_addresses(typ, recipient_addrs, limit=1, offset=0):
             page offset
 
     Returns:
-        Return Result object.Payload is read client http response
+        Return Result object. Payload is the list of transactions.
 
     Example:
         -
@@ -237,18 +286,19 @@ def get_addresses(typ, recipient_addrs, limit=1, offset=0):
         addresses_result = restore.get_addresses(
             constants.TX_TYPE_ADDRESSES, user_keys['Address'],
             limit=1, offset=0)
+        addresses_txn = addresses_result.data[0]
 
     ```
     """
-    client = HttpClient(settings.READ_NODE_ADDRESS)
+    client = blockchain.get_read_node_client()
     response = client.tx_search(
         recipient_addrs=[recipient_addrs],
         height=0,
         height_operator=">=",
         hashes=None,
         typ=typ,
-        limit=1,
-        offset=0,
+        limit=limit,
+        offset=offset,
         order_by=constants.SORT_TYPE_ASC
     )
     if not response.success:
@@ -257,7 +307,121 @@ def get_addresses(typ, recipient_addrs, limit=1, offset=0):
     result = response.result['txs']
     if len(result) == 0:
         return Result(success=False, error_message='Master txn not found')
-    return Result(success=True, data=result[0])
+    return Result(success=True, data=result)
+
+
+def get_addresses_many(typ, recipient_addrs):
+    """
+    Fetch the first transaction of a type sent to each of the addresses.
+    They are asked with one tx_search, repeated for the addresses missing
+    in a full response; the rest is fetched with get_addresses. A read
+    node whose transactions have no recipient_addr can not be batched,
+    a warning is logged and every address is fetched with get_addresses.
+
+    Parameters:
+        typ (str):
+            transaction type
+
+        recipient_addrs (list):
+            broadcast addresses
+
+    Returns:
+        Return list of Result objects in the order of recipient_addrs.
+
+    Example:
+        -
+    ```
+        from transferchain import restore
+        from transferchain import constants
+
+        results = restore.get_addresses_many(
+            constants.TX_TYPE_SUB_ADDRESSES, [address_1, address_2])
+    ```
+    """
+    found = {}
+    client = blockchain.get_read_node_client()
+    missing = list(recipient_addrs)
+    while len(missing) > 1:
+        response = client.tx_search(
+            recipient_addrs=missing,
+            height=0,
+            height_operator=">=",
+            hashes=None,
+            typ=typ,
+            limit=len(missing),
+            offset=0,
+            order_by=constants.SORT_TYPE_ASC
+        )
+        if not response.success:
+            break
+        txns = response.result['txs']
+        if any('recipient_addr' not in txn for txn in txns):
+            logger.warning(
+                'read node transactions have no recipient_addr, the %s '
+                'transactions of %d addresses are fetched one by one',
+                typ, len(missing))
+            break
+        # ascending, the first one of each address is kept
+        for txn in txns:
+            found.setdefault(txn.get('recipient_addr'), txn)
+        remaining = [addr for addr in missing if addr not in found]
+        if len(txns) < len(missing) or len(remaining) == len(missing):
+            # complete response or no progress
+            break
+        missing = remaining
+    results = []
+    for recipient_addr in recipient_addrs:
+        if recipient_addr in found:
+            results.append(Result(success=True, data=found[recipient_addr]))
+        else:
+            result = get_addresses(typ, recipient_addr)
+            if result.success:
+                result = result._replace(data=result.data[0])
+            results.append(result)
+    return results
+
+
+def create_user(master_txn, addresses_txn, master=False):
+    '''Return the datastructures.User of extracted master and addresses txns'''
+    master_address = Address(**master_txn)
+    master_key_address = master_txn['Key']['Address']
+    addresses = [
+        Address(MasterAddress=master_key_address, **master_txn)
+    ]
+    for address in addresses_txn['Addresses']:
+        addresses.append(Address(**address))
+
+    if master:
+        user_id = master_address.UserID
+        parent_user_id = master_address.SubUserID
+    else:
+        user_id = master_address.SubUserID
+        parent_user_id = master_address.UserID
+    return User(
+        id=user_id,
+        parent_user_id=parent_user_id,
+        addresses=addresses,
+        master_address=master_address,
+        master=master
+    )
+
+
+def restore_sub_users_batch(master_txns):
+    '''
+    Fetch the addresses of extracted sub user master txns and return a
+    Result, payload is the list of datastructures.User in the same order.
+    '''
+    recipient_addrs = [txn['Key']['Address'] for txn in master_txns]
+    addresses_results = get_addresses_many(
+        constants.TX_TYPE_SUB_ADDRESSES, recipient_addrs)
+    users = []
+    for master_txn, addresses_result in zip(master_txns, addresses_results):
+        if addresses_result.success is False:
+            return addresses_result
+        addresses_txn = extract_txn(
+            addresses_result.data, master_txn['Key'], with_gzip=True)
+        users.append(create_user(master_txn, addresses_txn))
+    return Result(success=True, data=users)
 
 
 def restore_master_with_mnemonics(mnemonics, password, user_id):
@@ -317,30 +481,156 @@ def restore_master_with_mnemonics(mnemonics, password, user_id):
         return addresses_result
 
     addresses_txn = extract_txn(
-        addresses_result.data, user_keys, with_gzip=True)
+        addresses_result.data[0], user_keys, with_gzip=True)
+    user = create_user(master_txn, addresses_txn, master=True)
+    return Result(success=True, data=user)
 
-    master_address = Address(**master_txn)
-    master_key_address = master_txn['Key']['Address']
-    addresses = [
-        Address(MasterAddress=master_key_address, **master_txn)
-    ]
-    for address in addresses_txn['Addresses']:
-        addresses.append(Address(**address))
 
-    user = User(
-        id=master_address.UserID,
-        parent_user_id=master_address.SubUserID,
-        addresses=addresses,
-        master_address=master_address,
-        master=True
-    )
-    return Result(success=True, data=user)
+def next_cursor(txns, height, offset):
+    '''
+    Return the (height, offset) of the page after txns, asked with
+    height_operator ">=". The offset only skips the transactions of the
+    last height that are already fetched, transactions without a height
+    are paged by offset.
+    '''
+    last_height = txns[-1].get('height')
+    if last_height is None:
+        return height, offset + len(txns)
+    last_height = int(last_height)
+    count = sum(1 for txn in txns if txn.get('height') is not None and
+                int(txn['height']) == last_height)
+    if last_height == height:
+        return height, offset + count
+    return last_height, count
+
+
+def iter_sub_users_with_mnemonics(
+        mnemonics, password, user_id, page_size=constants.RESTORE_PAGE_SIZE,
+        height=0, offset=0, workers=constants.RESTORE_WORKERS,
+        batch_size=constants.RESTORE_BATCH_SIZE, checkpoint=None):
+    """
+    Yield the sub users as their pages arrive, so that only a page of
+    them is kept in memory.
+
+    Pages of `page_size` sub users are continued from the height of the
+    last one instead of an offset from the start. The next page is
+    fetched while the current one is processed, and the addresses of a
+    page are fetched in batches of `batch_size` sub users, `workers`
+    batches at the same time.
+
+    Parameters:
+        mnemonics (str):
+            account mnemonics
+
+        password (str):
+            password
+
+        user_id (bool):
+            account id
+
+        page_size (int):
+            sub users fetched with one tx_search
+
+        height (int):
+            block height the sub users are restored from
 
+        offset (int):
+            sub users of that height that are skipped
+
+        workers (int):
+            threads fetching pages and addresses
+
+        batch_size (int):
+            sub users whose addresses are fetched with one tx_search
+
+        checkpoint (RestoreCheckpoint):
+            optional, the cursor after a page is written to it once all
+            users of the page are yielded. Pass its get(user_id) as
+            height and offset to fetch only the new sub users.
+
+    Returns:
+        Generator of Result objects, payload is datastructures.User.
+        It stops after the first failed Result.
+
+    Example:
+        -
+    ```
+        from transferchain import restore
+        from transferchain.addresses import get_user_password
+        from transferchain.config import create_config
 
-def restore_sub_user_with_mnemonics(mnemonics, password, user_id):
+        config = create_config()
+        user_password = get_user_password(config.user_id)
+        for result in restore.iter_sub_users_with_mnemonics(
+                config.mnemonics, user_password, config.user_id):
+            if result.success is False:
+                break
+            print(result.data.id)
+    ```
+    """
+    # the master keys are derived once for all pages
+    user_keys = keys.create_keys_with_mnemonic(mnemonics, password)
+
+    def fetch_page(height, offset):
+        return restore_master(
+            mnemonics, password, constants.TX_TYPE_SUB_MASTER,
+            limit=page_size, offset=offset, height=height,
+            user_keys=user_keys)
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        next_page = executor.submit(fetch_page, height, offset)
+        while next_page is not None:
+            result = next_page.result()
+            next_page = None
+            response = result['response']
+
+            if not response.success:
+                yield Result(
+                    success=False, error_message='Master txn fetch error')
+                return
+
+            txns = response.result['txs']
+            if len(txns) == 0:
+                # empty response
+                return
+
+            # total_count counts the skipped transactions of the height
+            more = offset + len(txns) < response.result['total_count']
+            height, offset = next_cursor(txns, height, offset)
+            if more:
+                next_page = executor.submit(fetch_page, height, offset)
+
+            master_txns = []
+            for txn in txns:
+                master_txn = extract_txn(txn, user_keys)
+                if master_txn['UserID'] != user_id:
+                    yield Result(success=False, error_message='blockchain is not authorized with the information provided')  # noqa
+                    return
+                master_txns.append(master_txn)
+
+            batches = [
+                executor.submit(
+                    restore_sub_users_batch, master_txns[i:i + batch_size])
+                for i in range(0, len(master_txns), batch_size)]
+            for batch in batches:
+                batch_result = batch.result()
+                if batch_result.success is False:
+                    yield batch_result
+                    return
+                for user in batch_result.data:
+                    yield Result(success=True, data=user)
+            if checkpoint is not None:
+                checkpoint.set(user_id, height, offset)
+
+
+def restore_sub_user_with_mnemonics(
+        mnemonics, password, user_id, workers=constants.RESTORE_WORKERS,
+        batch_size=constants.RESTORE_BATCH_SIZE,
+        page_size=constants.RESTORE_PAGE_SIZE):
     """
     The addresses of the sub users are fetched with this
     function and the user object is created.
+    See iter_sub_users_with_mnemonics for the parameters.
 
     Parameters:
         mnemonics (str):
@@ -372,52 +662,11 @@ def restore_sub_user_with_mnemonics(mnemonics, password, user_id):
             tc.config.mnemonics, user_password, tc.config.user_id)
     ```
     """
-    page = 1
     users = []
-    while True:
-        result = restore_sub_user(mnemonics, password, page=page)
-        user_keys = result['user_keys']
-        response = result['response']
-
-        if not response.success:
-            return Result(
-                success=False, error_message='Master txn fetch error')
-
-        txns = response.result['txs']
-        if len(txns) == 0:
-            # empty response
-            break
-
-        for txn in txns:
-            master_txn = extract_txn(txn, user_keys)
-            if master_txn['UserID'] != user_id:
-                return Result(success=False, error_message='blockchain is not authorized with the information provided')  # noqa
-
-            addresses_result = get_addresses(
-                constants.TX_TYPE_SUB_ADDRESSES,
-                master_txn['Key']['Address'], limit=1, offset=0)
-            if addresses_result.success is False:
-                return addresses_result
-            addresses_txn = extract_txn(
-                addresses_result.data, master_txn['Key'], with_gzip=True)
-
-            master_address = Address(**master_txn)
-            master_key_address = master_txn['Key']['Address']
-            addresses = [
-                Address(MasterAddress=master_key_address, **master_txn)
-            ]
-            for address in addresses_txn['Addresses']:
-                addresses.append(Address(**address))
-
-            user = User(
-                id=master_address.SubUserID,
-                parent_user_id=master_address.UserID,
-                addresses=addresses,
-                master_address=master_address,
-                master=False
-            )
-            users.append(user)
-        page += 1
-        if len(users) == response.result['total_count']:
-            break
+    for result in iter_sub_users_with_mnemonics(
+            mnemonics, password, user_id, page_size=page_size,
+            workers=workers, batch_size=batch_size):
+        if result.success is False:
+            return result
+        users.append(result.data)
     return Result(success=True, data=users)
@@ -0,0 +1,96 @@
+'''
+JSON of broadcast payloads and transaction signatures.
+
+Payloads are dumped with orjson when it is installed, otherwise with
+json. Both give the same document, orjson without the spaces and with
+non-ascii characters as utf-8. The signing input of a transaction is
+byte-identical whichever is used, see canonical.
+'''
+
+import json
+import threading
+from json.encoder import encode_basestring_ascii
+
+
+# orjson module, False if it is not installed, None before the first dump
+ORJSON = None
+ORJSON_LOCK = threading.Lock()
+
+
+def get_orjson():
+    '''Return the orjson module or False, it is imported on first use'''
+    global ORJSON
+    if ORJSON is not None:
+        return ORJSON
+    with ORJSON_LOCK:
+        if ORJSON is None:
+            try:
+                import orjson
+                ORJSON = orjson
+            except ImportError:
+                ORJSON = False
+    return ORJSON
+
+
+def set_orjson(enabled):
+    '''Use orjson for payloads if enabled and it is installed'''
+    global ORJSON
+    with ORJSON_LOCK:
+        ORJSON = None if enabled else False
+
+
+def default(obj):
+    '''orjson default, tuples are arrays like in json'''
+    if isinstance(obj, tuple):
+        return list(obj)
+    raise TypeError
+
+
+def dumps(obj):
+    """
+    Return obj as json bytes.
+
+    Values orjson can not dump, such as integers over 64 bits, are dumped
+    with json.
+
+    Parameters:
+        obj:
+            json serializable object
+
+    Returns:
+        bytes
+
+    Example:
+        -
+    ```
+        from transferchain import serializer
+        data = serializer.dumps({'UUID': 'a', 'Size': 10})
+    ```
+    """
+    orjson = get_orjson()
+    if orjson:
+        try:
+            return orjson.dumps(
+                obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(obj).encode('utf-8')
+
+
+def canonical(value):
+    """
+    Return json.dumps(value).replace(' ', '') of a value.
+
+    A string is escaped in one pass without its spaces; escaping never
+    adds or removes a space, so the result is the same.
+
+    Parameters:
+        value:
+            json serializable object
+
+    Returns:
+        str
+    """
+    if type(value) is str:
+        return encode_basestring_ascii(value.replace(' ', ''))
+    return json.dumps(value).replace(' ', '')
@@ -1,28 +1,49 @@
 import os
 import uuid
 import queue
-import tempfile
 import threading
 import datetime
-import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import grpc
 from transferchain import constants
 from transferchain import blockchain
-from transferchain.utils import datetime_to_str
+from transferchain import download
+from transferchain.utils import (
+    LazyModule, datetime_to_str, slot_dicts)
 from transferchain.crypt import crypt
 from transferchain.grpc_client import get_client
-from transferchain.protobuf import service_pb2 as pb
 from transferchain.transaction import create_transaction
+from transferchain.upload import SlotUploadMixin
 from transferchain.datastructures import (
     Result, DataStorage, StorageResult, DataStorageDelete)
 
+grpc = LazyModule('grpc')
+pb = LazyModule('transferchain.protobuf.service_pb2')
 
-class Storage(object):
+
+class Storage(SlotUploadMixin):
     '''Storage processes are managed by the functions in this class.'''
 
-    def __init__(self, config):
+    def __init__(self, config, stream_upload=True, executor=None,
+                 slot_workers=constants.UPLOAD_SLOT_WORKERS,
+                 ranged_download=False,
+                 download_workers=constants.DOWNLOAD_WORKERS,
+                 crypt_workers=constants.CRYPT_WORKERS,
+                 chunk_size=None):
         self.config = config
+        self.stream_upload = stream_upload
+        # number of slots of a single file uploaded at the same time
+        self.slot_workers = slot_workers
+        # shared concurrent.futures executor, files are uploaded on it
+        self.executor = executor
+        # download with ranged DownloadV4 requests, see download module
+        self.ranged_download = ranged_download
+        # number of byte ranges of a file downloaded at the same time
+        self.download_workers = download_workers
+        # number of threads encrypting or decrypting a temporary file
+        self.crypt_workers = crypt_workers
+        # fixed upload chunk size, adaptive if it is None
+        self.chunk_size = chunk_size
 
     def download(self, file_uid, slots, file_size, file_name,
                  key_aes, key_hmac, destination):
@@ -97,6 +118,13 @@ class Storage(object):
         assert destination_path.is_dir(), 'destination must be a folder'
         destination_file = destination_path.joinpath(file_name)
 
+        if self.ranged_download:
+            return download.download_file(
+                self.config, pb.UploadOpCode.Storage, slots, file_size,
+                key_aes, key_hmac, destination_file,
+                workers=self.download_workers,
+                crypt_workers=self.crypt_workers)
+
         grpc_client = get_client()
         meta_data = [
             ("user-id", str(self.config.user_id)),
@@ -111,27 +139,21 @@ class Storage(object):
                 UserID=self.config.user_id,
                 opCode=pb.UploadOpCode.Storage,
             ), metadata=meta_data)
+            with destination_file.open(mode='wb') as out_file:
+                writer = crypt.DecryptWriter(
+                    out_file, key_aes.encode('utf-8'),
+                    key_hmac.encode('utf-8'))
+                for fc in file_chunks:
+                    writer.write(fc.chunk)
+                writer.finalize()
         except grpc.RpcError as e:
+            destination_file.unlink(missing_ok=True)
             error_message = 'download error:{}'.format(e.details())
             e.cancel()
             return Result(success=False, error_message=error_message)
-
-        in_file_uid = str(uuid.uuid4())
-        in_file_tmp_folder = tempfile.mkdtemp()
-        in_file_path = os.path.join(in_file_tmp_folder, in_file_uid)
-        totalWrite = 0
-        with open(in_file_path, 'ab') as in_file:
-            for fc in file_chunks:
-                totalWrite + in_file.write(fc.chunk)
-
-        with open(in_file_path, 'rb') as in_file:
-            with destination_file.open(mode='wb') as out_file:
-                try:
-                    crypt.decrypt_aesctr_with_hmac(
-                        in_file, out_file, key_aes.encode('utf-8'),
-                        key_hmac.encode('utf-8'))
-                except Exception as e:
-                    return Result(sucess=False, error_message=str(e))
+        except Exception as e:
+            destination_file.unlink(missing_ok=True)
+            return Result(success=False, error_message=str(e))
         return Result(success=True)
 
     def delete(self, user, storage_result_object):
@@ -284,13 +306,7 @@ class Storage(object):
         aes_key = crypt.generate_encrypt_key(32).encode('utf-8')
         hmac_key = crypt.generate_encrypt_key(32).encode('utf-8')
 
-        tmp_folder = tempfile.mkdtemp()
-        out_file_uuid = str(uuid.uuid4())
-        out_file = Path(os.path.join(tmp_folder, out_file_uuid))
-        with out_file.open(mode='wb') as outfile:
-            with file_object.open(mode='rb') as infile:
-                crypt.encrypt_aesctr_with_hmac(
-                    infile, outfile, aes_key, hmac_key)
+        out_file_size = crypt.encrypted_size(file_object.stat().st_size)
 
         file_path = str(file_object)
         file_uuid = base_uuid_map[file_path]
@@ -309,113 +325,46 @@ class Storage(object):
         grpc_client = get_client()
         try:
             upload_init_result = grpc_client.UploadInitV2(
-                pb.UploadInitRequest(
-                    fileName=file_path,
-                    fileSize=file_object.stat().st_size,
-                    opCode=pb.UploadOpCode.Storage,
-                    userID=self.config.user_id,
-                    walletID=self.config.wallet_id,
-                    DeleteAfter=0,
-                    senderAddress=sender['Address'],
-                ), metadata=meta_data)
+                self.upload_init_request(file_object, sender),
+                metadata=meta_data)
         except grpc.RpcError as e:
-            error_message = "Grpc Error:  {}".format(e.details)
-            return Result(success=False, error_message=error_message)
-
-        out_file_desc = out_file.open(mode='rb')
-        tweezers = {"total_write": 0}
-        error_result = None
-        for slot_index, slot in enumerate(upload_init_result.Slots):
-            is_last_slot = slot_index == len(upload_init_result.Slots) - 1
-            payloads = self.prepare_slot_upload_request(
-                session_id=session_id,
-                out_file=out_file_desc,
-                slot=slot,
-                is_last_slot=is_last_slot,
-                file_stat=out_file.stat(),
-                tweezers=tweezers
-            )
-            error = ""
-            try:
-                upload_basic_result = grpc_client.UploadBasicV4(
-                    payloads, metadata=meta_data)
-                status_code = upload_basic_result.statusCode
-                if status_code != 1:
-                    error = f"upload result is not ok. result code:{status_code}" # noqa
-            except grpc.RpcError as e:
-                error = e.details()
-                e.cancel()
-            except Exception as e:
-                error = str(e)
-
-            if error:
-                error_result = Result(success=False, error_message=error,
-                                      data=file_path)
-                break
+            error_message = "Grpc Error:  {}".format(e.details())
+            error_result = Result(success=False, error_message=error_message,
+                                  data=file_path)
+            if callback:
+                callback(error_result)
+            result_queue.put(error_result)
+            return error_result
 
-        out_file_info = os.stat(str(out_file))
-        out_file_desc.close()
-        shutil.rmtree(tmp_folder)
+        error = self.upload_file_slots(
+            session_id, file_path, upload_init_result.Slots, out_file_size,
+            meta_data, aes_key, hmac_key)
 
-        if error_result:
+        if error:
+            error_result = Result(success=False, error_message=error,
+                                  data=file_path)
             self.cancel_upload(
-                upload_init_result.Slots, pb.UploadOpCode.Storage)
+                slot_dicts(upload_init_result.Slots),
+                pb.UploadOpCode.Storage)
             if callback:
                 callback(error_result)
             result_queue.put(error_result)
             return error_result
 
-        upload_date = datetime.datetime.now()
-        file_name = os.path.basename(file_path)
-        slots = []
-
-        for slot in upload_init_result.Slots:
-            slots.append({
-                'BaseUUID': slot.BaseUUID,
-                'UUID': slot.UUID,
-                'StorageService': slot.StorageService,
-                'Address': slot.Address,
-                'Size': slot.Size,
-                'SizeRL': slot.SizeRL,
-                'StorageCode': slot.StorageCode,
-                'userID': slot.userID})
-
-        tx_data = DataStorage(
-            UUID=upload_init_result.BaseUUID,
-            FileName=file_name,
-            Size=out_file_info.st_size,
-            Slots=slots,
-            KeyAES=aes_key.decode("utf-8"),
-            KeyHMAC=hmac_key.decode("utf-8"),
-            StorageCode=pb.UploadOpCode.Storage,
-            Address=upload_init_result.Address,
-            UploadDate=datetime_to_str(upload_date))
-        tx = create_transaction(
-            constants.TX_TYPE_STORAGE, sender,
-            sender_recipient['Address'], tx_data)
+        tx, storage = self.uploaded_storage(
+            upload_init_result, sender, sender_recipient, file_path,
+            out_file_size, aes_key, hmac_key)
         broadcast_result = blockchain.broadcast(tx)
         if broadcast_result.success is False:
             error_result = Result(success=False, error_message='The storage is not published on the blockchain.') # noqa
             self.cancel_upload(
-                upload_init_result.Slots, pb.UploadOpCode.Storage)
+                slot_dicts(upload_init_result.Slots),
+                pb.UploadOpCode.Storage)
             if callback:
                 callback(error_result)
             result_queue.put(error_result)
             return error_result
 
-        storage = StorageResult(
-            txId=tx['tx_id'],
-            filename=file_name,
-            slots=slots,
-            keyAES=aes_key.decode("utf-8"),
-            keyHMAC=hmac_key.decode("utf-8"),
-            uuid=upload_init_result.BaseUUID,
-            senderAddress=sender['Address'],
-            recipientAddress=sender['Address'],
-            size=out_file_info.st_size,
-            uploadDate=datetime_to_str(upload_date),
-            storage_code=upload_init_result.StorageCode,
-            address=upload_init_result.Address)
         result = Result(success=True, data=storage)
         if callback:
             callback(result)
@@ -480,7 +429,6 @@ class Storage(object):
 
         result_queue = queue.Queue()
         process_uuid = str(uuid.uuid4())
-        threads = []
 
         meta_data = [
             ("user-id", str(self.config.user_id)),
@@ -490,40 +438,46 @@ class Storage(object):
         grpc_client = get_client()
         try:
             init_result = grpc_client.StorageInitV2(
-                pb.StorageInitRequest(
-                    TotalSize=total_file_size,
-                    Paths=files,
-                    OpCode=pb.UploadOpCode.Storage,
-                    UserID=self.config.user_id,
-                    WalletID=self.config.wallet_id,
-                    notes="",
-                    UID="",
-                ), metadata=meta_data)
+                self.storage_init_request(files, total_file_size),
+                metadata=meta_data)
         except grpc.RpcError as e:
             error_message = "storage init request error: {}".format(
                 e.details())
             return Result(success=False, error_message=error_message)
 
-        for file_object in file_objects:
-            t = threading.Thread(
-                target=self.upload_single_file, args=(
-                    init_result.SessionID,
-                    init_result.BaseUUIDs,
-                    process_uuid,
-                    user,
-                    file_object,
-                    result_queue,
-                    callback))
-            threads.append(t)
-
-        for t in threads:
-            t.start()
+        executor = self.executor
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=constants.UPLOAD_MAX_WORKERS)
 
-        for t in threads:
-            t.join()
+        futures = []
+        for file_object in file_objects:
+            future = executor.submit(
+                self.upload_single_file,
+                init_result.SessionID,
+                init_result.BaseUUIDs,
+                process_uuid,
+                user,
+                file_object,
+                result_queue,
+                callback)
+            futures.append((file_object, future))
+
+        for file_object, future in futures:
+            error = future.exception()
+            if error is not None:
+                error_result = Result(
+                    success=False, error_message=str(error),
+                    data=str(file_object))
+                if callback:
+                    callback(error_result)
+                result_queue.put(error_result)
+
+        if executor is not self.executor:
+            executor.shutdown()
 
         results = []
-        for result in range(len(threads)):
+        for result in range(len(futures)):
             results.append(result_queue.get())
 
         try:
@@ -535,74 +489,74 @@ class Storage(object):
         except grpc.RpcError as e:
             # cancel uploads
             for result in results:
-                slots = result.data['slots']
-                self.cancel_upload(slots, pb.UploadOpCode.Storage)
+                if result.success:
+                    self.cancel_upload(
+                        result.data.slots, pb.UploadOpCode.Storage)
             error_message = "storage finish request error: {}".format(
                 e.details())
             return Result(success=False, error_message=error_message)
         return Result(success=True, data=results)
 
-    def prepare_slot_upload_request(
-            self, session_id, out_file, slot,
-            is_last_slot, file_stat, tweezers):
+    def storage_init_request(self, files, total_file_size):
+        '''Return the StorageInitRequest of the files'''
+        return pb.StorageInitRequest(
+            TotalSize=total_file_size,
+            Paths=files,
+            OpCode=pb.UploadOpCode.Storage,
+            UserID=self.config.user_id,
+            WalletID=self.config.wallet_id,
+            notes="",
+            UID="")
+
+    def upload_init_request(self, file_object, sender):
+        '''Return the UploadInitRequest of a single file'''
+        return pb.UploadInitRequest(
+            fileName=str(file_object),
+            fileSize=file_object.stat().st_size,
+            opCode=pb.UploadOpCode.Storage,
+            userID=self.config.user_id,
+            walletID=self.config.wallet_id,
+            DeleteAfter=0,
+            senderAddress=sender['Address'])
+
+    def uploaded_storage(self, upload_init_result, sender, sender_recipient,
+                         file_path, out_file_size, aes_key, hmac_key):
         '''
-        Generate UploadV3Request payloads
-
-        Parameters:
-
-           session_id:
-               pb.TransferInitResponse.SessionID
-
-           out_file:
-               opened file object
-
-           slot:
-               pb.UploadSlot
-
-           is_last_slot:
-               bool
-
-           file_stat:
-               target file stat. os.stat
-
-           tweezers:
-               dict. total_write key is required
+        Return the storage transaction and the datastructures.StorageResult
+        of an uploaded file
+        '''
+        upload_date = datetime.datetime.now()
+        file_name = os.path.basename(file_path)
+        slots = slot_dicts(upload_init_result.Slots)
 
-        Returns:
-           Generator
+        tx_data = DataStorage(
+            UUID=upload_init_result.BaseUUID,
+            FileName=file_name,
+            Size=out_file_size,
+            Slots=slots,
+            KeyAES=aes_key.decode("utf-8"),
+            KeyHMAC=hmac_key.decode("utf-8"),
+            StorageCode=pb.UploadOpCode.Storage,
+            Address=upload_init_result.Address,
+            UploadDate=datetime_to_str(upload_date))
+        tx = create_transaction(
+            constants.TX_TYPE_STORAGE, sender,
+            sender_recipient['Address'], tx_data)
 
-        Example:
-            -
-        '''
-        chunk_size = constants.UPLOAD_CHUNK_SIZE
-
-        slot_upload_size = 0
-        total_read = 0
-        buff_size = chunk_size
-        while True:
-            if total_read + chunk_size > slot.Size:
-                if is_last_slot:
-                    buff_size = file_stat.st_size - tweezers['total_write']
-                else:
-                    buff_size = slot.Size - total_read
-
-            data = out_file.read(buff_size)
-            if not data:
-                break
-
-            total_read += buff_size
-            tweezers['total_write'] += buff_size
-            slot_upload_size += buff_size
-            payload = pb.UploadV3Request(
-                Chunk=data,
-                Slot=slot,
-                LastSlot=is_last_slot,
-            )
-
-            yield payload
-            if total_read >= slot.Size:
-                total_read = 0
-                break
+        storage = StorageResult(
+            txId=tx['tx_id'],
+            filename=file_name,
+            slots=slots,
+            keyAES=aes_key.decode("utf-8"),
+            keyHMAC=hmac_key.decode("utf-8"),
+            uuid=upload_init_result.BaseUUID,
+            senderAddress=sender['Address'],
+            recipientAddress=sender['Address'],
+            size=out_file_size,
+            uploadDate=datetime_to_str(upload_date),
+            storage_code=upload_init_result.StorageCode,
+            address=upload_init_result.Address)
+        return tx, storage
 
     def cancel_upload(self, slots, op_code):
         '''
@@ -610,7 +564,7 @@ class Storage(object):
 
         Parameters:
            slots:
-               list of pb.UploadSlot
+               list of slot dicts, see utils.slot_dicts
 
            op_code:
                pb.UploadOpCode.<Transfer|Storage>
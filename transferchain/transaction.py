@@ -1,10 +1,39 @@
-import json
 import base64
 import hashlib
+import threading
 from collections import OrderedDict
+from transferchain import serializer
 from transferchain.crypt import crypt
 
 
+# number of senders whose TransactionBuilder is kept by create_transaction,
+# 0 disables the cache. A builder holds the private keys of its sender, so
+# the cache is opt-in, see set_builder_cache_size.
+BUILDER_CACHE_SIZE = 0
+BUILDER_CACHE = OrderedDict()
+BUILDER_CACHE_LOCK = threading.Lock()
+
+# number of recipients whose nacl Box is kept by a TransactionBuilder
+BOX_CACHE_SIZE = 1024
+
+
+def signing_data(transaction):
+    '''
+    Return the bytes of a transaction that are signed, the json of
+    {"id": "", "version": 2, "type", "sender_addr", "recipient_addr",
+    "data", "sign": null, "fee": 0} without spaces.
+    '''
+    return (
+        '{"id":"","version":2,"type":' +
+        serializer.canonical(transaction['tx_type']) +
+        ',"sender_addr":' +
+        serializer.canonical(transaction['sender_address']) +
+        ',"recipient_addr":' +
+        serializer.canonical(transaction['recipient_address']) +
+        ',"data":' + serializer.canonical(transaction['data']) +
+        ',"sign":null,"fee":0}').encode('utf-8')
+
+
 def sign_transaction(sign_key, transaction):
     """
     Sign transaction.
@@ -23,24 +52,127 @@ def sign_transaction(sign_key, transaction):
         -
 
     """
-    tx = OrderedDict({
-        "id": "",
-        "version": 2,
-        "type": transaction['tx_type'],
-        "sender_addr": transaction['sender_address'],
-        "recipient_addr": transaction['recipient_address'],
-        "data": transaction['data'],
-        "sign": None,
-        "fee": 0
-    })
-    data = json.dumps(tx).replace(' ', '').encode('utf-8')
-    sign = crypt.sign(sign_key, data)
-    return sign
+    return crypt.sign(sign_key, signing_data(transaction))
+
+
+class TransactionBuilder(object):
+    '''
+    Creates the transactions of one sender. The signing key is built once
+    and the nacl Box, with the decoded address and the shared key, of the
+    last `box_cache_size` recipients is kept, so repeated transactions
+    skip the key setup. The transactions are the same as the ones of
+    create_transaction.
+    '''
+
+    def __init__(self, sender_keys, box_cache_size=BOX_CACHE_SIZE):
+        self.sender_keys = sender_keys
+        self.sender_address = sender_keys['Address']
+        self.box_cache_size = box_cache_size
+        self.boxes = OrderedDict()
+        self.lock = threading.Lock()
+        self.signer = crypt.create_signer(sender_keys['PrivateKeySign'])
+
+    def box(self, recipient_address):
+        '''Return the nacl Box of the recipient'''
+        with self.lock:
+            box = self.boxes.get(recipient_address)
+            if box is not None:
+                self.boxes.move_to_end(recipient_address)
+                return box
+        box = crypt.create_box(self.sender_keys['Seed'], recipient_address)
+        with self.lock:
+            self.boxes[recipient_address] = box
+            while len(self.boxes) > max(self.box_cache_size, 0):
+                self.boxes.popitem(last=False)
+        return box
+
+    def sign(self, transaction):
+        '''Return the signature of a transaction dict'''
+        return self.signer(signing_data(transaction))
+
+    def create(self, tx_type, recipient_address, payload):
+        '''Return the transaction dict, see create_transaction'''
+        data = crypt.encrypt_with_box(
+            self.box(recipient_address), payload.dump())
+
+        tx_id = hashlib.sha512(data).hexdigest()
+
+        transaction = {
+            "fee": 0,
+            "tx_id": tx_id,
+            "version": 2,
+            "data": base64.b64encode(data).decode(),
+            "sign": None,
+            "tx_type": tx_type,
+            "sender_address": self.sender_address,
+            "recipient_address": recipient_address
+        }
+        transaction["sign"] = base64.b64encode(
+            self.sign(transaction)).decode()
+        return transaction
+
+
+def get_builder(sender_keys):
+    '''
+    Return the TransactionBuilder of the sender, the last
+    BUILDER_CACHE_SIZE of them are kept by the hash of their address.
+    '''
+    if BUILDER_CACHE_SIZE <= 0:
+        return TransactionBuilder(sender_keys)
+    cache_id = hashlib.sha256(
+        sender_keys['Address'].encode('utf-8')).digest()
+    with BUILDER_CACHE_LOCK:
+        builder = BUILDER_CACHE.get(cache_id)
+        if builder is not None:
+            BUILDER_CACHE.move_to_end(cache_id)
+            return builder
+    builder = TransactionBuilder(sender_keys)
+    with BUILDER_CACHE_LOCK:
+        builder = BUILDER_CACHE.setdefault(cache_id, builder)
+        while len(BUILDER_CACHE) > max(BUILDER_CACHE_SIZE, 0):
+            BUILDER_CACHE.popitem(last=False)
+    return builder
+
+
+def set_builder_cache_size(size):
+    """
+    Set how many TransactionBuilders create_transaction keeps.
+    The least recently used builders above the size are evicted,
+    0 disables the cache. It is disabled by default: a builder holds
+    the private signing and encryption keys of its sender, call
+    clear_builder_cache when the session that needed them ends.
+
+    Parameters:
+        size (int):
+            maximum number of cached builders
+
+    Example:
+        -
+    ```
+        from transferchain import transaction
+        transaction.set_builder_cache_size(64)
+        # create transactions...
+        transaction.clear_builder_cache()
+    ```
+    """
+    global BUILDER_CACHE_SIZE
+    with BUILDER_CACHE_LOCK:
+        BUILDER_CACHE_SIZE = size
+        while len(BUILDER_CACHE) > max(size, 0):
+            BUILDER_CACHE.popitem(last=False)
+
+
+def clear_builder_cache():
+    '''Evict every TransactionBuilder kept by create_transaction'''
+    with BUILDER_CACHE_LOCK:
+        BUILDER_CACHE.clear()
 
 
 def create_transaction(tx_type, sender_keys, recipient_address, payload):
     """
     Create blockchain transaction.
+    The TransactionBuilder of the sender is reused if the builder cache
+    is enabled, see set_builder_cache_size.
 
     Parameters:
         ty_type (str):
@@ -82,23 +214,5 @@ def create_transaction(tx_type, sender_keys, recipient_address, payload):
             tx_master_address)
     ```
     """
-    sender_address = sender_keys['Address']
-    data = crypt.encrypt_asymmetric(
-        sender_keys['Seed'], recipient_address,
-        payload.dump())
-
-    tx_id = hashlib.sha512(data).hexdigest()
-
-    transaction = {
-        "fee": 0,
-        "tx_id": tx_id,
-        "version": 2,
-        "data": base64.b64encode(data).decode(),
-        "sign": None,
-        "tx_type": tx_type,
-        "sender_address": sender_address,
-        "recipient_address": recipient_address
-    }
-    tx_sign = sign_transaction(sender_keys['PrivateKeySign'], transaction)
-    transaction["sign"] = base64.b64encode(tx_sign).decode()
-    return transaction
+    return get_builder(sender_keys).create(
+        tx_type, recipient_address, payload)
@@ -1,29 +1,53 @@
 import os
 import uuid
-import shutil
-import tempfile
 import queue
 import threading
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import grpc
 from transferchain import constants
 from transferchain import blockchain
-from transferchain.utils import datetime_to_str
+from transferchain import download
+from transferchain.utils import (
+    LazyModule, datetime_to_str, slot_dicts)
 from transferchain.crypt import crypt
 from transferchain.datastructures import (
     Result, DataTransfer, TransferSent, TransferDelete,
     TransferReceiveDelete)
 from transferchain.grpc_client import get_client
-from transferchain.protobuf import service_pb2 as pb
 from transferchain.transaction import create_transaction
+from transferchain.upload import SlotUploadMixin
 
+grpc = LazyModule('grpc')
+pb = LazyModule('transferchain.protobuf.service_pb2')
 
-class Transfer(object):
+
+class Transfer(SlotUploadMixin):
     '''Transfer processes are managed by the functions in this class.'''
 
-    def __init__(self, config):
+    def __init__(self, config, stream_upload=True, executor=None,
+                 slot_workers=constants.UPLOAD_SLOT_WORKERS,
+                 ranged_download=False,
+                 download_workers=constants.DOWNLOAD_WORKERS,
+                 crypt_workers=constants.CRYPT_WORKERS,
+                 chunk_size=None,
+                 broadcast_workers=constants.BROADCAST_WORKERS):
         self.config = config
+        self.stream_upload = stream_upload
+        # number of slots of a single file uploaded at the same time
+        self.slot_workers = slot_workers
+        # shared concurrent.futures executor, files are uploaded on it
+        self.executor = executor
+        # download with ranged DownloadV4 requests, see download module
+        self.ranged_download = ranged_download
+        # number of byte ranges of a file downloaded at the same time
+        self.download_workers = download_workers
+        # number of threads encrypting or decrypting a temporary file
+        self.crypt_workers = crypt_workers
+        # fixed upload chunk size, adaptive if it is None
+        self.chunk_size = chunk_size
+        # number of recipient transactions broadcast at the same time
+        self.broadcast_workers = broadcast_workers
 
     def download_sent(self, file_uid, slots, file_size, file_name,
                       key_aes, key_hmac, destination):
@@ -102,6 +126,13 @@ class Transfer(object):
         assert destination_path.is_dir(), 'destination must be a folder'
         destination_file = destination_path.joinpath(file_name)
 
+        if self.ranged_download:
+            return download.download_file(
+                self.config, pb.UploadOpCode.Transfer, slots, file_size,
+                key_aes, key_hmac, destination_file,
+                workers=self.download_workers,
+                crypt_workers=self.crypt_workers)
+
         grpc_client = get_client()
         meta_data = [
             ("user-id", str(self.config.user_id)),
@@ -116,27 +147,21 @@ class Transfer(object):
                 UserID=self.config.user_id,
                 opCode=pb.UploadOpCode.Transfer,
             ), metadata=meta_data)
+            with destination_file.open(mode='wb') as out_file:
+                writer = crypt.DecryptWriter(
+                    out_file, key_aes.encode('utf-8'),
+                    key_hmac.encode('utf-8'))
+                for fc in file_chunks:
+                    writer.write(fc.chunk)
+                writer.finalize()
         except grpc.RpcError as e:
+            destination_file.unlink(missing_ok=True)
             error_message = 'download error:{}'.format(e.details())
             e.cancel()
             return Result(success=False, error_message=error_message)
-
-        in_file_uid = str(uuid.uuid4())
-        in_file_tmp_folder = tempfile.mkdtemp()
-        in_file_path = os.path.join(in_file_tmp_folder, in_file_uid)
-        totalWrite = 0
-        with open(in_file_path, 'ab') as in_file:
-            for fc in file_chunks:
-                totalWrite + in_file.write(fc.chunk)
-
-        with open(in_file_path, 'rb') as in_file:
-            with destination_file.open(mode='wb') as out_file:
-                try:
-                    crypt.decrypt_aesctr_with_hmac(
-                        in_file, out_file, key_aes.encode('utf-8'),
-                        key_hmac.encode('utf-8'))
-                except Exception as e:
-                    return Result(sucess=False, error_message=str(e))
+        except Exception as e:
+            destination_file.unlink(missing_ok=True)
+            return Result(success=False, error_message=str(e))
         return Result(success=True)
 
     def delete_received_transfer(self, user, uuid, tx_id=""):
@@ -396,13 +421,6 @@ class Transfer(object):
         if callback is not None:
             assert callable(callback), 'callback is not a function'
 
-        base_file_names = []
-        total_file_size = 0
-        for file_path in files:
-            file_info = os.stat(file_path)
-            base_file_names.append(os.path.basename(file_path))
-            total_file_size += file_info.st_size
-
         grpc_client = get_client()
         meta_data = [
             ("user-id", str(self.config.user_id)),
@@ -412,18 +430,8 @@ class Transfer(object):
 
         try:
             init_result = grpc_client.TransferInitV2(
-                pb.TransferInitRequest(
-                    files=base_file_names,
-                    totalSize=total_file_size,
-                    opCode=pb.UploadOpCode.Transfer,
-                    userID=self.config.user_id,
-                    walletID=self.config.wallet_id,
-                    recipientCount=len(recipient_addresses),
-                    transferOpCode=pb.TransferOpCode.Normal,
-                    notes=note,
-                    paths=files,
-                    DeleteAfter=7 * 24
-                ), metadata=meta_data)
+                self.transfer_init_request(files, recipient_addresses, note),
+                metadata=meta_data)
         except grpc.RpcError as e:
             error_message = "transfer init request error: {}".format(
                 e.details())
@@ -431,32 +439,42 @@ class Transfer(object):
 
         transfer_process_uuid = str(uuid.uuid4())
 
-        threads = []
+        executor = self.executor
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=constants.UPLOAD_MAX_WORKERS)
+
+        futures = []
         result_queue = queue.Queue()
         for file_path in files:
-            t = threading.Thread(
-                target=self.upload_single_file, args=(
-                    pb.UploadOpCode.Transfer,
-                    init_result.SessionID,
-                    init_result.BaseUUIDs,
-                    transfer_process_uuid,
-                    sender,
-                    recipient_addresses,
-                    note,
-                    file_path,
-                    callback,
-                    result_queue
-                ))
-            threads.append(t)
-
-        for t in threads:
-            t.start()
+            future = executor.submit(
+                self.upload_single_file,
+                pb.UploadOpCode.Transfer,
+                init_result.SessionID,
+                init_result.BaseUUIDs,
+                transfer_process_uuid,
+                sender,
+                recipient_addresses,
+                note,
+                file_path,
+                callback,
+                result_queue)
+            futures.append((file_path, future))
+
+        for file_path, future in futures:
+            error = future.exception()
+            if error is not None:
+                error_result = Result(
+                    success=False, error_message=str(error), data=file_path)
+                if callback:
+                    callback(error_result)
+                result_queue.put(error_result)
 
-        for t in threads:
-            t.join()
+        if executor is not self.executor:
+            executor.shutdown()
 
         results = []
-        for result in range(len(threads)):
+        for result in range(len(futures)):
             results.append(result_queue.get())
 
         try:
@@ -466,10 +484,12 @@ class Transfer(object):
                     UserID=self.config.user_id,
                     WalletID=self.config.wallet_id), metadata=meta_data)
         except grpc.RpcError as e:
-            # cancel uploads
+            # cancel the uploads that reached the server, partly
+            # published ones included
             for result in results:
-                slots = result.data['slots']
-                self.cancel_upload(slots, pb.UploadOpCode.Transfer)
+                if isinstance(result.data, TransferSent):
+                    self.cancel_upload(
+                        result.data.slots, pb.UploadOpCode.Transfer)
             error_message = "transfer finish request error: {}".format(
                 e.details())
             return Result(success=False, error_message=error_message)
@@ -519,18 +539,10 @@ class Transfer(object):
         Example:
             -
         '''
-        tmp_folder = tempfile.mkdtemp()
         aes_key = crypt.generate_encrypt_key(32).encode('utf-8')
         hmac_key = crypt.generate_encrypt_key(32).encode('utf-8')
 
-        out_file_uuid = str(uuid.uuid4())
-        out_file_path = os.path.join(tmp_folder, out_file_uuid)
-        with open(out_file_path, 'ab') as outfile:
-            with open(file_path, 'rb') as infile:
-                crypt.encrypt_aesctr_with_hmac(
-                    infile, outfile, aes_key, hmac_key)
-
-        out_file_info = os.stat(out_file_path)
+        out_file_size = crypt.encrypted_size(os.stat(file_path).st_size)
 
         file_uuid = base_uuid_map[file_path]
         meta_data = [
@@ -544,214 +556,202 @@ class Transfer(object):
 
         grpc_client = get_client()
         upload_init_result = grpc_client.UploadInitV2(
-            pb.UploadInitRequest(
-                sessionID=session_id,
-                fileName=file_path,
-                fileSize=out_file_info.st_size,
-                opCode=pb.UploadOpCode.Transfer,
-                userID=self.config.user_id,
-                walletID=self.config.wallet_id,
-                DeleteAfter=7 * 24,
-                recipientCount=len(recipients),
-                transferOpCode=pb.TransferOpCode.Normal,
-                senderAddress=sender.Key['Address']
-            ), metadata=meta_data)
-
-        out_file = open(out_file_path, 'rb')
-        tweezers = {"total_write": 0}
-        error_result = None
-        for slot_index, slot in enumerate(upload_init_result.Slots):
-            is_last_slot = slot_index == len(upload_init_result.Slots) - 1
-            payloads = self.prepare_slot_upload_request(
-                session_id=session_id,
-                out_file=out_file,
-                slot=slot,
-                is_last_slot=is_last_slot,
-                file_stat=out_file_info,
-                tweezers=tweezers
-            )
-            error = ""
-            try:
-                upload_basic_result = grpc_client.UploadBasicV4(
-                    payloads, metadata=meta_data)
-                status_code = upload_basic_result.statusCode
-                if status_code != 1:
-                    error = f"upload result is not ok. result code:{status_code}" # noqa
-            except grpc.RpcError as e:
-                error = e.details()
-                e.cancel()
-            except Exception as e:
-                error = str(e)
-
-            if error:
-                error_result = Result(success=False, error_message=error,
-                                      data=file_path)
-                break
-
-        out_file.close()
-        shutil.rmtree(tmp_folder)
-
-        if error_result:
-            self.cancel_upload(upload_init_result.Slots, op_code)
+            self.upload_init_request(
+                session_id, file_path, out_file_size, sender, recipients),
+            metadata=meta_data)
+
+        error = self.upload_file_slots(
+            session_id, file_path, upload_init_result.Slots, out_file_size,
+            meta_data, aes_key, hmac_key)
+
+        if error:
+            error_result = Result(success=False, error_message=error,
+                                  data=file_path)
+            self.cancel_upload(
+                slot_dicts(upload_init_result.Slots), op_code)
             if callback:
                 callback(error_result)
             result_queue.put(error_result)
             return error_result
 
-        upload_date = datetime.datetime.now()
-        end_time = upload_date + datetime.timedelta(hours=7 * 24)
-        file_name = os.path.basename(file_path)
-        slots = []
-        for slot in upload_init_result.Slots:
-            slots.append({
-                'BaseUUID': slot.BaseUUID,
-                'UUID': slot.UUID,
-                'StorageService': slot.StorageService,
-                'Address': slot.Address,
-                'Size': slot.Size,
-                'SizeRL': slot.SizeRL,
-                'StorageCode': slot.StorageCode,
-                'userID': slot.userID})
+        transfer_sent = self.uploaded_transfer(
+            upload_init_result, sender, recipients, file_path,
+            out_file_size, aes_key, hmac_key)
+        slots = transfer_sent.slots
 
-        for recipient in recipients:
-            tx_data = DataTransfer(
-                SenderMasterAddress=sender.MasterAddress,
-                ReceivedAddress=recipient,
-                UUID=upload_init_result.BaseUUID,
-                FileName=file_name,
-                Size=out_file_info.st_size,
-                Slots=slots,
-                KeyAES=aes_key.decode("utf-8"),
-                KeyHMAC=hmac_key.decode("utf-8"),
-                Message=note,
-                StorageCode=upload_init_result.StorageCode,
-                Address=upload_init_result.Address,
-                UploadDate=datetime_to_str(upload_date),
-                EndTime=datetime_to_str(end_time),
-                Typ=constants.TransferNormal)
-            tx = create_transaction(
-                constants.TX_TYPE_TRANSFER, sender.Key, recipient, tx_data)
-            broadcast_result = blockchain.broadcast(tx)
-            if broadcast_result.success is False:
-                error_result = Result(success=False, error_message='The transfer is not published on the blockchain.') # noqa
-                self.cancel_upload(upload_init_result.Slots, op_code)
-                if callback:
-                    callback(error_result)
-                result_queue.put(error_result)
-                return error_result
+        failed_addresses = self.broadcast_to_recipients(
+            sender, transfer_sent, recipients, note)
+        if len(failed_addresses) == len(recipients):
+            error_result = Result(success=False, error_message='The transfer is not published on the blockchain.') # noqa
+            self.cancel_upload(slots, op_code)
+            if callback:
+                callback(error_result)
+            result_queue.put(error_result)
+            return error_result
 
-        tx_data = DataTransfer(
-            UUID=upload_init_result.BaseUUID,
-            FileName=file_name,
-            Size=out_file_info.st_size,
-            Slots=slots,
-            KeyAES=aes_key.decode("utf-8"),
-            KeyHMAC=hmac_key.decode("utf-8"),
-            Message=note,
-            StorageCode=upload_init_result.StorageCode,
-            Address=upload_init_result.Address,
-            UploadDate=datetime_to_str(upload_date),
-            EndTime=datetime_to_str(end_time),
-            ReceivedAddress=recipients[0],
-            ReceivedAddresses=recipients,
-            Typ=constants.TransferSent)
-        tx = create_transaction(
-            constants.TX_TYPE_TRANSFER, sender.Key, sender.Key['Address'],
-            tx_data)
+        tx = self.sender_transaction(sender, transfer_sent, note)
         broadcast_result = blockchain.broadcast(tx)
         if broadcast_result.success is False:
-            self.cancel_upload(upload_init_result.Slots, op_code)
             error_result = Result(success=False, error_message='The transfer is not published on the blockchain.') # noqa
-            self.cancel_upload(upload_init_result.Slots, op_code)
+            self.cancel_upload(slots, op_code)
             if callback:
                 callback(error_result)
             result_queue.put(error_result)
             return error_result
 
-        transfer_sent = TransferSent(
-            filename=os.path.basename(file_path),
-            uuid=upload_init_result.BaseUUID,
-            txId="",
-            senderAddress=sender.Key['Address'],
-            senderMasterAddress=sender.MasterAddress,
-            ReceivedAddress=recipients[0],
-            receivedAddresses=recipients,
-            size=out_file_info.st_size,
-            uploadDate=datetime_to_str(upload_date),
-            endTime=datetime_to_str(end_time),
-            keyAES=aes_key.decode("utf-8"),
-            KeyHMAC=hmac_key.decode("utf-8"),
-            address=upload_init_result.Address,
-            storage_code=upload_init_result.StorageCode,
-            slots=slots)
-        result = Result(success=True, data=transfer_sent)
+        transfer_sent = transfer_sent._replace(
+            failedAddresses=failed_addresses)
+        if failed_addresses:
+            result = Result(
+                success=False,
+                error_message='The transfer is not published on the blockchain for {} recipients.'.format(len(failed_addresses)), # noqa
+                data=transfer_sent)
+        else:
+            result = Result(success=True, data=transfer_sent)
         if callback:
             callback(result)
         result_queue.put(result)
         return result
 
-    def prepare_slot_upload_request(
-            self, session_id, out_file, slot,
-            is_last_slot, file_stat, tweezers):
-
-        '''
-        Generate UploadV3Request payloads
+    def broadcast_to_recipients(self, sender, transfer_sent, recipients,
+                                note):
+        """
+        Publish the transfer transactions of recipients on the blockchain.
+        All transactions are created first and then broadcast at the same
+        time, self.broadcast_workers of them.
 
         Parameters:
+            sender (datastructures.Address):
+                sender address of the transfer
 
-           session_id:
-               pb.TransferInitResponse.SessionID
-
-           out_file:
-               opened file object
-
-           slot:
-               pb.UploadSlot
+            transfer_sent (datastructures.TransferSent):
+                uploaded transfer
 
-           is_last_slot:
-               bool
+            recipients (list):
+                recipient addresses
 
-           file_stat:
-               target file stat. os.stat
-
-           tweezers:
-               dict. total_write key is required
+            note (str):
+                transfer note
 
         Returns:
-           Generator
+            list of the recipient addresses that could not be published
 
         Example:
             -
-        '''
-        chunk_size = constants.UPLOAD_CHUNK_SIZE
-
-        slot_upload_size = 0
-        total_read = 0
-        buff_size = chunk_size
-        while True:
-            if total_read + chunk_size > slot.Size:
-                if is_last_slot:
-                    buff_size = file_stat.st_size - tweezers['total_write']
-                else:
-                    buff_size = slot.Size - total_read
-
-            data = out_file.read(buff_size)
-            if not data:
-                break
-
-            total_read += buff_size
-            tweezers['total_write'] += buff_size
-            slot_upload_size += buff_size
-            payload = pb.UploadV3Request(
-                Chunk=data,
-                Slot=slot,
-                LastSlot=is_last_slot,
-            )
-
-            yield payload
-            if total_read >= slot.Size:
-                total_read = 0
-                break
+        ```
+        # result -> failed Transfer.upload result of a file
+        transfer_sent_obj = result.data
+        failed_addresses = transfer.broadcast_to_recipients(
+            sender, transfer_sent_obj, transfer_sent_obj.failedAddresses,
+            note)
+        ```
+        """
+        transactions = self.recipient_transactions(
+            sender, transfer_sent, recipients, note)
+        broadcast_results = blockchain.broadcast_many(
+            transactions, workers=self.broadcast_workers)
+        return [recipient for recipient, broadcast_result
+                in zip(recipients, broadcast_results)
+                if broadcast_result.success is False]
+
+    def transfer_init_request(self, files, recipient_addresses, note):
+        '''Return the TransferInitRequest of the files'''
+        return pb.TransferInitRequest(
+            files=[os.path.basename(file_path) for file_path in files],
+            totalSize=sum(os.stat(file_path).st_size for file_path in files),
+            opCode=pb.UploadOpCode.Transfer,
+            userID=self.config.user_id,
+            walletID=self.config.wallet_id,
+            recipientCount=len(recipient_addresses),
+            transferOpCode=pb.TransferOpCode.Normal,
+            notes=note,
+            paths=files,
+            DeleteAfter=7 * 24)
+
+    def upload_init_request(self, session_id, file_path, out_file_size,
+                            sender, recipients):
+        '''Return the UploadInitRequest of a single file'''
+        return pb.UploadInitRequest(
+            sessionID=session_id,
+            fileName=file_path,
+            fileSize=out_file_size,
+            opCode=pb.UploadOpCode.Transfer,
+            userID=self.config.user_id,
+            walletID=self.config.wallet_id,
+            DeleteAfter=7 * 24,
+            recipientCount=len(recipients),
+            transferOpCode=pb.TransferOpCode.Normal,
+            senderAddress=sender.Key['Address'])
+
+    def uploaded_transfer(self, upload_init_result, sender, recipients,
+                          file_path, out_file_size, aes_key, hmac_key):
+        '''Return the datastructures.TransferSent of an uploaded file'''
+        upload_date = datetime.datetime.now()
+        end_time = upload_date + datetime.timedelta(hours=7 * 24)
+        slots = slot_dicts(upload_init_result.Slots)
+
+        return TransferSent(
+            filename=os.path.basename(file_path),
+            uuid=upload_init_result.BaseUUID,
+            txId="",
+            senderAddress=sender.Key['Address'],
+            senderMasterAddress=sender.MasterAddress,
+            ReceivedAddress=recipients[0],
+            receivedAddresses=recipients,
+            size=out_file_size,
+            uploadDate=datetime_to_str(upload_date),
+            endTime=datetime_to_str(end_time),
+            keyAES=aes_key.decode("utf-8"),
+            KeyHMAC=hmac_key.decode("utf-8"),
+            address=upload_init_result.Address,
+            storage_code=upload_init_result.StorageCode,
+            slots=slots,
+            failedAddresses=[])
+
+    def sender_transaction(self, sender, transfer_sent, note):
+        '''Return the transfer transaction kept by the sender'''
+        tx_data = DataTransfer(
+            UUID=transfer_sent.uuid,
+            FileName=transfer_sent.filename,
+            Size=transfer_sent.size,
+            Slots=transfer_sent.slots,
+            KeyAES=transfer_sent.keyAES,
+            KeyHMAC=transfer_sent.KeyHMAC,
+            Message=note,
+            StorageCode=transfer_sent.storage_code,
+            Address=transfer_sent.address,
+            UploadDate=transfer_sent.uploadDate,
+            EndTime=transfer_sent.endTime,
+            ReceivedAddress=transfer_sent.ReceivedAddress,
+            ReceivedAddresses=transfer_sent.receivedAddresses,
+            Typ=constants.TransferSent)
+        return create_transaction(
+            constants.TX_TYPE_TRANSFER, sender.Key, sender.Key['Address'],
+            tx_data)
+
+    def recipient_transactions(self, sender, transfer_sent, recipients,
+                               note):
+        '''Return the transfer transactions of the recipients'''
+        transactions = []
+        for recipient in recipients:
+            tx_data = DataTransfer(
+                SenderMasterAddress=sender.MasterAddress,
+                ReceivedAddress=recipient,
+                UUID=transfer_sent.uuid,
+                FileName=transfer_sent.filename,
+                Size=transfer_sent.size,
+                Slots=transfer_sent.slots,
+                KeyAES=transfer_sent.keyAES,
+                KeyHMAC=transfer_sent.KeyHMAC,
+                Message=note,
+                StorageCode=transfer_sent.storage_code,
+                Address=transfer_sent.address,
+                UploadDate=transfer_sent.uploadDate,
+                EndTime=transfer_sent.endTime,
+                Typ=constants.TransferNormal)
+            transactions.append(create_transaction(
+                constants.TX_TYPE_TRANSFER, sender.Key, recipient, tx_data))
+        return transactions
 
     def cancel_upload(self, slots, op_code):
         '''
@@ -759,7 +759,7 @@ class Transfer(object):
 
         Parameters:
            slots:
-               list of pb.UploadSlot
+               list of slot dicts, see utils.slot_dicts
 
            op_code:
                pb.UploadOpCode.<Transfer|Storage>
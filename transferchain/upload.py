@@ -0,0 +1,343 @@
+'''
+Slot uploads shared by transfer.Transfer and storage.Storage.
+
+A file is encrypted while its slots are sent with UploadBasicV4. The
+slots are uploaded one after another from one crypt.EncryptReader, or
+with slot_workers > 1 at the same time, each from a
+crypt.EncryptRangeReader starting at the offset of the slot. The digest
+closing the last slot is computed while the slots are uploaded. With
+stream_upload=False the ciphertext is written to a temp file first.
+'''
+
+import os
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from transferchain.chunking import ChunkSizer
+from transferchain.crypt import crypt
+from transferchain.grpc_client import get_client
+from transferchain.utils import LazyModule
+
+grpc = LazyModule('grpc')
+pb = LazyModule('transferchain.protobuf.service_pb2')
+
+
+def slot_offsets(slots):
+    '''Return the offset of every slot in the encrypted file'''
+    offsets = []
+    offset = 0
+    for slot in slots:
+        offsets.append(offset)
+        offset += slot.Size
+    return offsets
+
+
+class SlotUploadMixin(object):
+    '''
+    Upload methods of a service. It reads the stream_upload,
+    slot_workers, crypt_workers and chunk_size attributes.
+    '''
+
+    def upload_file_slots(self, session_id, file_path, slots, file_size,
+                          meta_data, aes_key, hmac_key):
+        '''
+        Encrypt a file and upload it to its slots. The file and the temp
+        ciphertext are released whatever happens.
+
+        Parameters:
+
+           session_id:
+               pb.TransferInitResponse.SessionID
+
+           file_path:
+               plaintext file path
+
+           slots:
+               list of pb.UploadSlot
+
+           file_size:
+               size of the encrypted file, crypt.encrypted_size
+
+           meta_data:
+               grpc metadata of the file
+
+           aes_key:
+               bytes
+
+           hmac_key:
+               bytes
+
+        Returns:
+           Error message, empty string if all slots are uploaded
+        '''
+        parallel = self.slot_workers > 1 and len(slots) > 1
+        tmp_folder = None
+        in_file = None
+        digest_executor = None
+        stop_digest = threading.Event()
+        try:
+            if not self.stream_upload:
+                tmp_folder = tempfile.mkdtemp()
+                out_file_path = os.path.join(tmp_folder, str(uuid.uuid4()))
+                with open(out_file_path, 'wb') as outfile:
+                    with open(file_path, 'rb') as infile:
+                        crypt.encrypt_aesctr_with_hmac(
+                            infile, outfile, aes_key, hmac_key,
+                            workers=self.crypt_workers)
+
+                def open_out_file(offset):
+                    out_file = open(out_file_path, 'rb')
+                    out_file.seek(offset)
+                    return out_file
+            elif parallel:
+                # every slot encrypts its own part of the file, the digest
+                # closing the last slot is computed alongside them and
+                # only the end of the last slot waits for it
+                iv = os.urandom(crypt.IV_SIZE)
+
+                def compute_digest():
+                    with open(file_path, 'rb') as infile:
+                        return crypt.hmac_aesctr(
+                            infile, aes_key, hmac_key, iv,
+                            workers=self.crypt_workers, stop=stop_digest)
+
+                digest_executor = ThreadPoolExecutor(max_workers=1)
+                digest = digest_executor.submit(compute_digest)
+
+                def open_out_file(offset):
+                    return crypt.EncryptRangeReader(
+                        open(file_path, 'rb'), aes_key, iv, digest.result,
+                        offset)
+
+            if parallel:
+                return self.upload_slots_parallel(
+                    session_id, open_out_file, slots, file_size, meta_data)
+
+            if self.stream_upload:
+                # the ciphertext is produced while the slots are uploaded
+                in_file = open(file_path, 'rb')
+                out_file = crypt.EncryptReader(in_file, aes_key, hmac_key)
+            else:
+                in_file = out_file = open_out_file(0)
+            return self.upload_slots(
+                session_id, out_file, slots, file_size, meta_data)
+        except Exception as e:
+            return str(e)
+        finally:
+            if digest_executor is not None:
+                # a failed upload does not wait for the whole file
+                stop_digest.set()
+                digest_executor.shutdown(wait=True)
+            if in_file is not None:
+                in_file.close()
+            if tmp_folder is not None:
+                shutil.rmtree(tmp_folder, ignore_errors=True)
+
+    def upload_slot(self, grpc_client, payloads, meta_data):
+        '''
+        Send the payloads of a slot with UploadBasicV4
+
+        Parameters:
+
+           grpc_client:
+               grpc_client.get_client()
+
+           payloads:
+               prepare_slot_upload_request generator
+
+           meta_data:
+               grpc metadata of the file
+
+        Returns:
+           Error message, empty string if the slot is uploaded
+        '''
+        error = ""
+        try:
+            upload_basic_result = grpc_client.UploadBasicV4(
+                payloads, metadata=meta_data)
+            status_code = upload_basic_result.statusCode
+            if status_code != 1:
+                error = f"upload result is not ok. result code:{status_code}" # noqa
+        except grpc.RpcError as e:
+            error = e.details()
+            e.cancel()
+        except Exception as e:
+            error = str(e)
+        return error
+
+    def upload_slots(self, session_id, out_file, slots, file_size,
+                     meta_data):
+        '''
+        Upload the slots of a file one after another from a single
+        file object.
+
+        Parameters:
+
+           session_id:
+               pb.TransferInitResponse.SessionID
+
+           out_file:
+               opened file object or crypt.EncryptReader
+
+           slots:
+               list of pb.UploadSlot
+
+           file_size:
+               size of the encrypted file
+
+           meta_data:
+               grpc metadata of the file
+
+        Returns:
+           Error message, empty string if all slots are uploaded
+        '''
+        grpc_client = get_client()
+        tweezers = {"total_write": 0}
+        for slot_index, slot in enumerate(slots):
+            is_last_slot = slot_index == len(slots) - 1
+            payloads = self.prepare_slot_upload_request(
+                session_id=session_id,
+                out_file=out_file,
+                slot=slot,
+                is_last_slot=is_last_slot,
+                file_size=file_size,
+                tweezers=tweezers
+            )
+            error = self.upload_slot(grpc_client, payloads, meta_data)
+            if error:
+                return error
+        return ""
+
+    def upload_slots_parallel(self, session_id, open_out_file, slots,
+                              file_size, meta_data):
+        '''
+        Upload the slots of a file at the same time, at most
+        slot_workers of them. Every slot reads the encrypted file with
+        its own file object, starting from the offset of the slot.
+
+        Parameters:
+
+           session_id:
+               pb.TransferInitResponse.SessionID
+
+           open_out_file:
+               function taking an offset and returning a new file object
+               of the encrypted file at that offset, e.g. a
+               crypt.EncryptRangeReader. It is closed after the slot.
+
+           slots:
+               list of pb.UploadSlot
+
+           file_size:
+               size of the encrypted file
+
+           meta_data:
+               grpc metadata of the file
+
+        Returns:
+           Error message, empty string if all slots are uploaded
+        '''
+        offsets = slot_offsets(slots)
+        with ThreadPoolExecutor(
+                max_workers=min(self.slot_workers, len(slots))) as executor:
+            futures = []
+            for slot_index, slot in enumerate(slots):
+                # with several grpc channels the slots are spread on them
+                futures.append(executor.submit(
+                    self._upload_slot_at, get_client(), session_id,
+                    open_out_file, slot, slot_index == len(slots) - 1,
+                    offsets[slot_index], file_size, meta_data))
+            errors = [future.result() for future in futures]
+
+        for error in errors:
+            if error:
+                return error
+        return ""
+
+    def _upload_slot_at(self, grpc_client, session_id, open_out_file, slot,
+                        is_last_slot, offset, file_size, meta_data):
+        '''Upload single slot from the given offset'''
+        try:
+            out_file = open_out_file(offset)
+        except Exception as e:
+            return str(e)
+        try:
+            payloads = self.prepare_slot_upload_request(
+                session_id=session_id,
+                out_file=out_file,
+                slot=slot,
+                is_last_slot=is_last_slot,
+                file_size=file_size,
+                tweezers={"total_write": offset})
+            return self.upload_slot(grpc_client, payloads, meta_data)
+        finally:
+            out_file.close()
+
+    def prepare_slot_upload_request(
+            self, session_id, out_file, slot,
+            is_last_slot, file_size, tweezers):
+
+        '''
+        Generate UploadV3Request payloads, chunk sizes are chosen by
+        chunking.ChunkSizer
+
+        Parameters:
+
+           session_id:
+               pb.TransferInitResponse.SessionID
+
+           out_file:
+               opened file object or crypt.EncryptReader
+
+           slot:
+               pb.UploadSlot
+
+           is_last_slot:
+               bool
+
+           file_size:
+               size of the encrypted file
+
+           tweezers:
+               dict. total_write key is required
+
+        Returns:
+           Generator
+
+        Example:
+            -
+        '''
+        sizer = ChunkSizer.for_slot(slot, self.chunk_size)
+
+        slot_upload_size = 0
+        total_read = 0
+        while True:
+            chunk_size = buff_size = sizer.size
+            if total_read + chunk_size > slot.Size:
+                if is_last_slot:
+                    buff_size = file_size - tweezers['total_write']
+                else:
+                    buff_size = slot.Size - total_read
+
+            data = out_file.read(buff_size)
+            if not data:
+                break
+
+            total_read += buff_size
+            tweezers['total_write'] += buff_size
+            slot_upload_size += buff_size
+            payload = pb.UploadV3Request(
+                Chunk=data,
+                Slot=slot,
+                LastSlot=is_last_slot,
+            )
+
+            started = time.monotonic()
+            yield payload
+            sizer.update(len(data), time.monotonic() - started)
+            if total_read >= slot.Size:
+                total_read = 0
+                break
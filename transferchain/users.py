@@ -0,0 +1,68 @@
+'''This module keeps the users of a TransferChain instance.'''
+
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from transferchain import constants
+
+
+class UserRegistry(MutableMapping):
+    '''
+    Dictionary of users by user id. Only the ids are kept for every user,
+    a user is loaded with `loader` when it is first used and the last
+    `max_size` used users stay in memory.
+    '''
+
+    def __init__(self, loader, max_size=constants.USER_CACHE_SIZE):
+        self.loader = loader
+        self.max_size = max_size
+        self.ids = set()
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add_ids(self, user_ids):
+        '''Register users that are loaded on first use'''
+        with self.lock:
+            self.ids.update(user_ids)
+
+    def _put(self, user_id, user):
+        self.cache[user_id] = user
+        self.cache.move_to_end(user_id)
+        while len(self.cache) > max(self.max_size, 1):
+            self.cache.popitem(last=False)
+
+    def __getitem__(self, user_id):
+        with self.lock:
+            if user_id in self.cache:
+                self.cache.move_to_end(user_id)
+                return self.cache[user_id]
+            if user_id not in self.ids:
+                raise KeyError(user_id)
+        user = self.loader(user_id)
+        with self.lock:
+            self._put(user_id, user)
+        return user
+
+    def __setitem__(self, user_id, user):
+        with self.lock:
+            self.ids.add(user_id)
+            self._put(user_id, user)
+
+    def __delitem__(self, user_id):
+        with self.lock:
+            if user_id not in self.ids:
+                raise KeyError(user_id)
+            self.ids.discard(user_id)
+            self.cache.pop(user_id, None)
+
+    def __contains__(self, user_id):
+        with self.lock:
+            return user_id in self.ids
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.ids))
+
+    def __len__(self):
+        with self.lock:
+            return len(self.ids)
@@ -1,7 +1,80 @@
+import os
+import json
 import uuid
+import importlib
+import threading
 from datetime import datetime
 
 
+class LazyModule(object):
+    '''
+    Module that is imported when one of its attributes is first used.
+    Heavy dependencies are kept out of `import transferchain` this way.
+
+    Example:
+        -
+    ```
+        from transferchain.utils import LazyModule
+        grpc = LazyModule('grpc')
+        grpc.RpcError  # grpc is imported here
+    ```
+    '''
+
+    def __init__(self, name):
+        self.__dict__['_lazy_name'] = name
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            # the import lock makes a concurrent first use safe
+            module = importlib.import_module(self.__dict__['_lazy_name'])
+            self.__dict__['_lazy_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __delattr__(self, attr):
+        delattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        return '<lazy module {!r}>'.format(self.__dict__['_lazy_name'])
+
+
+class JsonFile(object):
+    '''
+    A json object kept in a file. It is replaced atomically on write, so
+    a reader sees the old or the new object, never a partial one.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def load(self):
+        '''Return the object, empty if the file is missing or invalid'''
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def write(self, data):
+        '''Replace the file with data, call it holding self.lock'''
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+
 def datetime_formating(date_str, format='%Y-%m-%dT%H:%M:%S.%fZ'):
     """
     String datetime to datetime object
@@ -77,3 +150,33 @@ def is_valid_uuid(val):
         return True
     except ValueError:
         return False
+
+
+def slot_dicts(slots):
+    """
+    Return upload slots as the dicts kept in transactions and accepted
+    by cancel_upload.
+
+    Parameters:
+        slots (list):
+            pb.UploadSlot objects, e.g. pb.UploadInitResponse.Slots
+
+    Returns:
+        list of dict
+
+    Example:
+        -
+    ```
+        from transferchain import utils
+        slots = utils.slot_dicts(upload_init_result.Slots)
+    ```
+    """
+    return [{
+        'BaseUUID': slot.BaseUUID,
+        'UUID': slot.UUID,
+        'StorageService': slot.StorageService,
+        'Address': slot.Address,
+        'Size': slot.Size,
+        'SizeRL': slot.SizeRL,
+        'StorageCode': slot.StorageCode,
+        'userID': slot.userID} for slot in slots]
@@ -1,12 +1,64 @@
+import os
 import json
+import time
 from urllib.parse import urljoin
-import requests
 from transferchain import settings
-from transferchain.utils import datetime_formating
+from transferchain import constants
+from transferchain.utils import LazyModule, JsonFile, datetime_formating
 from transferchain.datastructures import (
     CreateWalletResult, WalletInfoResult, UserPackage,
     UserCompany, WalletUser)
 
+requests = LazyModule('requests')
+
+
+# wallet cache file, kept in the folder of the user db
+WALLET_CACHE_FILE = 'tc.wallet.json'
+
+
+class WalletCache(JsonFile):
+    '''
+    Wallet ids of a user by wallet uuid, kept in a json file. A wallet id
+    is used for `ttl` seconds after it is written, the wallet created for
+    a user without a wallet uuid is remembered until the file is removed.
+    '''
+
+    def __init__(self, path, ttl=constants.WALLET_CACHE_TTL):
+        super(WalletCache, self).__init__(path)
+        self.ttl = ttl
+
+    @classmethod
+    def from_db_path(cls, db_path, ttl=constants.WALLET_CACHE_TTL):
+        '''Return the wallet cache next to the user db'''
+        return cls(os.path.join(
+            os.path.dirname(os.path.abspath(db_path)), WALLET_CACHE_FILE),
+            ttl=ttl)
+
+    def created_wallet(self, user_id):
+        '''Return the uuid of the wallet created for the user or None'''
+        return self.load().get(str(user_id), {}).get('created')
+
+    def get(self, user_id, wallet_uuid):
+        '''Return the wallet id if it was cached in the last ttl seconds'''
+        wallets = self.load().get(str(user_id), {}).get('wallets', {})
+        item = wallets.get(wallet_uuid)
+        if not item or item.get('expires', 0) < time.time():
+            return None
+        return item.get('wallet_id')
+
+    def set(self, user_id, wallet_uuid, wallet_id, created=False):
+        '''Cache the wallet id of the wallet uuid'''
+        with self.lock:
+            data = self.load()
+            user = data.setdefault(str(user_id), {})
+            user.setdefault('wallets', {})[wallet_uuid] = {
+                'wallet_id': wallet_id,
+                'expires': time.time() + self.ttl
+            }
+            if created:
+                user['created'] = wallet_uuid
+            self.write(data)
+
 
 def create_wallet(conf, wallet_uuid):
     """
@@ -48,7 +100,8 @@ def create_wallet(conf, wallet_uuid):
     uri = settings.CREATE_WALLET_URI
     url = urljoin(settings.TCMP_BASE_URL, uri)
     payload = json.dumps({'uuid': wallet_uuid})
-    req = requests.post(url, data=payload, headers=headers)
+    req = requests.post(url, data=payload, headers=headers,
+                        timeout=constants.WALLET_REQUEST_TIMEOUT)
     try:
         response = req.json()
     except requests.exceptions.JSONDecodeError as e:
@@ -100,7 +153,8 @@ def get_wallet_info(conf, wallet_uuid):
         wallet_uuid=wallet_uuid)
     query = settings.WALLET_INFORMATION_QUERY
     url = urljoin(settings.TCMP_BASE_URL, (uri + query))
-    req = requests.get(url, headers=headers)
+    req = requests.get(url, headers=headers,
+                       timeout=constants.WALLET_REQUEST_TIMEOUT)
     try:
         response = req.json()
     except requests.exceptions.JSONDecodeError as e: